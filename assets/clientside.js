@@ -0,0 +1,86 @@
+/*
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (clientside.js)
+April 19, 2023
+
+clientside.js: Dashboard callbacks that run in the browser instead of on the server (Dash loads every file in assets/)
+*/
+/**
+ * Build a centered H2 title component
+ * @param {string} text - the title's text
+ * @returns {Object} the H2 component
+ */
+function centeredTitle(text) {
+    return {namespace: 'dash_html_components', type: 'H2', props: {children: text, style: {textAlign: 'center'}}};
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    sleep: {
+        /**
+         * Show the help block for the chosen dropdown value
+         * @returns {Array} the help block's components, or null if nothing is chosen
+         */
+        show_help: function (query, content) {
+            return (query && content[query]) || null;
+        },
+
+        /**
+         * Filter the violin plot and histogram down to the chosen genders (each gender is one trace)
+         * @returns {Array} the filtered violin plot and histogram
+         */
+        filter_genders: function (genders, figures) {
+            if (!figures) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+            const filter = function (fig) {
+                return Object.assign({}, fig, {data: fig.data.filter(trace => genders.includes(trace.name))});
+            };
+
+            return [filter(figures.violin), filter(figures.histogram)];
+        },
+
+        scatter_title: function (sleep_stat_ind, sleep_stat_dep) {
+            return centeredTitle('How ' + sleep_stat_ind + ' Affects ' + sleep_stat_dep);
+        },
+
+        gender_title: function (sleep_stat) {
+            return centeredTitle(sleep_stat + ' distribution across genders');
+        },
+
+        contour_title: function (sleep_stat1, sleep_stat2) {
+            // the contour plot changes the second variable if it's the same as the first (see show_efficiency_contour)
+            if (sleep_stat1 === sleep_stat2) {
+                sleep_stat2 = sleep_stat1 !== 'Awakenings' ?
+                    'Awakenings' : 'Caffeine consumption 24 hrs before sleeping (mg)';
+            }
+
+            return centeredTitle('How ' + sleep_stat1 + ' and ' + sleep_stat2 + ' Affect Sleep Efficiency');
+        },
+
+        importance_title: function (focus_col) {
+            return centeredTitle('Which variables are most important in determining your ' + focus_col + '?');
+        },
+
+        three_dim_title: function (sleep_stat_x, sleep_stat_y, sleep_stat_z) {
+            return centeredTitle('3D View of ' + sleep_stat_x + ' vs ' + sleep_stat_y + ' vs ' + sleep_stat_z);
+        },
+
+        /**
+         * Bundle the sleep quality predictor inputs into one numbered request
+         * @returns {Object} the browser's id, the request's sequence number and the predictor inputs
+         */
+        request_prediction: function (age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender,
+                                      smoke, previous) {
+            // the browser id and sequence number let the server skip requests that a newer one has replaced
+            const client = previous ? previous.client : Math.random().toString(36).slice(2);
+            const seq = previous ? previous.seq + 1 : 0;
+
+            return {
+                client: client,
+                seq: seq,
+                values: [age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke]
+            };
+        }
+    }
+});
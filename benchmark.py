@@ -0,0 +1,360 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (benchmark.py)
+April 19, 2023
+
+benchmark.py: Performance benchmarks for the dashboard's startup and its hot paths (loading, parsing, filtering,
+              encoding, training, predicting and building every figure), run on synthetic sleep logs of several sizes
+              and compared against the stored baselines in benchmark_baseline.json so that regressions are caught
+
+Usage:
+    python benchmark.py                          # run the benchmarks and fail if any is slower than its baseline allows
+    python benchmark.py --update-baseline        # run the benchmarks and store the results as the new baselines
+    python benchmark.py --sizes 1000 10000000    # choose the synthetic data set sizes
+"""
+# import statements
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# file containing the stored baseline timings
+BASELINE_FILE = 'benchmark_baseline.json'
+
+# a benchmark fails when it is this much slower than its baseline (0.25 = 25% slower)
+TOLERANCE = 0.25
+
+# default numbers of rows in the synthetic sleep logs
+SIZES = [1000, 100000]
+
+# models are only trained on sleep logs up to this many rows, since training time grows faster than the row count
+MAX_TRAIN_ROWS = 10000
+
+# the sleep statistics the random forest regressors predict
+TARGETS = ['Sleep efficiency', 'REM sleep percentage', 'Deep sleep percentage']
+
+
+def make_sleep_log(rows, seed=0):
+    """ Generate a synthetic sleep log learned from data/Sleep_Efficiency.csv (see synthetic.py)
+    Args:
+        rows (int): number of rows to generate
+        seed (int): seed for the random number generator
+    Returns:
+        df (Pandas data frame): the synthetic sleep log, as it would be read from the CSV file
+    """
+    import synthetic
+
+    return synthetic.sleep_log(rows, seed)
+
+
+def time_call(func, *args, repeats=3, setup=None, **kwargs):
+    """ Time a function call
+    Args:
+        func (function): the function to time
+        args, kwargs: the arguments to call it with
+        repeats (int): number of calls to time
+        setup (function): called before each call, outside the timing (e.g. to empty a cache the call fills)
+    Returns:
+        (float): the fastest call's time in seconds
+    """
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def time_import(module, repeats=5):
+    """ Time how long a fresh interpreter takes to import a module
+    Args:
+        module (str): name of the module to import
+        repeats (int): number of fresh interpreters to time
+    Returns:
+        (float): median import time in seconds
+    """
+    code = 'import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)'.format(module)
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(float(output.stdout.strip().splitlines()[-1]))
+
+    return statistics.median(times)
+
+
+def slowest_imports(module, limit=10):
+    """ Find the imports that contribute most to a module's import time
+    Args:
+        module (str): name of the module to import
+        limit (int): number of imports to return
+    Returns:
+        (list of tuples): (cumulative seconds, imported module) for the slowest imports
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], capture_output=True,
+                            text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    rows = []
+    for line in output.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]) / 1e6, parts[2].rstrip()))
+
+    return sorted(rows, reverse=True)[:limit]
+
+
+def benchmark_hot_paths(rows, max_train_rows=MAX_TRAIN_ROWS):
+    """ Time the data, model and figure functions on a synthetic sleep log
+    Args:
+        rows (int): number of rows in the synthetic sleep log
+        max_train_rows (int): models are only trained and used if the sleep log has at most this many rows
+    Returns:
+        results (dict): maps benchmark names to their timings in seconds
+    """
+    import utils
+    import random_forest_assets as rf
+    import stats_cube
+
+    results = {}
+    name = '{} [' + str(rows) + ' rows]'
+
+    # write the synthetic sleep log to a CSV file so that loading it can be timed
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'sleep.csv')
+        make_sleep_log(rows).to_csv(filename, index=False)
+        results[name.format('utils.read_file')] = time_call(utils.read_file, filename)
+        raw = utils.read_file(filename)
+
+    results[name.format('utils.parse_times')] = time_call(utils.parse_times, raw)
+    df_sleep = utils.parse_times(raw)
+
+    # the memoized helpers are timed without their cache (see memo.py), so every repeat does the work
+    results[name.format('utils.filt_vals')] = time_call(utils.filt_vals.__wrapped__, df_sleep, [60, 90],
+                                                        'Sleep efficiency',
+                                                        ['ID', 'Age', 'Awakenings', 'Sleep efficiency'])
+    results[name.format('utils.encode')] = time_call(utils.encode.__wrapped__, 'Gender', 'Smoking status', df_sleep)
+    results[name.format('stats_cube.StatsCube')] = time_call(stats_cube.StatsCube, df_sleep)
+
+    with dashboard_on(df_sleep) as sleep:
+        results.update(benchmark_callbacks(sleep, df_sleep, name, rows <= max_train_rows))
+
+    return results
+
+
+@contextlib.contextmanager
+def dashboard_on(df_sleep):
+    """ Point the dashboard at a synthetic sleep log for the duration of a block, restoring it afterwards
+    Args:
+        df_sleep (Pandas data frame): the parsed synthetic sleep log
+    Yields:
+        sleep (module): the dashboard, with the results cache's tiers turned off so that every repeat builds its figure
+                        (see cache_backend.py), and a temporary model cache, so that the models trained on the
+                        synthetic data are never reused by the dashboard or predict_service
+    """
+    import config
+    import stats_cube
+    import sleep
+
+    saved = {'EFFICIENCY': sleep.EFFICIENCY, 'CUBE': sleep.CUBE, 'FORESTS': dict(sleep.FORESTS),
+             'HOLDOUT': dict(sleep.HOLDOUT), 'memory': sleep.CACHE.memory, 'shared': sleep.CACHE.shared,
+             'model_dir': config.MODEL_DIR}
+    try:
+        with tempfile.TemporaryDirectory() as model_dir:
+            config.MODEL_DIR = model_dir
+            sleep.EFFICIENCY = df_sleep
+            sleep.CUBE = stats_cube.StatsCube(df_sleep)
+            sleep.CACHE.memory = sleep.CACHE.shared = None
+            sleep.FORESTS.clear()
+            yield sleep
+    finally:
+        config.MODEL_DIR = saved['model_dir']
+        sleep.EFFICIENCY, sleep.CUBE = saved['EFFICIENCY'], saved['CUBE']
+        sleep.CACHE.memory, sleep.CACHE.shared = saved['memory'], saved['shared']
+        sleep.FORESTS.clear()
+        sleep.FORESTS.update(saved['FORESTS'])
+        sleep.HOLDOUT.clear()
+        sleep.HOLDOUT.update(saved['HOLDOUT'])
+
+
+def benchmark_callbacks(sleep, df_sleep, name, train):
+    """ Time the dashboard's callbacks, and the model helpers they use
+    Args:
+        sleep (module): the dashboard, pointed at the synthetic sleep log (see dashboard_on)
+        df_sleep (Pandas data frame): the parsed synthetic sleep log
+        name (str): format of the benchmarks' names, with a slot for the function's name
+        train (bool): whether to time the benchmarks that train models too
+    Returns:
+        results (dict): maps benchmark names to their timings in seconds
+    """
+    import utils
+    import random_forest_assets as rf
+
+    results = {}
+    results[name.format('make_sleep_scatter')] = time_call(sleep.make_sleep_scatter, [], 'Age', 'Sleep duration')
+    results[name.format('show_sleep_gender_distributions')] = time_call(sleep.show_sleep_gender_distributions,
+                                                                        'Sleep duration')
+    results[name.format('show_efficiency_contour')] = time_call(sleep.show_efficiency_contour, 'Awakenings',
+                                                                'Light sleep percentage', [50, 100])
+    results[name.format('show_sleep_strip')] = time_call(sleep.show_sleep_strip, [50, 100])
+    results[name.format('plot_sleep_hygiene')] = time_call(sleep.plot_sleep_hygiene, 1, 50, 1, 3)
+    results[name.format('plot_three_dim_scatter')] = time_call(sleep.plot_three_dim_scatter, 'Age', 'Awakenings',
+                                                               'Sleep efficiency')
+
+    if train:
+        results[name.format('rf.forest_reg')] = time_call(rf.forest_reg.__wrapped__, 'Sleep efficiency', df_sleep,
+                                                          repeats=1)
+
+        # the remaining benchmarks use already trained models, so train them before timing
+        for target in TARGETS:
+            sleep.get_forest(target)
+
+        inputs = [25, 23, 7, 1, 50, 0, 3, 'Biological Male', 'No']
+        results[name.format('utils.predict_sleep_quality')] = time_call(
+            utils.predict_sleep_quality, 'Sleep efficiency', df_sleep, *inputs,
+            random_forest_reg=sleep.get_forest('Sleep efficiency'))
+        holdout = sleep.holdout_data()
+        df_holdout, x_feat_list = holdout['holdout'], holdout['x_feat_list']
+        results[name.format('rf.permutation_importance')] = time_call(
+            rf.permutation_importance, sleep.get_forest('Sleep efficiency', holdout=True),
+            df_holdout.loc[:, x_feat_list].values, df_holdout.loc[:, 'Sleep efficiency'].values, repeats=1)
+        # the permutation importances are cached in rf._IMPORTANCES, so every repeat starts without them
+        results[name.format('plot_eff_forest')] = time_call(sleep.plot_eff_forest, 'Sleep efficiency',
+                                                            setup=rf._IMPORTANCES.clear)
+        results[name.format('calc_sleep_quality')] = time_call(
+            sleep.calc_sleep_quality, {'client': 'benchmark', 'seq': 0, 'values': inputs})
+
+    return results
+
+
+def memory_per_row(filename):
+    """ Measure how many bytes each row of the parsed sleep data takes up in memory, with and without compact types
+    Args:
+        filename (str): name of the CSV file containing the sleep data
+    Returns:
+        (dict): maps 'default types' and 'compact types' to bytes per row, including the index
+    """
+    import utils
+
+    footprint = {}
+    for label, compact in [('default types', False), ('compact types', True)]:
+        df_sleep = utils.parse_times(utils.read_file(filename, compact=compact))
+        footprint[label] = df_sleep.memory_usage(deep=True).sum() / len(df_sleep)
+
+    return footprint
+
+
+def evaluation_modes(filename):
+    """ Compare the r^2 estimates and wall times of 10-fold cross-validation and out-of-bag scoring
+    Args:
+        filename (str): name of the CSV file containing the sleep data
+    Returns:
+        (dict): maps (target, mode) to (r^2 estimate, seconds)
+    """
+    import utils
+    import sleep_forest
+
+    df_sleep, x_feat_list = utils.get_x_feat(utils.parse_times(utils.read_file(filename)))
+    estimates = {}
+    for target in TARGETS:
+        for mode in ['kfold', 'oob']:
+            start = time.perf_counter()
+            r_squared, importance_metrics = sleep_forest.random_forest(x_feat_list, df_sleep, target, mode=mode)
+            estimates[(target, mode)] = (r_squared, time.perf_counter() - start)
+
+    return estimates
+
+
+def run_benchmarks(sizes=SIZES, max_train_rows=MAX_TRAIN_ROWS):
+    """ Run every benchmark
+    Args:
+        sizes (list of int): numbers of rows in the synthetic sleep logs
+        max_train_rows (int): models are only trained on sleep logs with at most this many rows
+    Returns:
+        results (dict): maps benchmark names to their timings in seconds
+    """
+    results = {'import sleep': time_import('sleep')}
+    for rows in sizes:
+        results.update(benchmark_hot_paths(rows, max_train_rows))
+
+    return results
+
+
+def compare(results, baselines, tolerance=TOLERANCE):
+    """ Compare benchmark results against their baselines
+    Args:
+        results (dict): maps benchmark names to their timings in seconds
+        baselines (dict): maps benchmark names to their baseline timings in seconds
+        tolerance (float): allowed slowdown relative to the baseline
+    Returns:
+        regressions (list of str): names of the benchmarks that are slower than allowed
+    """
+    regressions = []
+    for name, seconds in results.items():
+        if name in baselines and seconds > baselines[name] * (1 + tolerance):
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the dashboard performance benchmarks')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baselines')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed slowdown relative to baseline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='rows in the synthetic sleep logs')
+    parser.add_argument('--max-train-rows', type=int, default=MAX_TRAIN_ROWS,
+                        help='only train models on sleep logs up to this many rows')
+    args = parser.parse_args()
+
+    # load the stored baselines
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as file:
+            baselines = json.load(file)
+
+    # run the benchmarks and print their timings next to the baselines
+    results = run_benchmarks(args.sizes, args.max_train_rows)
+    for name, seconds in results.items():
+        baseline = baselines.get(name)
+        print('{:<60} {:>10.4f}s   (baseline {})'.format(name, seconds,
+                                                          'none' if baseline is None else round(baseline, 4)))
+
+    # show where the startup time goes
+    print('Slowest imports of sleep.py:')
+    for seconds, module in slowest_imports('sleep'):
+        print('    {:>8.4f}s {}'.format(seconds, module))
+
+    # show how the two ways of scoring the random forest regressors compare
+    print('Random forest r^2 estimates on data/Sleep_Efficiency.csv:')
+    for (target, mode), (r_squared, seconds) in evaluation_modes('data/Sleep_Efficiency.csv').items():
+        print('    {:<24} {:<6} r2 {:>7.4f} {:>9.3f}s'.format(target, mode, r_squared, seconds))
+
+    # show how much memory the parsed sleep data takes up
+    print('Memory per row of data/Sleep_Efficiency.csv:')
+    for label, size in memory_per_row('data/Sleep_Efficiency.csv').items():
+        print('    {:>8.1f} bytes ({})'.format(size, label))
+
+    if args.update_baseline:
+        baselines.update(results)
+        with open(BASELINE_FILE, 'w') as file:
+            json.dump(baselines, file, indent=4, sort_keys=True)
+            file.write('\n')
+        print('Baselines written to', BASELINE_FILE)
+        return
+
+    # fail when anything regressed
+    regressions = compare(results, baselines, args.tolerance)
+    if regressions:
+        print('Performance regressions:', ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
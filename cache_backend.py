@@ -0,0 +1,380 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (cache_backend.py)
+April 19, 2023
+
+cache_backend.py: A two-tier cache for the results of the dashboard's callbacks (figures, predictions and feature
+                  importances), shared by every dashboard worker process
+
+    memory tier    a small least recently used cache in each process, for the results that process uses most
+    shared tier    a cache every worker on the machine reads and writes: a diskcache (SQLite) directory by default
+                   (SLEEP_CACHE_DIR), or a Redis server when SLEEP_CACHE_URL is set (e.g. redis://localhost:6379/0)
+
+A result computed by one worker is therefore reused by the others instead of being computed again by each of them.
+Values are stored in the shared tier as bytes: Plotly figures (and dicts or lists of them) as Plotly's JSON, numpy
+arrays in the .npy format and anything else pickled. Every entry expires after a time to live (SLEEP_CACHE_TTL seconds),
+and every key includes the version of the data and of the models' settings (see utils.model_fingerprint), so results
+computed from other data or by other models are never returned; the entries of an older version are deleted from the
+shared tier the first time a worker with the new version starts.
+"""
+# import statements
+import collections
+import functools
+import hashlib
+import io
+import json
+import pickle
+import threading
+import time
+import warnings
+import numpy as np
+import config
+
+# one-byte tags telling how a value in the shared tier was serialized
+JSON_TAG = b'J'
+NUMPY_TAG = b'N'
+PICKLE_TAG = b'P'
+
+# key under which the shared tier records the newest data version it holds entries for
+VERSION_KEY = 'sleep-cache-version'
+
+
+def _has_figure(value):
+    """ Check whether a value is a Plotly figure, or a dict or list containing one """
+    from plotly.basedatatypes import BaseFigure
+
+    if isinstance(value, BaseFigure):
+        return True
+    if isinstance(value, dict):
+        return any(_has_figure(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_figure(item) for item in value)
+    return False
+
+
+def serialize(value):
+    """ Turn a value into bytes for the shared tier
+    Args:
+        value: a Plotly figure (or a dict or list of them), a numpy array, or any picklable value
+    Returns:
+        (bytes): the serialized value, starting with its tag
+    """
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        buffer = io.BytesIO()
+        np.save(buffer, value, allow_pickle=False)
+        return NUMPY_TAG + buffer.getvalue()
+
+    if _has_figure(value):
+        import plotly.io.json
+
+        return JSON_TAG + plotly.io.json.to_json_plotly(value).encode()
+
+    return PICKLE_TAG + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def deserialize(data):
+    """ Turn bytes from the shared tier back into a value
+    Args:
+        data (bytes): a value from serialize
+    Returns:
+        the value; figures come back as their JSON dicts, which Dash accepts wherever it accepts a figure
+    """
+    tag, body = data[:1], data[1:]
+    if tag == NUMPY_TAG:
+        return np.load(io.BytesIO(body), allow_pickle=False)
+    if tag == JSON_TAG:
+        import plotly.io.json
+
+        return plotly.io.json.from_json_plotly(body)
+
+    return pickle.loads(body)
+
+
+class MemoryTier:
+    """ A least recently used cache of values in this process, with a time to live for each entry """
+
+    def __init__(self, max_entries=256):
+        """ Start empty
+        Args:
+            max_entries (int): most entries kept; the least recently used ones are dropped beyond that
+        """
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Look up a value, or return None if it isn't cached or has expired """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """ Cache a value
+        Args:
+            key (str): the key
+            value: the value, kept as it is
+            ttl (float): seconds until the entry expires, or None for never
+        """
+        with self._lock:
+            self._entries[key] = (value, None if ttl is None else time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Drop every entry """
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskTier:
+    """ A cache shared by the processes on one machine, kept in a diskcache (SQLite) directory """
+
+    def __init__(self, directory):
+        """ Open (or create) the cache directory
+        Args:
+            directory (str): the directory
+        """
+        import diskcache
+
+        self.cache = diskcache.Cache(directory)
+
+    def get(self, key):
+        """ Look up a value's bytes, or return None if they aren't cached or have expired """
+        return self.cache.get(key)
+
+    def set(self, key, data, ttl=None, version=None):
+        """ Cache a value's bytes
+        Args:
+            key (str): the key
+            data (bytes): the serialized value
+            ttl (float): seconds until the entry expires, or None for never
+            version (str): the data version the value was computed from, so it can be deleted with that version
+        """
+        self.cache.set(key, data, expire=ttl, tag=version)
+
+    def purge(self, version):
+        """ Delete every entry computed from a data version """
+        self.cache.evict(version)
+
+
+class RedisTier:
+    """ A cache shared by the processes on one or more machines, kept in a Redis (or Redis-compatible) server """
+
+    def __init__(self, url):
+        """ Connect to the server
+        Args:
+            url (str): the server's URL, e.g. redis://localhost:6379/0
+        """
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        """ Look up a value's bytes, or return None if they aren't cached or have expired """
+        return self.client.get(key)
+
+    def set(self, key, data, ttl=None, version=None):
+        """ Cache a value's bytes (the data version is already part of the key)
+        Args:
+            key (str): the key
+            data (bytes): the serialized value
+            ttl (float): seconds until the entry expires, or None for never
+            version (str): the data version the value was computed from (unused)
+        """
+        self.client.set(key, data, px=None if ttl is None else int(ttl * 1000))
+
+    def purge(self, version):
+        """ Delete every entry computed from a data version """
+        keys = list(self.client.scan_iter(match='{}:*'.format(version)))
+        if keys:
+            self.client.delete(*keys)
+
+
+class TieredCache:
+    """ Looks values up in the memory tier, then in the shared tier, and stores new values in both """
+
+    def __init__(self, version, memory=None, shared=None, ttl=None):
+        """ Set up the cache for a data version
+        Args:
+            version (str): the version of what the cached values are computed from (e.g. utils.model_fingerprint)
+            memory (MemoryTier): the memory tier, or None for none
+            shared (DiskTier or RedisTier): the shared tier, or None for none
+            ttl (float): seconds until entries expire, or None for never
+        """
+        self.version = version
+        self.memory = memory
+        self.shared = shared
+        self.ttl = ttl
+        self.stats = collections.Counter()
+        if shared is not None:
+            self._claim_version()
+
+    def _claim_version(self):
+        """ Delete the shared tier's entries of an older data version, if it holds any """
+        try:
+            old = self.shared.get(VERSION_KEY)
+            old = old.decode() if isinstance(old, bytes) else old
+            if old != self.version:
+                if old:
+                    self.shared.purge(old)
+                self.shared.set(VERSION_KEY, self.version.encode())
+        except Exception as error:
+            warnings.warn('the shared cache is unavailable ({}); using the memory tier only'.format(error))
+            self.shared = None
+
+    def key(self, namespace, *args):
+        """ Build the key of a value
+        Args:
+            namespace (str): what the value is (e.g. the callback's name)
+            args: the arguments the value was computed from; they must have a stable repr()
+        Returns:
+            (str): the key, made of the data version, the namespace and a hash of the arguments
+        """
+        digest = hashlib.sha256(json.dumps(args, sort_keys=True, default=repr).encode()).hexdigest()[:32]
+        return '{}:{}:{}'.format(self.version, namespace, digest)
+
+    def get(self, key):
+        """ Look up a value in the memory tier, then in the shared tier
+        Args:
+            key (str): the key, from key()
+        Returns:
+            the value, or None if neither tier has it
+        """
+        if self.memory is not None:
+            value = self.memory.get(key)
+            if value is not None:
+                self.stats['memory_hits'] += 1
+                return value
+
+        if self.shared is not None:
+            try:
+                data = self.shared.get(key)
+            except Exception:
+                # an unreachable shared tier counts as a miss rather than failing the callback
+                self.stats['shared_errors'] += 1
+                data = None
+            if data is not None:
+                value = deserialize(data)
+                self.stats['shared_hits'] += 1
+                if self.memory is not None:
+                    self.memory.set(key, value, self.ttl)
+                return value
+
+        self.stats['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        """ Store a value in both tiers
+        Args:
+            key (str): the key, from key()
+            value: the value
+        """
+        if self.memory is not None:
+            self.memory.set(key, value, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, serialize(value), self.ttl, self.version)
+            except Exception:
+                self.stats['shared_errors'] += 1
+
+    def get_or_compute(self, namespace, args, compute):
+        """ Look up a value, computing and storing it if no tier has it
+        Args:
+            namespace (str): what the value is
+            args (tuple): the arguments the value is computed from
+            compute (function): computes the value from args
+        Returns:
+            the value
+        """
+        key = self.key(namespace, *args)
+        value = self.get(key)
+        if value is None:
+            value = compute(*args)
+            self.set(key, value)
+
+        return value
+
+    def record_newest(self, namespace, name, number, ttl=None):
+        """ Record a number under a name (e.g. a request's sequence number under its browser's id) unless a larger one
+            is already recorded, in the shared tier when there is one so every worker sees it
+        Args:
+            namespace (str): what the numbers are
+            name: what they are recorded for; it must have a stable repr()
+            number (int): the number
+            ttl (float): seconds until the record expires, or None for the cache's time to live
+        Returns:
+            (int): the largest number recorded under the name before this one, or None if there is none
+        """
+        key = self.key(namespace, name)
+        ttl = self.ttl if ttl is None else ttl
+
+        # two workers recording at once can leave the smaller of their numbers behind; that only ever lets an older
+        # number through, never stops the largest one
+        if self.shared is not None:
+            try:
+                data = self.shared.get(key)
+                newest = None if data is None else deserialize(data)
+                if newest is None or number > newest:
+                    self.shared.set(key, serialize(number), ttl, self.version)
+                return newest
+            except Exception:
+                self.stats['shared_errors'] += 1
+
+        newest = None
+        if self.memory is not None:
+            newest = self.memory.get(key)
+            if newest is None or number > newest:
+                self.memory.set(key, number, ttl)
+
+        return newest
+
+    def cached(self, namespace):
+        """ Decorate a function (e.g. a Dash callback) so its results are cached under its arguments
+        Args:
+            namespace (str): what the function's results are
+        Returns:
+            decorator (function): wraps the function
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                return self.get_or_compute(namespace, args, func)
+
+            return wrapper
+
+        return decorator
+
+
+def from_config(version):
+    """ Create the dashboard's cache from the configuration
+    Args:
+        version (str): the version of the dashboard's data
+    Returns:
+        (TieredCache): the cache
+    """
+    memory = MemoryTier(config.CACHE_MEMORY_ENTRIES) if config.CACHE_MEMORY_ENTRIES > 0 else None
+
+    # the shared tier is a Redis server when one is configured, and the local diskcache directory otherwise (or when
+    # the redis package isn't installed); without diskcache either, each process only has its memory tier
+    shared = None
+    if config.CACHE_URL:
+        try:
+            shared = RedisTier(config.CACHE_URL)
+        except ImportError:
+            warnings.warn('SLEEP_CACHE_URL is set but the redis package is not installed; using SLEEP_CACHE_DIR')
+    if shared is None and config.CACHE_DIR:
+        try:
+            shared = DiskTier(config.CACHE_DIR)
+        except ImportError:
+            shared = None
+
+    return TieredCache(version, memory, shared, config.CACHE_TTL)
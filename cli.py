@@ -0,0 +1,275 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (cli.py)
+April 19, 2023
+
+cli.py: Command-line entry point for offline batch jobs, without the dashboard's startup costs
+
+    score       predicts the sleep efficiency, REM sleep percentage and deep sleep percentage of every record in a CSV
+                or Parquet file, reading it in chunks and using the cached models (see rf.load_or_train)
+    evaluate    scores the random forest regressors and multiple linear regression models on any sleep data file, with
+                the random forests evaluated in parallel worker processes
+
+Results are written as JSON lines (.jsonl), JSON (.json) or Parquet (.parquet, which needs pyarrow), chosen by the
+output file's extension, and timing statistics are printed to standard error (and written to --stats if given).
+
+Usage:
+    python cli.py score sleep_records.csv --output predictions.parquet --chunk-rows 50000 --jobs 4
+    python cli.py evaluate --data data/Sleep_Efficiency.csv --mode oob --workers 3 --output evaluation.json
+"""
+# import statements
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import config
+import utils
+import ingest
+import predict_service
+
+# the sleep statistics the models predict
+TARGETS = ['Sleep efficiency', 'REM sleep percentage', 'Deep sleep percentage']
+
+
+def read_chunks(filename, chunk_rows):
+    """ Read a CSV or Parquet file a chunk of rows at a time
+    Args:
+        filename (str): name of the file; files ending in .parquet are read as Parquet, all others as CSV
+        chunk_rows (int): number of rows in each chunk
+    Returns:
+        (generator of Pandas data frames): the chunks
+    """
+    if filename.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(filename).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(filename, chunksize=chunk_rows)
+
+
+class ResultWriter:
+    """ Writes result rows to a JSON lines, JSON or Parquet file as they are produced """
+
+    def __init__(self, filename):
+        """ Open the output file
+        Args:
+            filename (str): name of the file, or None for JSON lines on standard output
+        """
+        self.filename = filename
+        self.format = os.path.splitext(filename)[1].lstrip('.') if filename else 'jsonl'
+        self.rows = 0
+        self._parquet = None
+        if self.format == 'parquet':
+            # the Parquet writer is created with the first rows, since it needs their schema
+            self._file = None
+        else:
+            self._file = open(filename, 'w') if filename else sys.stdout
+            if self.format == 'json':
+                self._file.write('[')
+
+    def write(self, rows):
+        """ Append rows to the file
+        Args:
+            rows (list of dicts): the rows to write, all with the same keys
+        """
+        if not rows:
+            return
+
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pylist(rows)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.filename, table.schema)
+            self._parquet.write_table(table)
+        elif self.format == 'json':
+            self._file.write((',\n' if self.rows else '\n') + ',\n'.join(json.dumps(row) for row in rows))
+        else:
+            self._file.write(''.join(json.dumps(row) + '\n' for row in rows))
+        self.rows += len(rows)
+
+    def close(self):
+        """ Finish and close the file """
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            if self.format == 'json':
+                self._file.write('\n]\n')
+            if self._file is not sys.stdout:
+                self._file.close()
+            else:
+                self._file.flush()
+
+
+def report(stats, filename=None):
+    """ Print timing statistics to standard error, and write them to a JSON file if one is given
+    Args:
+        stats (dict): the statistics
+        filename (str): name of the JSON file, or None
+    """
+    print(json.dumps(stats), file=sys.stderr)
+    if filename:
+        with open(filename, 'w') as file:
+            json.dump(stats, file, indent=4)
+            file.write('\n')
+
+
+def score(args):
+    """ Predict the sleep quality of every record in a file """
+    start = time.perf_counter()
+    timings = {'load_models': 0.0, 'read': 0.0, 'score': 0.0, 'write': 0.0}
+    counts = {'chunks': 0, 'rows_read': 0, 'rows_scored': 0, 'rows_dropped': 0}
+
+    # load (or train and cache) the models; each predicts on --jobs threads
+    models = predict_service.load_models(utils.parse_times(utils.read_file(config.DATA_FILE)), config.MODEL_DIR)
+    for model in models:
+        model.n_jobs = args.jobs
+    timings['load_models'] = time.perf_counter() - start
+
+    writer = ResultWriter(args.output)
+    chunks = read_chunks(args.input, args.chunk_rows)
+    while True:
+        mark = time.perf_counter()
+        chunk = next(chunks, None)
+        timings['read'] += time.perf_counter() - mark
+        if chunk is None:
+            break
+
+        mark = time.perf_counter()
+        rows, dropped = ingest.score_records([chunk], models)
+        timings['score'] += time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        writer.write(rows)
+        timings['write'] += time.perf_counter() - mark
+
+        counts['chunks'] += 1
+        counts['rows_read'] += len(chunk)
+        counts['rows_scored'] += len(rows)
+        counts['rows_dropped'] += dropped
+    writer.close()
+
+    seconds = time.perf_counter() - start
+    report(dict(counts, seconds={name: round(value, 4) for name, value in dict(timings, total=seconds).items()},
+                rows_per_second=round(counts['rows_scored'] / seconds)), args.stats)
+
+
+def evaluate_forest(df_sleep, x_feat_list, target, mode, n_jobs):
+    """ Score a random forest regressor (runs in a worker process)
+    Args:
+        df_sleep (Pandas data frame): the encoded sleep data
+        x_feat_list (list of str): the features
+        target (str): the y-variable
+        mode (str): 'kfold' or 'oob' (see sleep_forest.random_forest)
+        n_jobs (int): CPU cores each fit uses
+    Returns:
+        (dict): the model's r^2 value, feature importances and evaluation time
+    """
+    import sleep_forest
+
+    start = time.perf_counter()
+    r_squared, importance_metrics = sleep_forest.random_forest(x_feat_list, df_sleep, target, mode=mode, n_jobs=n_jobs)
+
+    return {'model': 'forest', 'target': target, 'mode': mode, 'r2': r_squared,
+            'importances': {feat: float(value) for feat, value in importance_metrics},
+            'seconds': round(time.perf_counter() - start, 4)}
+
+
+def evaluate(args):
+    """ Score the sleep quality models on a data file """
+    import sleep_mult_reg
+
+    start = time.perf_counter()
+    if args.data.endswith('.parquet'):
+        raw = pd.concat(read_chunks(args.data, 100000), ignore_index=True)
+    else:
+        raw = pd.read_csv(args.data)
+    df_sleep, x_feat_list = utils.get_x_feat(utils.parse_times(utils.clean(raw)))
+    load_seconds = time.perf_counter() - start
+
+    results = []
+
+    # the random forests are evaluated in parallel worker processes, one per target
+    futures = []
+    executor = None
+    if 'forest' in args.models:
+        executor = ProcessPoolExecutor(max_workers=args.workers)
+        futures = [executor.submit(evaluate_forest, df_sleep, x_feat_list, target, args.mode, args.jobs)
+                   for target in TARGETS]
+
+    # the linear models are solved from one set of sufficient statistics while the forests train
+    if 'linear' in args.models:
+        mark = time.perf_counter()
+        regression = sleep_mult_reg.GramRegression(x_feat_list, TARGETS)
+        regression.update(df_sleep)
+        statistics_seconds = time.perf_counter() - mark
+
+        # each model's time includes computing the shared statistics
+        for target in TARGETS:
+            mark = time.perf_counter()
+            r_squared = float(regression.r2(target))
+            results.append({'model': 'linear', 'target': target, 'r2': r_squared,
+                            'seconds': round(statistics_seconds + time.perf_counter() - mark, 4)})
+
+    results.extend(future.result() for future in futures)
+    if executor is not None:
+        executor.shutdown()
+
+    writer = ResultWriter(args.output)
+    writer.write(results if writer.format != 'parquet' else
+                 [{key: value for key, value in result.items() if key != 'importances'} for result in results])
+    writer.close()
+
+    report({'rows': len(df_sleep), 'models': len(results),
+            'seconds': {'load': round(load_seconds, 4), 'total': round(time.perf_counter() - start, 4)}}, args.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch scoring and model evaluation for the sleep quality models')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    score_parser = commands.add_parser('score', help='predict the sleep quality of every record in a file')
+    score_parser.add_argument('input', help='CSV or Parquet file of sleep records')
+    score_parser.add_argument('--output', help='.jsonl, .json or .parquet file (default: JSON lines on standard '
+                                               'output)')
+    score_parser.add_argument('--chunk-rows', type=int, default=50000, help='rows read and scored at a time')
+    score_parser.add_argument('--jobs', type=int, default=config.FOREST_JOBS,
+                              help='threads each model predicts on (-1 for all CPU cores)')
+    score_parser.add_argument('--stats', help='JSON file to write the timing statistics to')
+    score_parser.set_defaults(run=score)
+
+    evaluate_parser = commands.add_parser('evaluate', help='score the sleep quality models on a data file')
+    evaluate_parser.add_argument('--data', default=config.DATA_FILE, help='CSV or Parquet file of sleep data')
+    evaluate_parser.add_argument('--models', nargs='+', choices=['forest', 'linear'], default=['forest', 'linear'],
+                                 help='models to evaluate')
+    evaluate_parser.add_argument('--mode', choices=['kfold', 'oob'], default='kfold',
+                                 help='how the random forests are scored (see sleep_forest.py)')
+    evaluate_parser.add_argument('--workers', type=int, default=None,
+                                 help='worker processes the random forests are evaluated in (default: CPU count)')
+    evaluate_parser.add_argument('--jobs', type=int, default=1, help='CPU cores each random forest fit uses')
+    evaluate_parser.add_argument('--output', help='.jsonl, .json or .parquet file (default: JSON lines on standard '
+                                                  'output)')
+    evaluate_parser.add_argument('--stats', help='JSON file to write the timing statistics to')
+    evaluate_parser.set_defaults(run=evaluate)
+
+    args = parser.parse_args()
+
+    # pyarrow is only needed for Parquet files
+    filenames = [getattr(args, 'input', None), getattr(args, 'data', None), args.output]
+    if any(name and name.endswith('.parquet') for name in filenames):
+        try:
+            import pyarrow
+        except ImportError:
+            parser.error('reading or writing Parquet files needs pyarrow (pip install pyarrow)')
+
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
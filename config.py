@@ -0,0 +1,66 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (config.py)
+April 19, 2023
+
+config.py: Deployment settings for the dashboard, read from environment variables so they can be changed without
+           editing the code
+"""
+# import statements
+import os
+
+# the CSV file containing the sleep data
+DATA_FILE = os.environ.get('SLEEP_DATA_FILE', 'data/Sleep_Efficiency.csv')
+
+# name of a shared-memory segment published by shared_data.py; when set, dashboard workers attach to that segment
+# instead of each reading and parsing their own copy of the data
+SHARED_DATA_NAME = os.environ.get('SLEEP_SHARED_DATA')
+
+# directory where background callbacks (model training and prediction) keep their job state and results
+BACKGROUND_CACHE_DIR = os.environ.get('SLEEP_BACKGROUND_CACHE_DIR', '.cache/background')
+
+# seed for every random choice made while training and evaluating the models (bootstrap samples, cross-validation
+# folds, held-out rows and feature shuffles), so that the same data and settings always give the same models
+SEED = int(os.environ.get('SLEEP_SEED', 0))
+
+# random forest regressor training: CPU cores used (-1 for all of them), number of trees, and rows (or fraction of the
+# rows, when it contains a decimal point) drawn for each tree's bootstrap sample (all of them when not set)
+FOREST_JOBS = int(os.environ.get('SLEEP_FOREST_JOBS', -1))
+FOREST_TREES = int(os.environ.get('SLEEP_FOREST_TREES', 100))
+FOREST_MAX_SAMPLES = os.environ.get('SLEEP_FOREST_MAX_SAMPLES')
+if FOREST_MAX_SAMPLES is not None:
+    FOREST_MAX_SAMPLES = float(FOREST_MAX_SAMPLES) if '.' in FOREST_MAX_SAMPLES else int(FOREST_MAX_SAMPLES)
+
+# directory of the trained model cache shared by the dashboard and the prediction service (predict_service.py); set it
+# to an empty string to always train the models in memory
+MODEL_DIR = os.environ.get('SLEEP_MODEL_DIR', '.cache/models') or None
+
+# memory limit (in bytes) of the results cached by the memoized helper functions (see memo.py), and a directory that
+# results evicted from memory are written to (they are dropped when it is not set)
+MEMO_MAX_BYTES = int(os.environ.get('SLEEP_MEMO_MAX_BYTES', 256 * 1024 * 1024))
+MEMO_SPILL_DIR = os.environ.get('SLEEP_MEMO_SPILL_DIR')
+
+# cache of the dashboard's figures, predictions and feature importances shared by its worker processes (see
+# cache_backend.py): a diskcache directory (an empty string turns the shared tier off) or, when set, a Redis server URL;
+# seconds until entries expire; and the number of entries each process also keeps in memory (0 for none)
+CACHE_DIR = os.environ.get('SLEEP_CACHE_DIR', '.cache/shared')
+CACHE_URL = os.environ.get('SLEEP_CACHE_URL')
+CACHE_TTL = float(os.environ.get('SLEEP_CACHE_TTL', 24 * 60 * 60))
+CACHE_MEMORY_ENTRIES = int(os.environ.get('SLEEP_CACHE_MEMORY_ENTRIES', 256))
+
+# number of worker processes that compute the feature importance chart's permutation importances; 1 (the default)
+# computes them in the dashboard's own process, since each computation would start a new pool by forking the threaded
+# server, which costs more than the batched predictions it spreads out (and forking a process with running threads can
+# deadlock)
+IMPORTANCE_WORKERS = int(os.environ.get('SLEEP_IMPORTANCE_WORKERS', 1))
+
+# set SLEEP_METRICS=1 to time every callback and hot-path helper and serve the measurements at /metrics
+METRICS_ENABLED = os.environ.get('SLEEP_METRICS', '0') == '1'
+
+# directory that on-demand profiles of callback requests are written to; profiling is off when this is not set
+PROFILE_DIR = os.environ.get('SLEEP_PROFILE_DIR')
+
+# when set, requests must pass this value in the X-Sleep-Profile header or profile query parameter to be profiled, and
+# POST /profiling/start and /profiling/stop (which only exist when it is set) must pass it as their token parameter
+PROFILE_TOKEN = os.environ.get('SLEEP_PROFILE_TOKEN')
@@ -0,0 +1,324 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (ingest.py)
+April 19, 2023
+
+ingest.py: A streaming pipeline that scores sleep records as they arrive from devices, predicting each record's sleep
+           efficiency, REM sleep percentage and deep sleep percentage with the dashboard's random forest regressors
+
+Records are read from CSV files (in chunks) and from TCP connections (one JSON object per line, keyed by the CSV file's
+column names; the sleep quality columns can be left out). They are grouped into batches, and each batch is cleaned with
+the same rules as the dashboard's data (utils.clean and utils.parse_times), encoded with the models' own feature
+encoder (see utils.FeatureEncoder) and predicted in a pool of worker processes. The predictions are written as JSON
+lines, in the order the batches were formed.
+
+Every stage is connected to the next by a bounded queue and at most --max-in-flight batches are scored at once, so when
+scoring falls behind the sources stop being read (and the socket senders are slowed down by TCP) instead of the
+pipeline's memory growing. If any stage fails (e.g. a model can't predict a batch), the others are stopped and the
+program exits with an error.
+
+Usage:
+    python ingest.py --file data/Sleep_Efficiency.csv --output predictions.jsonl
+    python ingest.py --listen 127.0.0.1:9000 --batch-rows 256 --max-wait-ms 50 --workers 4
+"""
+# import statements
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import config
+import utils
+import predict_service
+
+# the columns of the sleep data CSV file, in the order the models' features are encoded in
+RAW_COLUMNS = ['ID', 'Age', 'Gender', 'Bedtime', 'Wakeup time', 'Sleep duration', 'Sleep efficiency',
+               'REM sleep percentage', 'Deep sleep percentage', 'Light sleep percentage', 'Awakenings',
+               'Caffeine consumption', 'Alcohol consumption', 'Smoking status', 'Exercise frequency']
+
+# marks the end of a stream in the pipeline's queues
+DONE = None
+
+# the models used by a worker process, set once per process by _init_worker
+_MODELS = []
+
+
+def _init_worker(models):
+    """ Keep the models in a worker process """
+    _MODELS[:] = models
+
+
+def score_batch(pieces):
+    """ Score a batch of records with the worker process's models (runs in a worker process)
+    Args:
+        pieces (list): the batch's records, as data frames (chunks of a file) and dicts (records from a socket)
+    Returns:
+        rows (list of dicts): each kept record's ID and predictions
+        dropped (int): number of records dropped by the cleaning rules or for being malformed
+    """
+    return score_records(pieces, _MODELS)
+
+
+def score_records(pieces, models):
+    """ Clean, encode and score a batch of records
+    Args:
+        pieces (list): the batch's records, as data frames (chunks of a file) and dicts (records from a socket)
+        models (list): a fitted regressor for each of predict_service.PREDICTED_STATS
+    Returns:
+        rows (list of dicts): each kept record's ID and predictions
+        dropped (int): number of records dropped by the cleaning rules or for being malformed
+    """
+    # put the records together, with their columns in the CSV file's order
+    records = [piece for piece in pieces if isinstance(piece, dict)]
+    frames = [piece for piece in pieces if not isinstance(piece, dict)]
+    if records:
+        frames.append(pd.DataFrame.from_records(records))
+    raw = pd.concat(frames, ignore_index=True)
+    raw = raw[[col for col in RAW_COLUMNS if col in raw.columns]]
+
+    # unreadable numbers become blanks, so the cleaning rules drop their records instead of the whole batch failing
+    for col in raw.columns.difference(['Gender', 'Bedtime', 'Wakeup time', 'Smoking status']):
+        raw[col] = pd.to_numeric(raw[col], errors='coerce')
+
+    # so do unreadable times (and times without a date), read as the local date and clock time whatever their time
+    # zone offset, and categories the models don't know, which would otherwise be encoded as the first category
+    for col in ['Bedtime', 'Wakeup time']:
+        if col in raw.columns:
+            parts = raw[col].astype(str).str.extract(r'^\s*(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2})')
+            times = pd.to_datetime(parts[0] + ' ' + parts[1], format='%Y-%m-%d %H:%M', errors='coerce')
+            raw[col] = times.dt.strftime('%Y-%m-%d %H:%M:%S')
+    for col, values in utils.CATEGORIES.items():
+        if col in raw.columns:
+            raw[col] = raw[col].where(raw[col].isin(values))
+
+    try:
+        # every batch gets the same column types, whichever values it happens to hold
+        df_sleep = utils.parse_times(utils.clean(raw, dtypes=utils.BATCH_DTYPES))
+        x = utils.feature_encoder(models[0]).transform(df_sleep)
+    except (KeyError, ValueError, TypeError, IndexError):
+        # a batch with missing columns or unreadable values can't be scored
+        return [], len(raw)
+
+    if len(x) == 0:
+        return [], len(raw)
+
+    ids = df_sleep['ID'].tolist() if 'ID' in df_sleep.columns else [None] * len(x)
+    y_pred = [model.predict(x) for model in models]
+    rows = [dict(ID=record_id, **{stat: round(float(values[i]), 2)
+                                  for stat, values in zip(predict_service.PREDICTED_STATS, y_pred)})
+            for i, record_id in enumerate(ids)]
+
+    return rows, len(raw) - len(rows)
+
+
+class Pipeline:
+    """ Reads, batches, scores and writes sleep records, with bounded queues between the stages """
+
+    def __init__(self, output, executor, batch_rows=256, max_wait=0.05, queue_size=64, max_in_flight=4):
+        """ Set up the pipeline's queues
+        Args:
+            output (file): where the predictions are written, one JSON object per line
+            executor (ProcessPoolExecutor): the worker processes that score batches
+            batch_rows (int): a batch is scored once it holds this many records
+            max_wait (float): seconds a batch waits for more records after its first one arrives
+            queue_size (int): most records (or file chunks) waiting to be batched
+            max_in_flight (int): most batches being scored or waiting to be written at once
+        """
+        self.output = output
+        self.executor = executor
+        self.batch_rows = batch_rows
+        self.max_wait = max_wait
+        self.records = asyncio.Queue(maxsize=queue_size)
+        self.batches = asyncio.Queue(maxsize=1)
+        self.results = asyncio.Queue(maxsize=max_in_flight)
+        self.stats = {'received': 0, 'malformed': 0, 'scored': 0, 'dropped': 0, 'batches': 0}
+
+    async def read_file(self, filename):
+        """ Feed a CSV file's records into the pipeline in chunks
+        Args:
+            filename (str): name of the CSV file
+        """
+        chunks = iter(pd.read_csv(filename, chunksize=self.batch_rows))
+        while True:
+            # reading a chunk blocks, so it happens on a thread while the other stages keep running
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            self.stats['received'] += len(chunk)
+            await self.records.put(chunk)
+
+    async def handle_connection(self, reader, writer):
+        """ Feed the records sent over a TCP connection into the pipeline, one JSON object per line
+        Args:
+            reader (asyncio.StreamReader): the connection's incoming data
+            writer (asyncio.StreamWriter): the connection's outgoing data
+        """
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if not isinstance(record, dict):
+                    self.stats['malformed'] += 1
+                    continue
+                self.stats['received'] += 1
+
+                # waits while the queue is full, which stops reading from the socket until the pipeline catches up
+                await self.records.put(record)
+        finally:
+            writer.close()
+
+    async def make_batches(self):
+        """ Group records into batches, cutting a batch when it is full or its deadline passes """
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            piece = await self.records.get()
+            if piece is DONE:
+                break
+
+            pieces = [piece]
+            rows = 1 if isinstance(piece, dict) else len(piece)
+            deadline = loop.time() + self.max_wait
+            while rows < self.batch_rows:
+                try:
+                    piece = await asyncio.wait_for(self.records.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if piece is DONE:
+                    finished = True
+                    break
+                pieces.append(piece)
+                rows += 1 if isinstance(piece, dict) else len(piece)
+
+            await self.batches.put(pieces)
+
+        await self.batches.put(DONE)
+
+    async def dispatch(self):
+        """ Send batches to the worker processes, keeping at most max_in_flight of them unwritten """
+        loop = asyncio.get_running_loop()
+        while True:
+            pieces = await self.batches.get()
+            if pieces is DONE:
+                break
+
+            # the results queue is bounded, so this waits while too many batches are in flight
+            await self.results.put(loop.run_in_executor(self.executor, score_batch, pieces))
+
+        await self.results.put(DONE)
+
+    async def write_results(self):
+        """ Write each batch's predictions as JSON lines, in the order the batches were formed """
+        while True:
+            future = await self.results.get()
+            if future is DONE:
+                break
+
+            rows, dropped = await future
+            self.stats['batches'] += 1
+            self.stats['scored'] += len(rows)
+            self.stats['dropped'] += dropped
+            self.output.write(''.join(json.dumps(row) + '\n' for row in rows))
+            self.output.flush()
+
+    async def feed(self, filenames=(), listen=None):
+        """ Feed the records of the files, then of the connections, into the pipeline and mark the end of the stream
+        Args:
+            filenames (list of str): CSV files to score
+            listen (tuple): (host, port) to accept connections on, or None
+        """
+        server = None
+        if listen is not None:
+            server = await asyncio.start_server(self.handle_connection, *listen)
+            print('Listening for sleep records on {}:{}'.format(*listen), file=sys.stderr)
+
+        for filename in filenames:
+            await self.read_file(filename)
+
+        if server is not None:
+            async with server:
+                await server.serve_forever()
+
+        # let the stages drain and finish
+        await self.records.put(DONE)
+
+    async def run(self, filenames=(), listen=None):
+        """ Run the pipeline until every file has been scored (or forever, when listening for connections)
+        Args:
+            filenames (list of str): CSV files to score
+            listen (tuple): (host, port) to accept connections on, or None
+        Raises:
+            Exception: the first error of any stage (e.g. a model failing to predict), after the others are stopped
+        """
+        tasks = [asyncio.create_task(stage()) for stage in (self.make_batches, self.dispatch, self.write_results)]
+        tasks.append(asyncio.create_task(self.feed(filenames, listen)))
+
+        # a stage that fails stops taking from its queue, which would leave the others waiting on full queues forever
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            task.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score sleep records as they arrive')
+    parser.add_argument('--file', action='append', default=[], help='CSV file of sleep records (repeatable)')
+    parser.add_argument('--listen', help='host:port to accept JSON-lines connections on')
+    parser.add_argument('--output', help='file to write the predictions to (default: standard output)')
+    parser.add_argument('--batch-rows', type=int, default=256, help='records scored together at most')
+    parser.add_argument('--max-wait-ms', type=float, default=50, help='milliseconds a batch waits for more records')
+    parser.add_argument('--queue-size', type=int, default=64, help='records or file chunks waiting to be batched')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes that score batches')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='batches scored or waiting to be written at once (default: twice the workers)')
+    args = parser.parse_args()
+    if not args.file and not args.listen:
+        parser.error('give at least one --file or --listen')
+
+    listen = None
+    if args.listen:
+        host, port = args.listen.rsplit(':', 1)
+        listen = (host, int(port))
+
+    # load (or train and cache) the models once, and hand them to the worker processes
+    models = predict_service.load_models(utils.parse_times(utils.read_file(config.DATA_FILE)))
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    start = time.perf_counter()
+    error = None
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(models,)) as executor:
+        pipeline = Pipeline(output, executor, args.batch_rows, args.max_wait_ms / 1000, args.queue_size,
+                            args.max_in_flight or 2 * args.workers)
+        try:
+            asyncio.run(pipeline.run(args.file, listen))
+        except KeyboardInterrupt:
+            pass
+        except Exception as exception:
+            # don't score the batches still waiting for a worker
+            error = exception
+            executor.shutdown(cancel_futures=True)
+    if output is not sys.stdout:
+        output.close()
+
+    # report how the run went
+    seconds = time.perf_counter() - start
+    stats = dict(pipeline.stats, seconds=round(seconds, 3),
+                 records_per_second=round(pipeline.stats['scored'] / seconds))
+    print(json.dumps(stats), file=sys.stderr)
+
+    if error is not None:
+        sys.exit('Scoring failed: {!r}'.format(error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (instrumentation.py)
+April 19, 2023
+
+instrumentation.py: Optional timing instrumentation for the dashboard. Once installed, it times every Dash callback and
+                    the hot-path helpers they call (data filtering, encoding, model fitting, predicting, building
+                    figures and serializing responses to JSON) and serves the measurements in the Prometheus text
+                    format at /metrics
+
+Turn it on without changing the code by setting SLEEP_METRICS=1 (see config.py). Callbacks that run as background
+jobs are timed from the server's side (submitting the job and polling for its result); the spans recorded inside the job
+process are not exported.
+"""
+# import statements
+import functools
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# helper functions (and methods, as 'module.Class.method') that get timed, mapped to the span they count towards; the
+# Sleep Statistics charts are summarized from the stats cube (see stats_cube.py), so its queries count as filtering
+SPANS = {
+    'utils.filt_vals': 'data_filtering',
+    'stats_cube.StatsCube.query': 'data_filtering',
+    'utils.encode': 'encoding',
+    'utils.get_x_feat': 'encoding',
+    'random_forest_assets.forest_reg': 'model_fit',
+    'utils.predict_sleep_quality': 'predict',
+    'random_forest_assets.plot_feat_import_rf_reg': 'figure_build',
+    'stats_cube.quantile_points': 'figure_build',
+    'plotly.express.scatter': 'figure_build',
+    'plotly.express.scatter_3d': 'figure_build',
+    'dash._callback.to_json': 'json_serialization'
+}
+
+# recorded measurements, keyed by (metric name, sorted label pairs)
+_HISTOGRAMS = {}
+_COUNTERS = {}
+_LOCK = threading.Lock()
+
+
+class Histogram:
+    """ Cumulative latency histogram in the Prometheus style """
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        """ Record one measurement
+        Args:
+            seconds (float): the measured duration
+        """
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+        self.total += seconds
+        self.count += 1
+
+
+def observe(metric, seconds, **labels):
+    """ Record a duration in a histogram
+    Args:
+        metric (str): name of the histogram
+        seconds (float): the measured duration
+        labels (str): labels identifying the histogram's series
+    """
+    key = (metric, tuple(sorted(labels.items())))
+    with _LOCK:
+        if key not in _HISTOGRAMS:
+            _HISTOGRAMS[key] = Histogram()
+        _HISTOGRAMS[key].observe(seconds)
+
+
+def increment(metric, amount=1, **labels):
+    """ Add to a counter
+    Args:
+        metric (str): name of the counter
+        amount (float): amount to add
+        labels (str): labels identifying the counter's series
+    """
+    key = (metric, tuple(sorted(labels.items())))
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + amount
+
+
+@contextmanager
+def span(name):
+    """ Time a block of code as part of a span
+    Args:
+        name (str): name of the span (e.g. 'model_fit')
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('sleep_span_duration_seconds', time.perf_counter() - start, span=name)
+
+
+def timed(func, span_name, function_name):
+    """ Wrap a function so that every call is timed as part of a span
+    Args:
+        func (function): the function to wrap
+        span_name (str): name of the span the calls count towards
+        function_name (str): name of the function, used as a label
+    Returns:
+        wrapper (function): the timed function
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            observe('sleep_span_duration_seconds', seconds, span=span_name)
+            observe('sleep_function_duration_seconds', seconds, function=function_name)
+
+    wrapper.__wrapped_by_instrumentation__ = True
+    return wrapper
+
+
+def timed_callback(func, callback_name):
+    """ Wrap a Dash callback so that its latency, calls and errors are recorded
+    Args:
+        func (function): the callback function registered with Dash
+        callback_name (str): name of the callback's outputs, used as a label
+    Returns:
+        wrapper (function): the timed callback
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as error:
+            # Dash signals "nothing to update" with exceptions, which are not errors
+            if type(error).__name__ != 'PreventUpdate':
+                increment('sleep_callback_errors_total', callback=callback_name)
+            raise
+        finally:
+            observe('sleep_callback_duration_seconds', time.perf_counter() - start, callback=callback_name)
+            increment('sleep_callback_calls_total', callback=callback_name)
+
+    wrapper.__wrapped_by_instrumentation__ = True
+    return wrapper
+
+
+def _format_labels(labels, extra=()):
+    """ Format label pairs in the Prometheus text format
+    Args:
+        labels (tuple): (name, value) label pairs
+        extra (tuple): additional (name, value) label pairs
+    Returns:
+        (str): the formatted labels, e.g. {span="model_fit"}
+    """
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in pairs]
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in escaped) + '}'
+
+
+def render():
+    """ Render every recorded measurement in the Prometheus text exposition format
+    Returns:
+        text (str): the measurements
+    """
+    lines = []
+    with _LOCK:
+        # histograms, grouped by metric
+        for metric in sorted({metric for metric, labels in _HISTOGRAMS}):
+            lines.append('# TYPE {} histogram'.format(metric))
+            for (name, labels), histogram in sorted(_HISTOGRAMS.items()):
+                if name != metric:
+                    continue
+                for bound, count in zip(BUCKETS, histogram.bucket_counts):
+                    lines.append('{}_bucket{} {}'.format(metric, _format_labels(labels, [('le', bound)]), count))
+                lines.append('{}_bucket{} {}'.format(metric, _format_labels(labels, [('le', '+Inf')]),
+                                                     histogram.count))
+                lines.append('{}_sum{} {}'.format(metric, _format_labels(labels), histogram.total))
+                lines.append('{}_count{} {}'.format(metric, _format_labels(labels), histogram.count))
+
+        # counters, grouped by metric
+        for metric in sorted({metric for metric, labels in _COUNTERS}):
+            lines.append('# TYPE {} counter'.format(metric))
+            for (name, labels), value in sorted(_COUNTERS.items()):
+                if name == metric:
+                    lines.append('{}{} {}'.format(metric, _format_labels(labels), value))
+
+    # the memoized helper functions keep their own hit and miss counts (see memo.py)
+    lines.extend(_memo_lines())
+
+    return '\n'.join(lines) + '\n'
+
+
+def _memo_lines():
+    """ Render the memoization cache's statistics in the Prometheus text exposition format
+    Returns:
+        lines (list of str): the statistics
+    """
+    import memo
+
+    report = memo.stats()
+    lines = []
+    for outcome in ['hits', 'disk_hits', 'misses', 'evictions', 'spills']:
+        metric = 'sleep_memo_{}_total'.format(outcome)
+        lines.append('# TYPE {} counter'.format(metric))
+        for name, counts in report['functions'].items():
+            lines.append('{}{} {}'.format(metric, _format_labels([('function', name)]), counts.get(outcome, 0)))
+    lines.append('# TYPE sleep_memo_bytes gauge')
+    lines.append('sleep_memo_bytes {}'.format(report['bytes']))
+
+    return lines
+
+
+def reset():
+    """ Forget every recorded measurement """
+    with _LOCK:
+        _HISTOGRAMS.clear()
+        _COUNTERS.clear()
+
+
+def instrument_functions(spans=None):
+    """ Replace the hot-path helper functions with timed versions
+    Args:
+        spans (dict): maps 'module.function' (or 'module.Class.method') names to the span they count towards; defaults
+                      to SPANS
+    """
+    for path, span_name in (spans or SPANS).items():
+        owner_name, function_name = path.rsplit('.', 1)
+        try:
+            owner = importlib.import_module(owner_name)
+        except ImportError:
+            # the path may name a method, whose owner is a class of a module
+            module_name, _, class_name = owner_name.rpartition('.')
+            try:
+                owner = getattr(importlib.import_module(module_name), class_name, None)
+            except (ImportError, ValueError):
+                continue
+
+        func = getattr(owner, function_name, None)
+        if func is not None and not getattr(func, '__wrapped_by_instrumentation__', False):
+            setattr(owner, function_name, timed(func, span_name, path))
+
+
+def install(app, path='/metrics'):
+    """ Time every callback registered with a Dash app and serve the measurements
+    Args:
+        app (Dash): the dashboard, with all of its callbacks already registered
+        path (str): URL path of the metrics endpoint
+    """
+    import flask
+
+    instrument_functions()
+
+    # callbacks that run in the browser have no server-side function to wrap
+    for callback_id, callback in app.callback_map.items():
+        if 'callback' in callback and not getattr(callback['callback'], '__wrapped_by_instrumentation__', False):
+            callback['callback'] = timed_callback(callback['callback'], callback_id.strip('.'))
+
+    # time whole requests to the callback endpoint as well, which includes Dash's request handling
+    @app.server.before_request
+    def start_timer():
+        flask.g.instrumentation_start = time.perf_counter()
+
+    @app.server.after_request
+    def stop_timer(response):
+        if 'instrumentation_start' in flask.g and flask.request.path.endswith('_dash-update-component'):
+            observe('sleep_request_duration_seconds', time.perf_counter() - flask.g.instrumentation_start,
+                    status=response.status_code)
+        return response
+
+    @app.server.route(path)
+    def metrics():
+        return flask.Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,507 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (loadtest.py)
+April 19, 2023
+
+loadtest.py: A load test of a running dashboard, which replays simulated users' interactions against its callback
+             endpoint (/_dash-update-component) and reports each callback's latency percentiles and throughput
+
+Each simulated user loads the page (the index, /_dash-layout and /_dash-dependencies, from which the callbacks and the
+starting value of every component are read) and fires the callbacks the page runs when it loads. It then repeatedly
+changes a dropdown, checklist or slider, fires every server callback the change triggers (at the same time, as the
+browser does) and waits a think time. Clientside callbacks run in the browser, so the ones that feed a server callback
+are re-created here (see CLIENTSIDE): e.g. the predictor's sliders and dropdowns only reach the server through the
+predictor-request store that request_prediction fills in.
+
+Slider changes are replayed as drags: a slider with updatemode='drag' sends every value it passes through, and one with
+updatemode='mouseup' (like efficiency-slider and the predictor's sliders) a few releases as the user settles on a value.
+Background callbacks (the feature importances and the predictions) are polled until their result arrives, as the
+browser does, so their latency is the time until the user sees the result.
+
+Usage:
+    python sleep.py                              # in another terminal (or gunicorn, see shared_data.py)
+    python loadtest.py --users 20 --duration 60 --think-ms 1000 --output load.json
+    python loadtest.py --url http://127.0.0.1:8050 --users 50 --ramp-up 10 --think-ms 0
+"""
+# import statements
+import argparse
+import collections
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# the dashboard's configuration (which holds the page load's signed end_id) in its index page
+CONFIG_PATTERN = re.compile(r'<script id="_dash-config" type="application/json">(.*?)</script>', re.S)
+
+# the components a user can change, by type
+INTERACTIVE = {'Dropdown', 'Slider', 'RangeSlider', 'Checklist', 'RadioItems'}
+
+# requests a browser sends to one server at once
+BROWSER_CONNECTIONS = 6
+
+# values a slider with updatemode='drag' sends during a drag, and most releases while settling on a value otherwise
+DRAG_STEPS = 5
+MOUSEUP_RELEASES = 3
+
+# percentiles of the latencies reported for each callback
+PERCENTILES = [50, 95, 99]
+
+# name the page loads are reported under
+PAGE_LOAD = '(page load)'
+
+
+def request_prediction(user, age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke,
+                       previous):
+    """ Bundle the sleep quality predictor inputs into one numbered request (see request_prediction in
+        assets/clientside.js)
+    """
+    return {'client': previous['client'] if previous else user.client,
+            'seq': previous['seq'] + 1 if previous else 0,
+            'values': [age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke]}
+
+
+# the clientside callbacks that feed server callbacks, by namespace and function name
+CLIENTSIDE = {('sleep', 'request_prediction'): request_prediction}
+
+
+def http(url, body=None, timeout=60):
+    """ Send a GET (or, with a body, a JSON POST) request
+    Args:
+        url (str): the URL
+        body: the JSON body, or None
+        timeout (float): seconds to wait for the server
+    Returns:
+        status (int): the response's HTTP status, or 0 if the server couldn't be reached
+        data (bytes): the response's body
+    """
+    data = None if body is None else json.dumps(body).encode()
+    request = urllib.request.Request(url, data, {'Content-Type': 'application/json'} if data is not None else {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+    except OSError as error:
+        return 0, str(error).encode()
+
+
+def _walk(node):
+    """ Yield every component in a layout (including those inside other components' properties) """
+    if isinstance(node, list):
+        for item in node:
+            yield from _walk(item)
+    elif isinstance(node, dict):
+        if 'type' in node and 'props' in node:
+            yield node
+            for value in node['props'].values():
+                yield from _walk(value)
+        else:
+            for value in node.values():
+                yield from _walk(value)
+
+
+def _split_outputs(output):
+    """ Split a callback's output string (e.g. '..a.children...b.children..') into (id, property) pairs """
+    names = output[2:-2].split('...') if output.startswith('..') else [output]
+    return [tuple(name.rsplit('.', 1)) for name in names]
+
+
+class Callback:
+    """ A callback of the dashboard, as listed by /_dash-dependencies """
+
+    def __init__(self, spec):
+        """ Read the callback's outputs, inputs and settings
+        Args:
+            spec (dict): the callback's entry in /_dash-dependencies
+        """
+        self.output = spec['output']
+        self.outputs = _split_outputs(spec['output'])
+        self.multi = spec['output'].startswith('..')
+        self.inputs = [(item['id'], item['property']) for item in spec['inputs']]
+        self.state = [(item['id'], item['property']) for item in spec.get('state', [])]
+        self.background = spec.get('background')
+        self.initial = not spec.get('prevent_initial_call')
+        self.function = spec.get('clientside_function')
+        self.name = spec['output'] if not self.multi else ' + '.join('.'.join(output) for output in self.outputs)
+
+    def body(self, values, changed=()):
+        """ Build the callback's request, as the browser sends it
+        Args:
+            values (dict): the current value of every component property, keyed by (id, property)
+            changed (set): the properties whose change triggered the callback
+        Returns:
+            (dict): the request's JSON body
+        """
+        outputs = [{'id': component, 'property': prop} for component, prop in self.outputs]
+
+        return {'output': self.output,
+                'outputs': outputs if self.multi else outputs[0],
+                'inputs': [{'id': component, 'property': prop, 'value': values.get((component, prop))}
+                           for component, prop in self.inputs],
+                'changedPropIds': ['{}.{}'.format(*key) for key in self.inputs if key in changed],
+                'state': [{'id': component, 'property': prop, 'value': values.get((component, prop))}
+                          for component, prop in self.state]}
+
+
+class Dashboard:
+    """ The callbacks and components of a running dashboard """
+
+    def __init__(self, url, timeout=60):
+        """ Read the dashboard's callbacks and layout
+        Args:
+            url (str): the dashboard's address, e.g. http://127.0.0.1:8050
+            timeout (float): seconds to wait for the server
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+        status, dependencies = http(self.url + '/_dash-dependencies', timeout=timeout)
+        if status != 200:
+            raise RuntimeError('could not read the callbacks from {} (HTTP status {})'.format(self.url, status))
+        status, layout = http(self.url + '/_dash-layout', timeout=timeout)
+        if status != 200:
+            raise RuntimeError('could not read the layout from {} (HTTP status {})'.format(self.url, status))
+
+        # pattern-matching callbacks (with dict ids) aren't replayed
+        callbacks = [Callback(spec) for spec in json.loads(dependencies)
+                     if not spec['output'].lstrip('.').startswith('{')]
+        self.server = [callback for callback in callbacks if callback.function is None]
+        self.clientside = [callback for callback in callbacks
+                           if callback.function is not None
+                           and (callback.function['namespace'], callback.function['function_name']) in CLIENTSIDE]
+        self.components = {node['props']['id']: node for node in _walk(json.loads(layout))
+                           if isinstance(node['props'].get('id'), str)}
+
+        # the starting value of every property a callback reads, and the properties a callback's result is read for
+        watched = {key for callback in callbacks for key in callback.inputs + callback.state}
+        self.initial = {(component, prop): self.components.get(component, {}).get('props', {}).get(prop)
+                        for component, prop in watched}
+        self.watched = watched
+
+        # the components a user can change that (directly or through a re-created clientside callback) trigger a
+        # server callback
+        reach = {key for callback in self.server for key in callback.inputs}
+        for callback in self.clientside:
+            if any(output in reach for output in callback.outputs):
+                reach.update(callback.inputs)
+        self.choices = sorted(component for component, prop in reach
+                              if prop == 'value' and self.components.get(component, {}).get('type') in INTERACTIVE)
+
+
+class Recorder:
+    """ Collects the latency and outcome of every request, by callback """
+
+    def __init__(self):
+        """ Start empty """
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.statuses = collections.defaultdict(collections.Counter)
+        self.actions = 0
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, status):
+        """ Record a request
+        Args:
+            name (str): the callback's name
+            seconds (float): the time until its result arrived
+            status (int): the HTTP status of its result (0 if the server couldn't be reached or it timed out)
+        """
+        with self._lock:
+            self.latencies[name].append(seconds)
+            self.statuses[name][status] += 1
+            if status not in (200, 204):
+                self.errors[name] += 1
+
+    def action(self):
+        """ Count a user's interaction """
+        with self._lock:
+            self.actions += 1
+
+    def summary(self, seconds):
+        """ Summarize the requests
+        Args:
+            seconds (float): how long the test ran
+        Returns:
+            (dict): each callback's requests, errors, statuses, mean and percentile latencies (in milliseconds) and
+                    throughput (requests per second), and the same for every callback together
+        """
+        with self._lock:
+            groups = dict(self.latencies)
+            groups['(all callbacks)'] = [value for name, values in self.latencies.items() if name != PAGE_LOAD
+                                         for value in values]
+            report = {}
+            for name, values in groups.items():
+                if not values:
+                    continue
+                latencies = np.array(values) * 1000
+                errors = (sum(self.errors[key] for key in self.errors if key != PAGE_LOAD)
+                          if name == '(all callbacks)' else self.errors[name])
+                report[name] = dict({'requests': len(values), 'errors': errors,
+                                     'mean_ms': round(float(latencies.mean()), 2)},
+                                    **{'p{}_ms'.format(p): round(float(np.percentile(latencies, p)), 2)
+                                       for p in PERCENTILES},
+                                    throughput=round(len(values) / seconds, 2))
+                if name in self.statuses:
+                    report[name]['statuses'] = {str(status): count for status, count in self.statuses[name].items()}
+
+            return {'seconds': round(seconds, 3), 'actions': self.actions, 'callbacks': report}
+
+
+class User:
+    """ A simulated user of the dashboard, with its own page load and component values """
+
+    def __init__(self, dashboard, recorder, pool, index, seed=0, think=1.0, drag_pause=0.1):
+        """ Set up the user
+        Args:
+            dashboard (Dashboard): the dashboard
+            recorder (Recorder): collects the requests' latencies
+            pool (ThreadPoolExecutor): sends the callbacks triggered by one change at the same time
+            index (int): the user's number
+            seed (int): seed the user's interactions are drawn from (together with its number)
+            think (float): mean seconds between interactions
+            drag_pause (float): seconds between the values sent during a drag
+        """
+        self.dashboard = dashboard
+        self.recorder = recorder
+        self.pool = pool
+        self.rng = np.random.default_rng([seed, index])
+        self.think = think
+        self.drag_pause = drag_pause
+        self.client = 'loadtest-{}'.format(index)
+        self.values = dict(dashboard.initial)
+        self.end_id = None
+        self._lock = threading.Lock()
+
+    def load_page(self):
+        """ Load the page, as the browser does before running any callback """
+        start = time.perf_counter()
+        status, page = http(self.dashboard.url + '/', timeout=self.dashboard.timeout)
+        for path in ('/_dash-layout', '/_dash-dependencies'):
+            if status == 200:
+                status = http(self.dashboard.url + path, timeout=self.dashboard.timeout)[0]
+        self.recorder.record(PAGE_LOAD, time.perf_counter() - start, status)
+
+        # background callbacks' handles are signed for this page load (see dash._callback_signing)
+        match = CONFIG_PATTERN.search(page.decode(errors='replace'))
+        if match:
+            self.end_id = json.loads(match.group(1)).get('end_id')
+
+    def call(self, callback, changed=()):
+        """ Send a server callback's request, polling a background callback until its result arrives
+        Args:
+            callback (Callback): the callback
+            changed (set): the properties whose change triggered it
+        Returns:
+            updates (dict): the new values of the properties other callbacks read, keyed by (id, property)
+        """
+        with self._lock:
+            body = callback.body(self.values, changed)
+        args = {'endId': self.end_id} if self.end_id else {}
+        url = self.dashboard.url + '/_dash-update-component'
+        timeout = self.dashboard.timeout
+
+        start = time.perf_counter()
+        status, data = http(url + ('?' + urllib.parse.urlencode(args) if args else ''), body, timeout)
+        result = None
+        if status == 200 and (callback.background or any(key in self.dashboard.watched for key in callback.outputs)):
+            result = json.loads(data)
+
+        # a background callback answers with handles to its job, which are polled (with the inputs left out, as the
+        # browser does) until the job's result arrives
+        if callback.background and result is not None and 'cacheKey' in result:
+            poll_args = dict(args, cacheKey=result['cacheKey'], job=result['job'])
+            poll_url = url + '?' + urllib.parse.urlencode(poll_args)
+            for item in body['inputs'] + body['state']:
+                item['value'] = None
+            interval = callback.background.get('interval', 500) / 1000
+            while True:
+                time.sleep(interval)
+                status, data = http(poll_url, body, timeout)
+                result = json.loads(data) if status == 200 else None
+                if result is None or 'response' in result:
+                    break
+                if time.perf_counter() - start > timeout:
+                    status, result = 0, None
+                    break
+        self.recorder.record(callback.name, time.perf_counter() - start, status)
+
+        # keep the new values of the properties other callbacks read
+        updates = {}
+        if result is not None and 'response' in result:
+            response = result['response']
+            if not result.get('multi'):
+                response = {callback.outputs[0][0]: response.get('props', {})}
+            for component, props in response.items():
+                for prop, value in props.items():
+                    if (component, prop) in self.dashboard.watched:
+                        updates[(component, prop)] = value
+
+        return updates
+
+    def fire(self, changed, initial=False):
+        """ Run the callbacks triggered by changed properties, and those triggered by their results in turn
+        Args:
+            changed (set): the changed properties, keyed by (id, property)
+            initial (bool): run every callback that runs when the page loads, instead
+        """
+        while changed or initial:
+            # the re-created clientside callbacks run first, in the browser
+            for callback in self.dashboard.clientside:
+                if initial or any(key in changed for key in callback.inputs):
+                    function = CLIENTSIDE[(callback.function['namespace'], callback.function['function_name'])]
+                    with self._lock:
+                        value = function(self, *[self.values.get(key) for key in callback.inputs + callback.state])
+                        results = value if callback.multi else [value]
+                        for key, result in zip(callback.outputs, results):
+                            self.values[key] = result
+                    changed = set(changed) | set(callback.outputs)
+
+            # the server callbacks are sent at the same time
+            triggered = [callback for callback in self.dashboard.server
+                         if (initial and callback.initial) or any(key in changed for key in callback.inputs)]
+            futures = [self.pool.submit(self.call, callback, () if initial else changed) for callback in triggered]
+            updates = {}
+            for future in futures:
+                updates.update(future.result())
+            with self._lock:
+                self.values.update(updates)
+            changed, initial = set(updates), False
+
+    def choose(self, component):
+        """ Choose the values a user sends while changing a component
+        Args:
+            component (str): the component's id
+        Returns:
+            (list): the values, in the order they are sent (several for a slider drag)
+        """
+        node = self.dashboard.components[component]
+        props = node['props']
+        current = self.values.get((component, 'value'))
+
+        if node['type'] in ('Slider', 'RangeSlider'):
+            step = props.get('step') or 1
+            grid = np.arange(props.get('min', 0), props.get('max', 10) + step / 2, step)
+            whole = all(float(value).is_integer() for value in (props.get('min', 0), props.get('max', 10), step))
+            if node['type'] == 'RangeSlider':
+                target = np.sort(self.rng.choice(grid, 2))
+                start = np.array(current if current else [grid[0], grid[-1]], dtype=float)
+            else:
+                target = self.rng.choice(grid)
+                start = float(current if current is not None else grid[0])
+
+            # a drag passes through values on the way to the target; releasing the mouse sends the value it's at
+            steps = DRAG_STEPS if props.get('updatemode') == 'drag' else int(self.rng.integers(1, MOUSEUP_RELEASES + 1))
+            values = []
+            for fraction in np.linspace(0, 1, steps + 1)[1:]:
+                value = grid[np.abs(grid[:, None] - (start + fraction * (target - start))).argmin(axis=0)]
+                value = [int(item) if whole else float(item) for item in np.atleast_1d(value)]
+                values.append(value if node['type'] == 'RangeSlider' else value[0])
+            return values
+
+        options = [option['value'] if isinstance(option, dict) else option for option in props.get('options', [])
+                   if not (isinstance(option, dict) and option.get('disabled'))]
+        if node['type'] == 'Checklist' or (node['type'] == 'Dropdown' and props.get('multi')):
+            chosen = [option for option in options if self.rng.random() < 0.5]
+            return [chosen or ([] if node['type'] == 'Checklist' else options[:1])]
+
+        others = [option for option in options if option != current] or options
+        return [others[int(self.rng.integers(len(others)))]] if others else []
+
+    def run(self, deadline, delay=0.0):
+        """ Load the page and interact with it until the deadline
+        Args:
+            deadline (float): time.perf_counter() value after which no new interaction starts
+            delay (float): seconds to wait before loading the page (for ramping up the users)
+        """
+        time.sleep(delay)
+        self.load_page()
+        self.fire(set(), initial=True)
+
+        while time.perf_counter() < deadline and self.dashboard.choices:
+            component = self.dashboard.choices[int(self.rng.integers(len(self.dashboard.choices)))]
+            for i, value in enumerate(self.choose(component)):
+                if i:
+                    time.sleep(self.drag_pause)
+                with self._lock:
+                    self.values[(component, 'value')] = value
+                self.fire({(component, 'value')})
+            self.recorder.action()
+            if self.think:
+                time.sleep(self.rng.exponential(self.think))
+
+
+def run(url, users=10, duration=30.0, think=1.0, ramp_up=0.0, seed=0, drag_pause=0.1, timeout=60):
+    """ Run a load test
+    Args:
+        url (str): the dashboard's address
+        users (int): simulated users interacting at the same time
+        duration (float): seconds the users keep interacting (after ramping up)
+        think (float): mean seconds each user waits between interactions
+        ramp_up (float): seconds over which the users' page loads are spread
+        seed (int): seed the interactions are drawn from
+        drag_pause (float): seconds between the values sent during a slider drag
+        timeout (float): seconds to wait for a response (or a background callback's result)
+    Returns:
+        (dict): the test's settings and each callback's latencies and throughput (see Recorder.summary)
+    """
+    dashboard = Dashboard(url, timeout)
+    recorder = Recorder()
+    start = time.perf_counter()
+    deadline = start + ramp_up + duration
+
+    with ThreadPoolExecutor(max_workers=users * BROWSER_CONNECTIONS) as pool:
+        threads = [threading.Thread(target=User(dashboard, recorder, pool, i, seed, think, drag_pause).run,
+                                    args=(deadline, ramp_up * i / users), daemon=True)
+                   for i in range(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    summary = recorder.summary(time.perf_counter() - start)
+    summary['settings'] = {'url': url, 'users': users, 'duration': duration, 'think': think, 'ramp_up': ramp_up,
+                           'seed': seed}
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a running dashboard by replaying simulated users')
+    parser.add_argument('--url', default='http://127.0.0.1:8050', help="the dashboard's address")
+    parser.add_argument('--users', type=int, default=10, help='simulated users interacting at the same time')
+    parser.add_argument('--duration', type=float, default=30, help='seconds the users keep interacting')
+    parser.add_argument('--think-ms', type=float, default=1000, help='mean milliseconds between interactions')
+    parser.add_argument('--ramp-up', type=float, default=0, help="seconds over which the users' page loads are spread")
+    parser.add_argument('--drag-ms', type=float, default=100, help='milliseconds between the values of a slider drag')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for a callback result')
+    parser.add_argument('--seed', type=int, default=0, help='seed the interactions are drawn from')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    summary = run(args.url, args.users, args.duration, args.think_ms / 1000, args.ramp_up, args.seed,
+                  args.drag_ms / 1000, args.timeout)
+
+    # print each callback's latencies and throughput
+    print('{:<70} {:>8} {:>7} {:>9} {:>9} {:>9} {:>8}'.format('callback', 'requests', 'errors', 'p50 ms', 'p95 ms',
+                                                              'p99 ms', 'req/s'))
+    for name, stats in sorted(summary['callbacks'].items()):
+        print('{:<70} {:>8} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>8.2f}'.format(
+            name, stats['requests'], stats['errors'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+            stats['throughput']))
+    print('{} users, {} interactions in {:.1f}s'.format(args.users, summary['actions'], summary['seconds']))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(summary, file, indent=4)
+            file.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (memo.py)
+April 19, 2023
+
+memo.py: Memoization of the helper functions that are pure functions of a data frame and their other arguments
+         (e.g. utils.get_x_feat, utils.encode, utils.filt_vals and random_forest_assets.forest_reg)
+
+A data frame argument is identified by a version token instead of by hashing its contents on every call: the first time
+a data frame is seen it is given a new token, which it keeps for as long as it exists (and which is forgotten, together
+with every result computed from it, when it is garbage collected). Data frames passed to memoized functions must
+therefore not be modified in place afterwards; call bump(df) if one is, to give it a new token.
+
+The cached results themselves are never handed out: callers get shallow copies of data frames and series (which pandas'
+copy-on-write keeps from sharing changes with the cached result) with the cached result's token, so they can be passed
+on to other memoized functions without a miss, copies of lists and read-only views of arrays. A caller that changes a
+data frame result in place must bump() it before passing it to a memoized function again. Other results (e.g. fitted
+models) are shared as they are and must not be changed.
+
+The results of all memoized functions share one least recently used cache, bounded by the approximate size of the
+results in bytes (SLEEP_MEMO_MAX_BYTES). Results evicted from memory are written to SLEEP_MEMO_SPILL_DIR, when set, and
+read back from there on their next use. stats() reports the hits, misses and hit ratio of each function.
+"""
+# import statements
+import collections
+import functools
+import hashlib
+import itertools
+import os
+import pickle
+import sys
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+import config
+
+# version tokens of the data frames (and series) seen so far, keyed by id() and removed when the object is collected
+_TOKENS = {}
+_LIVE_TOKENS = set()
+_NEW_TOKEN = itertools.count()
+
+# id()s of the copies of cached results that share the result's token (see _shield)
+_ALIASES = set()
+
+# the cached results, from least to most recently used, with their approximate sizes in bytes
+_CACHE = collections.OrderedDict()
+_SIZES = {}
+_TOTAL = {'bytes': 0}
+
+# cache keys of the results computed from each version token, so they can be dropped with the token
+_KEYS_BY_TOKEN = collections.defaultdict(set)
+
+# cache keys of the results spilled to disk
+_SPILLED = set()
+
+# hits, misses and spills of each memoized function
+_STATS = collections.defaultdict(collections.Counter)
+
+_LOCK = threading.RLock()
+
+# settings of the shared cache
+SETTINGS = {'max_bytes': config.MEMO_MAX_BYTES, 'spill_dir': config.MEMO_SPILL_DIR}
+
+
+def version(obj):
+    """ Get the version token of a data frame or series, giving it a new one the first time it is seen
+    Args:
+        obj (Pandas data frame or series): the data
+    Returns:
+        (int): the version token
+    """
+    with _LOCK:
+        token = _TOKENS.get(id(obj))
+        if token is None:
+            token = _new_token(obj)
+
+        return token
+
+
+def bump(obj):
+    """ Give a data frame or series a new version token, after it has been modified in place
+    Args:
+        obj (Pandas data frame or series): the modified data
+    Returns:
+        (int): the new version token
+    """
+    with _LOCK:
+        old = _TOKENS.pop(id(obj), None)
+
+        # a copy of a cached result only stops sharing the result's token; the result itself is unchanged
+        if old is not None and id(obj) not in _ALIASES:
+            _drop_token(old)
+        _ALIASES.discard(id(obj))
+
+        return _new_token(obj)
+
+
+def _new_token(obj):
+    """ Give an object a new version token that is forgotten when the object is collected """
+    token = next(_NEW_TOKEN)
+    _TOKENS[id(obj)] = token
+    _LIVE_TOKENS.add(token)
+    weakref.finalize(obj, _forget, id(obj), token)
+
+    return token
+
+
+def _forget(obj_id, token):
+    """ Forget a collected object's token and every result computed from it """
+    with _LOCK:
+        if _TOKENS.get(obj_id) == token:
+            del _TOKENS[obj_id]
+        _drop_token(token)
+
+
+def _alias(obj, token):
+    """ Give a copy of a cached result the result's token, until the copy is collected or bumped """
+    with _LOCK:
+        _TOKENS[id(obj)] = token
+        _ALIASES.add(id(obj))
+        weakref.finalize(obj, _forget_alias, id(obj), token)
+
+
+def _forget_alias(obj_id, token):
+    """ Forget a collected copy's token, keeping the results computed from it for the cached result """
+    with _LOCK:
+        if _TOKENS.get(obj_id) == token and obj_id in _ALIASES:
+            del _TOKENS[obj_id]
+            _ALIASES.discard(obj_id)
+
+
+def _shield(value):
+    """ Give a caller a result it can't change the cached one through
+    Args:
+        value: the cached result
+    Returns:
+        a shallow copy of a data frame or series (with the result's token), a read-only view of an array, a copy of a
+        list or tuple with each item shielded, or anything else as it is
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        copy = value.copy(deep=False)
+        _alias(copy, version(value))
+        return copy
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, (list, tuple)):
+        return type(value)(_shield(item) for item in value)
+    return value
+
+
+def _drop_token(token):
+    """ Drop the cached (and spilled) results computed from a version token """
+    _LIVE_TOKENS.discard(token)
+    for key in _KEYS_BY_TOKEN.pop(token, ()):
+        if key in _CACHE:
+            del _CACHE[key]
+            _TOTAL['bytes'] -= _SIZES.pop(key)
+        if key in _SPILLED:
+            _remove_spilled(key)
+
+
+def _remove_spilled(key):
+    """ Delete a spilled result's file """
+    _SPILLED.discard(key)
+    try:
+        os.remove(_spill_path(key))
+    except (OSError, TypeError):
+        pass
+
+
+def _freeze(value, tokens):
+    """ Turn an argument into a hashable part of a cache key
+    Args:
+        value: the argument
+        tokens (list): collects the version tokens of the data frames in the argument
+    Returns:
+        the hashable key part
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        token = version(value)
+        tokens.append(token)
+        return ('data', token)
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(_freeze(item, tokens) for item in value)
+    if isinstance(value, dict):
+        return ('dict',) + tuple(sorted((key, _freeze(item, tokens)) for key, item in value.items()))
+    if isinstance(value, np.ndarray):
+        return ('array', value.dtype.str, value.shape, hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest())
+    hash(value)
+    return value
+
+
+def _sizeof(value):
+    """ Estimate how many bytes a result takes up in memory """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True, deep=False)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(item) for item in value)
+    # anything else (e.g. a fitted model, which would have to be pickled to be measured) counts as its shallow size
+    return sys.getsizeof(value)
+
+
+def _spill_path(key):
+    """ Name of the file a result is spilled to, or None if spilling is off """
+    if not SETTINGS['spill_dir']:
+        return None
+    name = hashlib.sha256(repr((os.getpid(), key)).encode()).hexdigest()
+    return os.path.join(SETTINGS['spill_dir'], name + '.pkl')
+
+
+def _store(key, value, tokens):
+    """ Cache a result, evicting (and spilling) the least recently used results to stay within the byte limit
+    Returns:
+        (bool): whether the result was cached
+    """
+    size = _sizeof(value)
+    if size > SETTINGS['max_bytes']:
+        return False
+
+    with _LOCK:
+        # a data frame may have been collected while the result was computed
+        if any(token not in _LIVE_TOKENS for token in tokens):
+            return False
+        if key in _CACHE:
+            _TOTAL['bytes'] -= _SIZES[key]
+        _CACHE[key] = value
+        _CACHE.move_to_end(key)
+        _SIZES[key] = size
+        _TOTAL['bytes'] += size
+        for token in tokens:
+            _KEYS_BY_TOKEN[token].add(key)
+
+        while _TOTAL['bytes'] > SETTINGS['max_bytes']:
+            old_key, old_value = _CACHE.popitem(last=False)
+            _TOTAL['bytes'] -= _SIZES.pop(old_key)
+            _STATS[old_key[0]]['evictions'] += 1
+            _spill(old_key, old_value)
+
+    return True
+
+
+def _spill(key, value):
+    """ Write an evicted result to the spill directory """
+    path = _spill_path(key)
+    if path is None:
+        return
+    try:
+        os.makedirs(SETTINGS['spill_dir'], exist_ok=True)
+        with open(path, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        _SPILLED.add(key)
+        _STATS[key[0]]['spills'] += 1
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):
+        pass
+
+
+def _unspill(key):
+    """ Read a spilled result back, or return None if it wasn't spilled """
+    with _LOCK:
+        if key not in _SPILLED:
+            return None
+    try:
+        with open(_spill_path(key), 'rb') as file:
+            value = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        value = None
+    with _LOCK:
+        _remove_spilled(key)
+
+    return value
+
+
+def memoize(func):
+    """ Cache a function's results in the shared cache, keyed by its arguments and the versions of its data frames
+    Args:
+        func (function): a pure function of its arguments
+    Returns:
+        wrapper (function): the memoized function
+    """
+    name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tokens = []
+        try:
+            key = (name, _freeze(args, tokens), _freeze(kwargs, tokens))
+        except TypeError:
+            # arguments that can't be part of a key (e.g. unhashable objects) are not cached
+            _STATS[name]['uncacheable'] += 1
+            return func(*args, **kwargs)
+
+        with _LOCK:
+            if key in _CACHE:
+                _CACHE.move_to_end(key)
+                _STATS[name]['hits'] += 1
+                return _shield(_CACHE[key])
+
+        value = _unspill(key)
+        if value is not None:
+            _STATS[name]['disk_hits'] += 1
+        else:
+            _STATS[name]['misses'] += 1
+            value = func(*args, **kwargs)
+
+        # a result that isn't cached is the caller's alone
+        return _shield(value) if _store(key, value, tokens) else value
+
+    wrapper.__memoized__ = True
+    return wrapper
+
+
+def stats():
+    """ Report how well the cache is doing
+    Returns:
+        (dict): each memoized function's hits, disk hits, misses, evictions, spills and hit ratio, and the cache's size
+    """
+    with _LOCK:
+        report = {}
+        for name, counts in sorted(_STATS.items()):
+            calls = counts['hits'] + counts['disk_hits'] + counts['misses']
+            report[name] = dict(counts, hit_ratio=round((counts['hits'] + counts['disk_hits']) / calls, 4)
+                                if calls else None)
+
+        return {'functions': report, 'entries': len(_CACHE), 'bytes': _TOTAL['bytes'],
+                'max_bytes': SETTINGS['max_bytes']}
+
+
+def clear():
+    """ Empty the cache and forget its statistics (the data frames keep their version tokens) """
+    with _LOCK:
+        for key in list(_SPILLED):
+            _remove_spilled(key)
+        _CACHE.clear()
+        _SIZES.clear()
+        _KEYS_BY_TOKEN.clear()
+        _TOTAL['bytes'] = 0
+        _STATS.clear()
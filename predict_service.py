@@ -0,0 +1,281 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (predict_service.py)
+April 19, 2023
+
+predict_service.py: A standalone HTTP/JSON service that predicts a user's sleep efficiency, REM sleep percentage and
+                    deep sleep percentage with the dashboard's random forest regressors, for apps other than the
+                    dashboard
+
+The models are loaded once at startup from the model cache shared with the dashboard (see rf.load_or_train), and are
+trained and cached first if they aren't there yet. Requests that arrive at about the same time are grouped into one
+micro-batch, so each model makes a single vectorized prediction for all of them: a batch is predicted as soon as it
+holds --max-batch users or its first request has waited --max-wait-ms milliseconds.
+
+Endpoints:
+    POST /predict    a JSON object (or list of objects) with the keys age, bedtime, wakeuptime, awakenings, caffeine,
+                     alcohol, exercise, gender and smoke, as in utils.predict_sleep_quality; answers with an object (or
+                     list of objects) mapping each predicted statistic to its value, or with a 400 naming the first
+                     missing, out of range or unknown value
+    GET  /stats      number of requests, throughput, latency percentiles and mean batch size
+    GET  /health     whether the service is up
+
+Usage:
+    python predict_service.py --port 8060 --max-batch 64 --max-wait-ms 2
+"""
+# import statements
+import argparse
+import collections
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+import config
+import utils
+import random_forest_assets as rf
+
+# the sleep statistics the service predicts
+PREDICTED_STATS = ['Sleep efficiency', 'REM sleep percentage', 'Deep sleep percentage']
+
+# the keys of a prediction request, in the order of utils.user_features' arguments
+FEATURE_KEYS = ['age', 'bedtime', 'wakeuptime', 'awakenings', 'caffeine', 'alcohol', 'exercise', 'gender', 'smoke']
+
+# the keys of a request that hold numbers, mapped to the column of the data whose range they must be within (None for
+# times, which are hours into the day)
+NUMERIC_KEYS = {'age': 'Age', 'bedtime': None, 'wakeuptime': None, 'awakenings': 'Awakenings',
+                'caffeine': 'Caffeine consumption 24 hrs before sleeping (mg)',
+                'alcohol': 'Alcohol consumption 24 hrs before sleeping (oz)',
+                'exercise': 'Exercise frequency (in days per week)'}
+
+# the keys of a request that hold categories, mapped to the column of the data whose categories they must be
+CATEGORY_KEYS = {'gender': 'Gender', 'smoke': 'Smoking status'}
+
+# number of recent requests the latency percentiles and throughput are computed from
+STATS_WINDOW = 10000
+
+
+class MicroBatcher:
+    """ Groups the feature rows of concurrent requests into batches that are predicted together on one thread """
+
+    def __init__(self, predict, max_batch=64, max_wait=0.002):
+        """ Start the batching thread
+        Args:
+            predict (function): maps a 2D array of feature rows to a 2D array with a row of predictions for each
+            max_batch (int): a batch is predicted once it holds this many rows
+            max_wait (float): seconds a batch waits for more rows after its first request arrives
+        """
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        """ Queue feature rows to be predicted in the next batch
+        Args:
+            rows (list of lists): the feature rows of one request
+        Returns:
+            (Future): resolves to the rows' predictions and the size of the batch they were predicted in
+        """
+        future = Future()
+        self._queue.put((rows, future))
+        return future
+
+    def _run(self):
+        """ Collect and predict batches until the process exits """
+        while True:
+            # wait for a request, then for more until the batch is full or its deadline passes
+            requests = [self._queue.get()]
+            size = len(requests[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    requests.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                size += len(requests[-1][0])
+
+            try:
+                y_pred = self.predict(np.array([row for rows, future in requests for row in rows], dtype=float))
+            except Exception as error:
+                for rows, future in requests:
+                    future.set_exception(error)
+                continue
+
+            # hand each request its own slice of the batch's predictions
+            start = 0
+            for rows, future in requests:
+                future.set_result((y_pred[start:start + len(rows)], size))
+                start += len(rows)
+
+
+class ServiceStats:
+    """ Latency and batch size measurements of the most recent requests """
+
+    def __init__(self, window=STATS_WINDOW):
+        """ Start with no measurements
+        Args:
+            window (int): number of recent requests to keep measurements for
+        """
+        self.started = time.monotonic()
+        self.count = 0
+        self._requests = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, batch_size):
+        """ Record one request
+        Args:
+            latency (float): seconds the request took, from parsing to answering
+            batch_size (int): number of rows in the batch the request was predicted in
+        """
+        with self._lock:
+            self.count += 1
+            self._requests.append((time.monotonic(), latency, batch_size))
+
+    def summary(self):
+        """ Summarize the recent requests
+        Returns:
+            (dict): request count, throughput (requests per second), latency percentiles (milliseconds) and mean batch
+                    size
+        """
+        with self._lock:
+            count = self.count
+            recent = np.array(self._requests) if self._requests else np.empty((0, 3))
+
+        summary = {'requests': count, 'uptime_seconds': round(time.monotonic() - self.started, 3)}
+        if len(recent):
+            p50, p95, p99 = np.percentile(recent[:, 1], [50, 95, 99]) * 1000
+            elapsed = max(recent[-1, 0] - recent[0, 0], 1e-9)
+            summary.update(throughput=round(len(recent) / elapsed, 1) if len(recent) > 1 else None,
+                           latency_ms={'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3)},
+                           mean_batch_size=round(float(recent[:, 2].mean()), 2))
+
+        return summary
+
+
+def load_models(df, model_dir=config.MODEL_DIR):
+    """ Load (or train and cache) the random forest regressors the dashboard uses
+    Args:
+        df (Pandas data frame): the parsed sleep data
+        model_dir (str): directory of the model cache
+    Returns:
+        (list): a fitted regressor for each of PREDICTED_STATS
+    """
+    # the dashboard's predictor uses the same models, trained on every row, so they are shared through the model cache;
+    # predicting a batch on one core avoids the cost of starting threads for every batch
+    return [rf.load_or_train(focus_col, df, model_dir, n_jobs=1) for focus_col in PREDICTED_STATS]
+
+
+def feature_limits(df):
+    """ Find the range of values each numeric key of a request may have: the range of its column in the data the models
+        were trained on, or a day's hours for times
+    Args:
+        df (Pandas data frame): the parsed sleep data
+    Returns:
+        (dict): maps each of NUMERIC_KEYS to its (least, most) value
+    """
+    return {key: (0.0, 24.0) if col is None else (float(df[col].min()), float(df[col].max()))
+            for key, col in NUMERIC_KEYS.items()}
+
+
+def check_user(user, limits):
+    """ Find what is wrong with a user's information, if anything, before it is turned into features
+    Args:
+        user: the user's information from the request body
+        limits (dict): the range of each numeric key (see feature_limits)
+    Returns:
+        (str): a message naming the offending key, or None if the user can be predicted
+    """
+    if not isinstance(user, dict) or any(key not in user for key in FEATURE_KEYS):
+        return 'each user needs the keys ' + ', '.join(FEATURE_KEYS)
+
+    # NaN and infinite values would be predicted from as they are, so they are rejected with anything out of range
+    for key, (least, most) in limits.items():
+        try:
+            value = float(user[key])
+        except (TypeError, ValueError):
+            value = math.nan
+        if not (math.isfinite(value) and least <= value <= most):
+            return '{} must be a number from {:g} to {:g}'.format(key, least, most)
+
+    # unknown categories would be encoded as the first category
+    for key, col in CATEGORY_KEYS.items():
+        labels = utils.USER_LABELS.get(col, {})
+        if not isinstance(user[key], str) or labels.get(user[key], user[key]) not in utils.CATEGORIES[col]:
+            return '{} must be one of {}'.format(key, ', '.join(list(labels) + utils.CATEGORIES[col]))
+
+    return None
+
+
+def create_app(models, limits, max_batch=64, max_wait=0.002):
+    """ Create the service's web application
+    Args:
+        models (list): a fitted regressor for each of PREDICTED_STATS
+        limits (dict): the range of each numeric key of a request (see feature_limits)
+        max_batch (int): a batch is predicted once it holds this many users
+        max_wait (float): seconds a batch waits for more users after its first request arrives
+    Returns:
+        app (Flask): the service
+    """
+    import flask
+
+    app = flask.Flask(__name__)
+    stats = ServiceStats()
+    encoder = utils.feature_encoder(models[0])
+    batcher = MicroBatcher(lambda x: np.column_stack([model.predict(x) for model in models]), max_batch, max_wait)
+
+    @app.route('/predict', methods=['POST'])
+    def predict():
+        start = time.perf_counter()
+        body = flask.request.get_json(silent=True)
+        users = body if isinstance(body, list) else [body]
+        if not users:
+            return flask.jsonify({'error': 'the request has no users to predict'}), 400
+        for user in users:
+            error = check_user(user, limits)
+            if error is not None:
+                return flask.jsonify({'error': error}), 400
+        rows = [utils.user_features(*[float(user[key]) if key in NUMERIC_KEYS else user[key] for key in FEATURE_KEYS],
+                                    encoder=encoder)
+                for user in users]
+
+        y_pred, batch_size = batcher.submit(rows).result()
+        answers = [dict(zip(PREDICTED_STATS, (round(float(value), 2) for value in user_pred))) for user_pred in y_pred]
+
+        stats.record(time.perf_counter() - start, batch_size)
+        return flask.jsonify(answers if isinstance(body, list) else answers[0])
+
+    @app.route('/stats')
+    def show_stats():
+        return flask.jsonify(stats.summary())
+
+    @app.route('/health')
+    def health():
+        return flask.jsonify({'status': 'ok'})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve sleep quality predictions over HTTP')
+    parser.add_argument('--host', default='127.0.0.1', help='address to serve on')
+    parser.add_argument('--port', type=int, default=8060, help='port to serve on')
+    parser.add_argument('--max-batch', type=int, default=64, help='users predicted together at most')
+    parser.add_argument('--max-wait-ms', type=float, default=2, help='milliseconds a batch waits for more users')
+    args = parser.parse_args()
+
+    # load the models once, before accepting requests
+    df_sleep = utils.parse_times(utils.read_file(config.DATA_FILE))
+    app = create_app(load_models(df_sleep), feature_limits(df_sleep), args.max_batch, args.max_wait_ms / 1000)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
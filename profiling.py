@@ -0,0 +1,211 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (profiling.py)
+April 19, 2023
+
+profiling.py: On-demand profiling of the dashboard's callback requests in a running server. A callback request is
+              profiled when it carries the X-Sleep-Profile header or the profile query parameter, or when it arrives
+              during a profiling window opened with POST /profiling/start?seconds=60&token=... (closed early with
+              POST /profiling/stop?token=...). Each profiled request writes three files to the profile directory:
+                  <name>.prof         cProfile statistics (snakeviz, flameprof, pstats)
+                  <name>.folded       sampled stacks in the folded format read by flamegraph.pl and speedscope
+                  <name>.tracemalloc  a tracemalloc snapshot of the memory allocated while handling the request
+
+Turn it on by setting SLEEP_PROFILE_DIR (and optionally SLEEP_PROFILE_TOKEN, which the header or query parameter must
+then equal) in the environment (see config.py). The profiling window endpoints profile every visitor's requests, so they
+only exist when SLEEP_PROFILE_TOKEN is set. Callbacks that run as background jobs are only profiled up to submitting the
+job.
+"""
+# import statements
+import cProfile
+import collections
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+# seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+# longest profiling window that /profiling/start opens
+MAX_WINDOW_SECONDS = 600
+
+# number of frames kept per tracemalloc allocation traceback
+TRACEMALLOC_FRAMES = 25
+
+# end of the current profiling window (time.monotonic seconds); requests before it are all profiled
+_WINDOW = {'end': 0.0}
+
+# number of requests currently tracing memory allocations, so tracemalloc is stopped after the last of them
+_TRACING = {'count': 0}
+_LOCK = threading.Lock()
+
+# numbers profiled requests so their file names stay unique
+_COUNTER = itertools.count()
+
+
+class StackSampler:
+    """ Sampling profiler for a single thread; records how often each call stack is seen """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        """ Prepare to sample a thread
+        Args:
+            thread_id (int): identifier of the thread to sample
+            interval (float): seconds between samples
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        """ Sample the thread's call stack until stopped """
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename),
+                                                 code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        """ Start sampling """
+        self._thread.start()
+
+    def stop(self):
+        """ Stop sampling """
+        self._stopped.set()
+        self._thread.join()
+
+    def write(self, filename):
+        """ Write the sampled stacks in the folded format ('frame;frame;frame count' per line)
+        Args:
+            filename (str): name of the file to write
+        """
+        with open(filename, 'w') as file:
+            for stack, count in self.counts.most_common():
+                file.write('{} {}\n'.format(stack, count))
+
+
+def open_window(seconds):
+    """ Profile every callback request for a while
+    Args:
+        seconds (float): length of the profiling window
+    """
+    _WINDOW['end'] = time.monotonic() + seconds
+
+
+def close_window():
+    """ End the current profiling window """
+    _WINDOW['end'] = 0.0
+
+
+def start_tracing():
+    """ Start tracing memory allocations, unless another profiled request already is """
+    with _LOCK:
+        if _TRACING['count'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _TRACING['count'] += 1
+
+
+def stop_tracing(filename):
+    """ Write a snapshot of the traced memory allocations, stopping the tracing after the last profiled request
+    Args:
+        filename (str): name of the file to write the snapshot to
+    """
+    with _LOCK:
+        # leave out the profilers' own allocations
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, cProfile.__file__),
+                                                               tracemalloc.Filter(False, tracemalloc.__file__),
+                                                               tracemalloc.Filter(False, __file__)])
+        snapshot.dump(filename)
+        _TRACING['count'] -= 1
+        if _TRACING['count'] == 0:
+            tracemalloc.stop()
+
+
+def install(app, directory, token=None):
+    """ Add the profiling hooks, and the /profiling/start and /profiling/stop endpoints when there is a token, to a
+        Dash app
+    Args:
+        app (Dash): the dashboard
+        directory (str): directory the profiles are written to
+        token (str): value the header or query parameter must have to profile a request or open a profiling window, or
+                     None to accept any value and leave out the profiling window endpoints
+    """
+    import flask
+
+    os.makedirs(directory, exist_ok=True)
+
+    def requested(value):
+        """ Check whether a header or query parameter value asks for profiling """
+        return value is not None and (value == token if token else value not in ('', '0', 'false'))
+
+    @app.server.before_request
+    def start_profiling():
+        if not flask.request.path.endswith('_dash-update-component'):
+            return
+        if not (requested(flask.request.headers.get('X-Sleep-Profile'))
+                or requested(flask.request.args.get('profile')) or time.monotonic() < _WINDOW['end']):
+            return
+
+        # name the files after the callback's outputs
+        body = flask.request.get_json(silent=True) or {}
+        output = re.sub(r'[^A-Za-z0-9_-]+', '_', str(body.get('output', 'callback'))).strip('_')[:80]
+        flask.g.profile_name = os.path.join(directory, '{}-{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'),
+                                                                         next(_COUNTER), output))
+
+        start_tracing()
+        flask.g.sampler = StackSampler(threading.get_ident())
+        flask.g.sampler.start()
+
+        # newer Pythons allow only one cProfile profiler at a time; concurrent requests then only get sampled
+        flask.g.profiler = cProfile.Profile()
+        try:
+            flask.g.profiler.enable()
+        except ValueError:
+            flask.g.profiler = None
+
+    @app.server.teardown_request
+    def stop_profiling(error=None):
+        if 'sampler' not in flask.g:
+            return
+
+        if flask.g.profiler is not None:
+            flask.g.profiler.disable()
+            flask.g.profiler.dump_stats(flask.g.profile_name + '.prof')
+        flask.g.sampler.stop()
+        flask.g.sampler.write(flask.g.profile_name + '.folded')
+        stop_tracing(flask.g.profile_name + '.tracemalloc')
+
+    # without a token anyone could profile every request and fill the disk, so there is no profiling window
+    if not token:
+        return
+
+    @app.server.route('/profiling/start', methods=['POST'])
+    def start_window():
+        if flask.request.values.get('token') != token:
+            flask.abort(403)
+        try:
+            seconds = float(flask.request.values.get('seconds', 60))
+        except ValueError:
+            flask.abort(400)
+        if not 0 <= seconds <= MAX_WINDOW_SECONDS:
+            flask.abort(400)
+        open_window(seconds)
+        return flask.jsonify({'profiling_seconds': seconds, 'directory': os.path.abspath(directory)})
+
+    @app.server.route('/profiling/stop', methods=['POST'])
+    def stop_window():
+        if flask.request.values.get('token') != token:
+            flask.abort(403)
+        close_window()
+        return flask.jsonify({'profiling_seconds': 0})
@@ -7,37 +7,219 @@ April 19, 2023
 random_forest_assets.py: Generic functions associated with random forest regressors and feature importance metrics
 """
 # import statements
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
+import copy
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import plotly.express as px
+import cache_backend
+import config
+import memo
 import utils
 
+# fraction of the rows held out from training, so the models can be evaluated on rows they have not seen
+HOLDOUT_FRACTION = 0.2
 
-def forest_reg(focus_col, df):
+# number of times each feature is shuffled when computing permutation importances
+PERMUTATION_REPEATS = 10
+
+# most sets of permutation importances kept in memory
+IMPORTANCE_CACHE_ENTRIES = 64
+
+# permutation importances already computed, keyed by (model version, repeats, seed); the least recently used are dropped
+_IMPORTANCES = cache_backend.MemoryTier(IMPORTANCE_CACHE_ENTRIES)
+
+# the model and held-out rows shared by the permutation importance computations, set once per worker process
+_IMPORTANCE_STATE = {}
+
+
+@memo.memoize
+def forest_reg(focus_col, df, seed=config.SEED, n_jobs=config.FOREST_JOBS, n_estimators=config.FOREST_TREES,
+               max_samples=config.FOREST_MAX_SAMPLES):
     """ Builds a random forest regressor model that predicts a y-variable
     Args:
         focus_col (str): name of the y-variable of interest
         df (pd.DataFrame): dataframe of interest that contains data used to train the regressor
+        seed (int): seed for the regressor's bootstrap samples and feature choices
+        n_jobs (int): number of CPU cores the trees are trained on (-1 for all of them)
+        n_estimators (int): number of trees
+        max_samples (int or float): number (or fraction) of rows in each tree's bootstrap sample; None for all rows
     Returns:
         random_forest_reg: fitted random forest regressor that predicts the y-variable based on the inputted data set
     """
-    # retrieve the x features for the random forest regressor
-    df, x_feat_list = utils.get_x_feat(df)
+    # scikit-learn is slow to import, so it is only loaded once a model is actually trained
+    from sklearn.ensemble import RandomForestRegressor
 
-    # extract data from dataframe
-    x = df.loc[:, x_feat_list].values
+    # encode the x features for the random forest regressor (as the float32 matrix it trains on, shared by the
+    # regressors of every target); the encoder is kept with the regressor, so predictions encode their inputs in the
+    # same feature order
+    encoder, x = utils.encode_features(df)
     y = df.loc[:, focus_col].values
 
-    # initialize a random forest regressor
-    random_forest_reg = RandomForestRegressor()
+    # initialize a random forest regressor; warm_start lets grow_forest add trees to it later
+    random_forest_reg = RandomForestRegressor(random_state=seed, n_jobs=n_jobs, n_estimators=n_estimators,
+                                              max_samples=max_samples, warm_start=True)
 
     # fit the data extracted from the data frame
     random_forest_reg.fit(x, y)
+    random_forest_reg.feature_encoder_ = encoder
+
+    return random_forest_reg
+
+
+def load_or_train(focus_col, df, directory=config.MODEL_DIR, seed=config.SEED, n_jobs=config.FOREST_JOBS,
+                  n_estimators=config.FOREST_TREES, max_samples=config.FOREST_MAX_SAMPLES):
+    """ Load a trained random forest regressor from the model cache, training and saving it there if it isn't cached yet
+    Args:
+        focus_col (str): name of the y-variable of interest
+        df (pd.DataFrame): dataframe of interest that contains data used to train the regressor
+        directory (str): directory of the model cache; None to always train
+        seed, n_jobs, n_estimators, max_samples: training settings (see forest_reg)
+    Returns:
+        random_forest_reg: fitted random forest regressor that predicts the y-variable based on the inputted data set
+    """
+    if directory is None:
+        return forest_reg(focus_col, df, seed, n_jobs, n_estimators, max_samples)
+
+    # models are cached under their fingerprint, so a change in the data or the settings trains a new one
+    fingerprint = utils.model_fingerprint(focus_col, df, seed, n_estimators=n_estimators, max_samples=max_samples)
+    filename = os.path.join(directory, '{}-{}.pkl'.format(re.sub(r'\W+', '_', focus_col).lower(), fingerprint))
+    if os.path.exists(filename):
+        with open(filename, 'rb') as file:
+            random_forest_reg = pickle.load(file)
+        random_forest_reg.n_jobs = n_jobs
+        return random_forest_reg
+
+    random_forest_reg = forest_reg(focus_col, df, seed, n_jobs, n_estimators, max_samples)
+
+    # write to a temporary file first, so other processes never load a partly written model
+    os.makedirs(directory, exist_ok=True)
+    temporary = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(temporary, 'wb') as file:
+        pickle.dump(random_forest_reg, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, filename)
+
+    return random_forest_reg
+
+
+def grow_forest(random_forest_reg, focus_col, df, n_new_trees):
+    """ Add trees to a fitted random forest regressor instead of retraining it from scratch (e.g. when new data arrives)
+    Args:
+        random_forest_reg: the fitted regressor from forest_reg; it is left unchanged, since forest_reg's results are
+                           cached
+        focus_col (str): name of the y-variable of interest
+        df (pd.DataFrame): the data the new trees are trained on (e.g. the old data together with the new rows)
+        n_new_trees (int): number of trees to add
+    Returns:
+        random_forest_reg: a copy of the regressor, with its existing trees kept as they are and the new trees added
+    """
+    # the new trees are trained on the features the existing ones were
+    x = utils.feature_encoder(random_forest_reg).transform(df, np.float32)
+
+    # with warm_start, fitting only trains the trees beyond the ones already in the forest
+    random_forest_reg = copy.deepcopy(random_forest_reg)
+    random_forest_reg.set_params(warm_start=True, n_estimators=len(random_forest_reg.estimators_) + n_new_trees)
+    random_forest_reg.fit(x, df.loc[:, focus_col].values)
 
     return random_forest_reg
 
 
+def split_holdout(df, fraction=HOLDOUT_FRACTION, seed=config.SEED):
+    """ Split a data frame into training rows and held-out rows, the same way every time
+    Args:
+        df (pd.DataFrame): the data frame to split
+        fraction (float): fraction of the rows to hold out
+        seed (int): seed for choosing the held-out rows
+    Returns:
+        df_train (pd.DataFrame): the training rows
+        df_holdout (pd.DataFrame): the held-out rows
+    """
+    order = np.random.default_rng(seed).permutation(len(df))
+    holdout_rows = int(round(len(df) * fraction))
+
+    return df.iloc[np.sort(order[holdout_rows:])], df.iloc[np.sort(order[:holdout_rows])]
+
+
+def _permuted_scores(random_forest_reg, x, y, col, n_repeats, seed):
+    """ Compute a model's r^2 value on rows where one feature has been shuffled, once per repeat
+    Args:
+        random_forest_reg: the fitted model
+        x (np.array): the held-out rows' features
+        y (np.array): the held-out rows' y-variable
+        col (int): position of the feature to shuffle
+        n_repeats (int): number of times to shuffle the feature
+        seed (int): seed for the shuffles
+    Returns:
+        (np.array): the r^2 value of each repeat
+    """
+    rows = len(x)
+    rng = np.random.default_rng([seed, col])
+
+    # stack every shuffled copy of the rows so the model predicts all of them in one batch
+    batch = np.tile(x, (n_repeats, 1))
+    for repeat in range(n_repeats):
+        batch[repeat * rows:(repeat + 1) * rows, col] = rng.permutation(x[:, col])
+    y_pred = random_forest_reg.predict(batch).reshape(n_repeats, rows)
+
+    return 1 - ((y_pred - y) ** 2).sum(axis=1) / ((y - y.mean()) ** 2).sum()
+
+
+def _init_importance_worker(random_forest_reg, x, y):
+    """ Keep the model and held-out rows in a worker process """
+    _IMPORTANCE_STATE.update(random_forest_reg=random_forest_reg, x=x, y=y)
+
+
+def _permuted_scores_worker(col, n_repeats, seed):
+    """ Compute the permuted r^2 values of one feature in a worker process """
+    return _permuted_scores(_IMPORTANCE_STATE['random_forest_reg'], _IMPORTANCE_STATE['x'], _IMPORTANCE_STATE['y'],
+                            col, n_repeats, seed)
+
+
+def permutation_importance(random_forest_reg, x, y, n_repeats=PERMUTATION_REPEATS, seed=config.SEED, workers=1,
+                           version=None):
+    """ Compute how much a model's r^2 value on held-out rows drops when each feature is shuffled
+    Args:
+        random_forest_reg: the fitted model
+        x (np.array): the held-out rows' features, in the order the model was trained on
+        y (np.array): the held-out rows' y-variable
+        n_repeats (int): number of times each feature is shuffled
+        seed (int): seed for the shuffles
+        workers (int): number of worker processes the features are divided among, in a pool started for this call;
+                       1 computes everything in this process (best inside the dashboard's threaded server); None uses
+                       every CPU
+        version (hashable): identifies the model and held-out rows (e.g. utils.model_fingerprint); results are cached
+                            under it when passed
+    Returns:
+        importances (np.array): the mean drop in r^2 value for each feature
+    """
+    key = (version, n_repeats, seed)
+    if version is not None:
+        importances = _IMPORTANCES.get(key)
+        if importances is not None:
+            return importances
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    cols = range(x.shape[1])
+    workers = min(workers or os.cpu_count(), len(cols))
+
+    # the r^2 value without shuffling is computed once and compared against every feature's shuffles
+    baseline = 1 - ((random_forest_reg.predict(x) - y) ** 2).sum() / ((y - y.mean()) ** 2).sum()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_importance_worker,
+                                 initargs=(random_forest_reg, x, y)) as executor:
+            scores = list(executor.map(_permuted_scores_worker, cols, [n_repeats] * len(cols), [seed] * len(cols)))
+    else:
+        scores = [_permuted_scores(random_forest_reg, x, y, col, n_repeats, seed) for col in cols]
+
+    importances = baseline - np.array([col_scores.mean() for col_scores in scores])
+    if version is not None:
+        _IMPORTANCES.set(key, importances)
+
+    return importances
+
+
 def plot_feat_import_rf_reg(feat_list, feat_import, sort=True, limit=None):
     """ plots feature importance values in a horizontal bar chart
 
@@ -45,12 +227,15 @@ def plot_feat_import_rf_reg(feat_list, feat_import, sort=True, limit=None):
 
     Args:
         feat_list (list): str names of features
-        feat_import (np.array): feature importance values (mean MSE reduce)
+        feat_import (np.array): feature importance values (e.g. mean MSE reduce or permutation importances)
         sort (bool): if True, sorts features in decreasing importance from top to bottom of plot
         limit (int): if passed, limits the number of features shown to this value
     Returns:
         fig (px.bar): the feature importance bar chart
     """
+    # plotly express is imported on first use to keep the dashboard's startup fast
+    import plotly.express as px
+
     if sort:
         # sort features by decreasing importance
         idx = np.argsort(feat_import).astype(int)
@@ -0,0 +1,172 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (shared_data.py)
+April 19, 2023
+
+shared_data.py: Publishes the cleaned sleep data frame into a named shared-memory segment so that every dashboard worker
+                process can attach to one read-only copy instead of holding its own
+
+Usage:
+    python shared_data.py data/Sleep_Efficiency.csv sleep_efficiency
+    SLEEP_SHARED_DATA=sleep_efficiency gunicorn -w 4 sleep:server
+
+The segment starts with an 8-byte length followed by a JSON manifest describing each column (dtype, offset, categories),
+followed by the column values themselves. String columns are stored as integer category codes.
+"""
+# import statements
+import json
+import signal
+import sys
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+import utils
+
+# number of bytes used to store the length of the manifest at the start of the segment
+HEADER_BYTES = 8
+
+# column values are aligned to this many bytes inside the segment
+ALIGNMENT = 64
+
+# name used for the data frame index inside the manifest
+INDEX_COL = '__index__'
+
+# segments attached by this process; kept referenced so their buffers stay mapped while data frames use them
+_ATTACHED = {}
+
+
+def _align(offset):
+    """ Round an offset up to the next multiple of the alignment
+    Args:
+        offset (int): byte offset
+    Returns:
+        (int): the aligned byte offset
+    """
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _column_arrays(df):
+    """ Convert the index and columns of a data frame into flat numpy arrays
+    Args:
+        df (Pandas data frame): the data frame to convert
+    Returns:
+        arrays (list of tuples): (name, values, categories) for the index and every column; categories is None unless
+                                 the values are category codes
+    """
+    arrays = [(INDEX_COL, np.ascontiguousarray(df.index.to_numpy()), None)]
+    for col in df.columns:
+        series = df[col]
+
+        # strings and categoricals are stored as their integer codes
+        if not pd.api.types.is_numeric_dtype(series.dtype):
+            categorical = pd.Categorical(series)
+            arrays.append((col, np.ascontiguousarray(categorical.codes), [str(cat) for cat in categorical.categories]))
+        else:
+            arrays.append((col, np.ascontiguousarray(series.to_numpy()), None))
+
+    return arrays
+
+
+def publish(df, name):
+    """ Copy a data frame into a new named shared-memory segment
+    Args:
+        df (Pandas data frame): the data frame to publish; every column must be numeric, boolean, categorical or string
+        name (str): name of the shared-memory segment to create
+    Returns:
+        shm (SharedMemory): the created segment; the caller must keep it open and unlink it when finished
+    """
+    # lay out the columns one after another, each aligned
+    arrays = _column_arrays(df)
+    columns = []
+    offset = 0
+    for col, values, categories in arrays:
+        offset = _align(offset)
+        columns.append({'name': col, 'dtype': values.dtype.str, 'offset': offset, 'categories': categories})
+        offset += values.nbytes
+
+    manifest = json.dumps({'rows': len(df), 'columns': columns}).encode()
+    data_start = _align(HEADER_BYTES + len(manifest))
+
+    # create the segment and write the manifest followed by the column values
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(data_start + offset, 1))
+    shm.buf[:HEADER_BYTES] = len(manifest).to_bytes(HEADER_BYTES, 'little')
+    shm.buf[HEADER_BYTES:HEADER_BYTES + len(manifest)] = manifest
+    for meta, (col, values, categories) in zip(columns, arrays):
+        target = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=data_start + meta['offset'])
+        target[:] = values
+
+    return shm
+
+
+def attach(name):
+    """ Attach to a published segment and view it as a read-only data frame without copying the column values
+    Args:
+        name (str): name of the shared-memory segment
+    Returns:
+        df (Pandas data frame): data frame backed by the shared segment
+    """
+    if name in _ATTACHED:
+        shm = _ATTACHED[name]
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+
+        # the publishing process owns the segment; stop this process's resource tracker from unlinking it on exit
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        _ATTACHED[name] = shm
+
+    # read the manifest
+    length = int.from_bytes(bytes(shm.buf[:HEADER_BYTES]), 'little')
+    manifest = json.loads(bytes(shm.buf[HEADER_BYTES:HEADER_BYTES + length]))
+    data_start = _align(HEADER_BYTES + length)
+
+    # build read-only views of every column
+    data = {}
+    for meta in manifest['columns']:
+        values = np.ndarray((manifest['rows'],), dtype=np.dtype(meta['dtype']), buffer=shm.buf,
+                            offset=data_start + meta['offset'])
+        values.flags.writeable = False
+        if meta['categories'] is not None:
+            values = pd.Categorical.from_codes(values, meta['categories'])
+        data[meta['name']] = values
+
+    index = data.pop(INDEX_COL)
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def load_efficiency(filename, name=None):
+    """ Load the cleaned sleep data, from a shared-memory segment if one is named and otherwise from the CSV file
+    Args:
+        filename (str): name of the CSV file containing the sleep data
+        name (str): name of a published shared-memory segment, or None
+    Returns:
+        df_sleep (Pandas data frame): the cleaned sleep data with parsed bedtimes and wakeup times
+    """
+    if name:
+        return attach(name)
+
+    return utils.parse_times(utils.read_file(filename))
+
+
+def main():
+    # read the file and segment name from the command line
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'data/Sleep_Efficiency.csv'
+    name = sys.argv[2] if len(sys.argv) > 2 else 'sleep_efficiency'
+
+    # publish the cleaned data frame
+    shm = publish(load_efficiency(filename), name)
+    print('Published', filename, 'as shared-memory segment', name, '(' + str(shm.size), 'bytes)')
+
+    # keep the segment alive until the process is stopped, then remove it
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,22 +7,246 @@ April 19, 2023
 sleep.py: runs the general code for the dashboard
 """
 # import statements
-from dash import Dash, html, dcc, Input, Output
-import plotly.express as px
-import seaborn as sns
+import socket
+import threading
+import time
+from dash import Dash, html, dcc, Input, Output, State, ClientsideFunction, DiskcacheManager
+from dash.exceptions import PreventUpdate
 import numpy as np
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import utils
 import random_forest_assets as rf
+import config
+import cache_backend
+import memo
+import instrumentation
+import profiling
+import shared_data
+import stats_cube
+
+# read in the file as a dataframe, perform basic cleaning, and convert the bedtime and wakeup times to military times
+# (worker processes attach to a single shared copy instead when one has been published with shared_data.py)
+EFFICIENCY = shared_data.load_efficiency(config.DATA_FILE, config.SHARED_DATA_NAME)
+
+# training settings of the random forest regressors, and those of them that determine the trees (the number of CPU
+# cores they are trained on doesn't)
+FOREST_PARAMS = {'seed': config.SEED, 'n_jobs': config.FOREST_JOBS, 'n_estimators': config.FOREST_TREES,
+                 'max_samples': config.FOREST_MAX_SAMPLES}
+MODEL_PARAMS = {'n_estimators': config.FOREST_TREES, 'max_samples': config.FOREST_MAX_SAMPLES}
+
+# figures, predictions and feature importances are cached, in this process and in a tier shared by every worker
+# process (see cache_backend.py), under a version of everything they depend on: the data and the forests' training
+# and holdout settings, so results of forests trained on other data or with other settings are never served
+DATA_VERSION = utils.data_hash(EFFICIENCY)
+DATA_TOKEN = memo.version(EFFICIENCY)
+CACHE = cache_backend.from_config(utils.model_fingerprint('*', DATA_VERSION, config.SEED,
+                                                          holdout=rf.HOLDOUT_FRACTION, **MODEL_PARAMS))
+
+# the charts on the Sleep Statistics tab summarize the data from a cube of precomputed counts and sums instead of
+# scanning it (see stats_cube.py); it is built once from the data, which the dashboard never changes while it runs
+CUBE = stats_cube.StatsCube(EFFICIENCY)
+
+# colors of the categories in the charts
+GENDER_COLORS = {'Female': 'sienna', 'Male': 'blue'}
+SMOKING_COLORS = {'Yes': 'forestgreen', 'No': 'red'}
+
+# the feature importance chart, which may have to train a forest and measure its importances, runs as a background job
+# in a separate process when the optional diskcache package is installed (pip install "dash[diskcache]"), so it doesn't
+# block the request threads; otherwise it runs in the request thread as usual. The sleep quality predictor always runs
+# in the request thread: it only predicts with the forests warm_up has already trained, which takes milliseconds, less
+# than starting and polling a job would
+try:
+    import diskcache
+    BACKGROUND_MANAGER = DiskcacheManager(diskcache.Cache(config.BACKGROUND_CACHE_DIR))
+except ImportError:
+    BACKGROUND_MANAGER = None
+
+app = Dash(__name__, background_callback_manager=BACKGROUND_MANAGER)
+
+# expose the underlying Flask server so the dashboard can be run under a multi-worker WSGI server
+server = app.server
+
+# the sleep statistics predicted by the sleep quality predictor
+PREDICTED_STATS = ['Sleep efficiency', 'REM sleep percentage', 'Deep sleep percentage']
+
+# random forest regressors trained on EFFICIENCY, keyed by the y-variable they predict and whether they were trained
+# without the held-out rows (see get_forest)
+FORESTS = {}
+FORESTS_LOCK = threading.Lock()
+
+# the training and held-out rows of the feature importance regressors, and their fingerprints, split and computed once
+# per version of the data (see holdout_data)
+HOLDOUT = {}
+HOLDOUT_LOCK = threading.Lock()
+
+# seconds the newest sleep quality predictor request sequence number of each browser is remembered for
+PREDICTOR_REQUEST_TTL = 10 * 60
+
+# help blocks shown in the 'Need Help?' tab, keyed by the value of the help dropdown; they are shipped to the browser
+# in a dcc.Store so that switching between them does not need the server
+HELP_CONTENT = {
+    # helps the user to navigate through the scatter plot
+    'scatterplot-help': [
+        html.H3('...how certain factors affect my sleep quality (scatterplot)'),
+        html.P('Choose the independent and dependent variables from two drop '
+               'downs to see how different factors correlate with each other. '
+               'For example, the default independent and dependent variables '
+               'are age and sleep duration, so the scatter plot and trendline '
+               'displays how age affects sleep duration. You can also toggle '
+               'between showing and hiding the trend line.'),
+
+        # a video that helps users navigate through the scatter plot
+        html.Video(
+            controls=True,
+            id='scatter-diagrams',
+            src='assets/first_diagrams.mp4',
+            style={'height': '50%', 'width': '50%'}
+        )
+    ],
+
+    # helps the user to navigate through the violin plot and histogram
+    'violin-help': [
+        html.H3('...sleep statistics across genders (histogram & violin plot)'),
+        html.P('Based on what the user defines as the independent variable for the scatter plot, '
+               'the histogram and violin plots at the top right can show if that variable varies between '
+               'genders. For the dashboard’s default variable, sleep duration, the violin plot displays how '
+               'sleep duration values are distributed between genders with density curves. The width of each '
+               'curve indicates the frequency of certain sleep duration values, which can be determined by '
+               'observing the relationship between the vertical position of a certain part of the curve and '
+               'how the position aligns with the y-axis. The histogram would also show the distribution in '
+               'sleep duration values between genders, in which taller bars indicate a sleep duration value '
+               'that is more prominent for people of a certain gender. If users only want to see one gender, '
+               '‘Male’ or ‘Female’ can be unchecked.'),
+
+        # a video that helps the user to navigate through the violin plot and histogram
+        html.Video(
+            controls=True,
+            id='violin-diagrams',
+            src='assets/first_diagrams.mp4',
+            style={'height': '50%', 'width': '50%'}
+        )
+    ],
+
+    # helps the user to navigate through the strip chart
+    'smoking-help': [
+        html.H3('... how smoking affects my sleep quality (strip chart)'),
+        html.P('In this chart, explore the impacts of smoking on sleep efficiency. '
+               'The strip plot displays a green strip of all data from smokers and '
+               'a red strip of data from non-smokers. Use the slider to adjust which '
+               'sleep percentages are plotted on the strip chart for both smokers and '
+               'non-smokers. You can view the amount of smokers and non-smokers '
+               'within the specified sleep efficiency range, and you are also able to '
+               'toggle which group you view by clicking on the legend. The points for the '
+               'smokers are slightly skewed toward the left, '
+               'indicating they tend to experience lower sleep efficiencies.'),
+
+        # a video that helps the user to navigate through the strip chart
+        html.Video(
+            controls=True,
+            id='smoking-diagrams',
+            src='assets/second_diagrams.mp4',
+            style={'height': '50%', 'width': '50%'}
+        )
+    ],
 
-# read in the file as a dataframe and perform basic cleaning
-EFFICIENCY = utils.read_file('data/Sleep_Efficiency.csv')
+    # helps the user to navigate through the density contour plot
+    'contour-help': [
+        html.H3('... how various features affect sleep efficiency (contour plot)'),
+        html.P('Choose two sleep variables. In tandem with the sleep efficiency slider, '
+               'this plot will display the correlations of the two selected variables '
+               'against each other, with the colors displaying the sleep efficiency. '
+               'Yellow is ideal, whereas blue and purple are not. Hover over areas to display '
+               'what the factor values are (eg. looking at deep sleep and sleep duration, '
+               'hover over the yellow areas to display the sleep efficiency percentage, '
+               'value of deep sleep, and value of sleep duration).'),
+
+        # a video that helps the user to navigate through the density contour plot
+        html.Video(
+            controls=True,
+            id='contour-diagrams',
+            src='assets/second_diagrams.mp4',
+            style={'height': '50%', 'width': '50%'}
+        )
+    ],
 
-# parse the bedtime and wakeup times and convert them to military times
-EFFICIENCY = utils.parse_times(EFFICIENCY)
+    # helps the user to navigate through the feature importance bar plot
+    'bar-help': [
+        html.H3('... which variables are most important in determining sleep efficiency, '
+                'REM sleep percentage, or deep sleep percentage'),
+        html.P('Select which outcome-- sleep efficiency, REM sleep percentage, or '
+               'deep sleep percentage-- you would like to see the feature importance values '
+               'for. The importance values are determined by how much they aid the random '
+               'forest regressor in predicting the outcome selected.'),
+
+        # a video that helps the user to navigate through the feature importance bar plot
+        html.Video(
+            controls=True,
+            id='bar-diagrams',
+            src='assets/third_diagrams.mp4',
+            style={'height': '50%', 'width': '50%'}
+        )
+    ],
 
-app = Dash(__name__)
+    # helps the user to navigate through the radar chart
+    'hygiene-help': [
+        html.H3('... comparing sleep hygiene (radar plot)'),
+        html.P('Adjust the sliders to answer the questions and view the display '
+               'that allows you to compare the average test subject’s sleep hygiene to yours '
+               'based on your awakenings, caffeine consumption, alcohol consumption, and exercise frequency. '
+               'You can see where you are above, below, or at average '
+               'based on where the colors overlap. If the red diamond, which represents you, '
+               'closely aligns with the blue diamond, which represents the average test subject for the study '
+               'that provided the data for this dashboard, then the chart indicates that your habits '
+               'generally align with the average participant in the study.'),
+
+        # a video that helps the user to navigate through the radar chart
+        html.Video(
+            controls=True,
+            id='radar-diagrams',
+            src='assets/third_diagrams.mp4',
+            style={'height': '50%', 'width': '50%'}
+        )
+    ],
+
+    # helps the user to navigate through the 3D scatter plot
+    '3d-help': [
+        html.H3('... two independent variables versus one dependent (3d plot)'),
+        html.P('Choose two independent sleep variables and a dependent sleep variable. '
+               'The points are color-coded by biological gender, with the '
+               'blue points representing biological females and the red points representing biological males. '
+               'Click the gender you do not want to see if you want to filter the data. '
+               'Then, look at the plot to compare the two independent variables to '
+               'the dependent.'),
+
+        # a video that helps the user to navigate through the 3D scatter plot
+        html.Video(
+            controls=True,
+            id='3d-diagrams',
+            src='assets/third_diagrams.mp4',
+            style={'height': '50%', 'width': '50%'}
+        )
+    ],
+
+    # helps the user to navigate through the sleep predictor tab
+    'ml-help': [
+        html.H3('... the sleep scores calculator (tab 2)'),
+        html.P('Input your age, bedtime, wakeup time, caffeine consumption habits, '
+               'biological gender, awakenings in a given night, alcohol consumption habits, '
+               'smoking habits, and exercise habits. Then, a random forest regressor '
+               'will use those inputs to predict your sleep efficiency, REM sleep percentage, '
+               'and deep sleep percentage. Click on the link in the upper left corner for an '
+               'article explaining the percentages.'),
+
+        # a video that helps the user to navigate through the sleep predictor tab
+        html.Video(
+            controls=True,
+            id='ml-diagrams',
+            src='assets/tab2.mp4',
+            style={'height': '50%', 'width': '50%'}
+        )
+    ],
+}
 
 # layout for the dashboard
 app.layout = html.Div([
@@ -143,6 +367,9 @@ app.layout = html.Div([
                                 dcc.Graph(id='hist-gender', style={'display': 'inline-block', 'width': '49%'})
                             ]),
 
+                            # holds the violin plot and histogram for every gender; the browser filters them
+                            dcc.Store(id='gender-figures'),
+
                             # checkbox that allows users to filter the violin plot and histogram by gender
                             html.P('Filter the plots by gender', style={'textAlign': 'center'}),
                             dcc.Checklist(
@@ -251,9 +478,12 @@ app.layout = html.Div([
                                              value='Sleep efficiency',
                                              clearable=False, id='feature', style={'color': 'black'}),
 
-                                # display the feature importance chart
-                                dcc.Graph(id='feature-importance',
-                                          style={'display': 'inline-block', 'width': '100%'})
+                                # tell the user when the random forest regressor is being trained
+                                html.P(id='feature-importance-status'),
+
+                                # display the feature importance chart, with a spinner while it is being computed
+                                dcc.Loading(dcc.Graph(id='feature-importance',
+                                                      style={'display': 'inline-block', 'width': '100%'}))
                             ],
 
                                 # Add style parameters to this Div
@@ -402,21 +632,24 @@ app.layout = html.Div([
                             html.Div([
                                 html.P('How old are you?', style={'textAlign': 'center'}),
                                 dcc.Slider(0, 100, 1, value=15, marks=None, id='sleep-age',
-                                           tooltip={'placement': 'bottom', 'always_visible': True})]),
+                                           tooltip={'placement': 'bottom', 'always_visible': True},
+                                           updatemode='mouseup')]),
 
                             # Ask a user for their typical bedtime (as hours into the day)
                             html.Div([
                                 html.P('What is your bedtime based on hours into the day (military time)?',
                                        style={'textAlign': 'center'}),
                                 dcc.Slider(0, 24, 0.25, value=23, marks=None, id='sleep-bedtime',
-                                           tooltip={'placement': 'bottom', 'always_visible': True})]),
+                                           tooltip={'placement': 'bottom', 'always_visible': True},
+                                           updatemode='mouseup')]),
 
                             # Ask a user for their typical wakeup time (hours into the day)
                             html.Div([
                                 html.P('What is your wakeup time based on hours into the day (military time)?',
                                        style={'textAlign': 'center'}),
                                 dcc.Slider(0, 24, 0.25, value=9, marks=None, id='sleep-wakeuptime',
-                                           tooltip={'placement': 'bottom', 'always_visible': True})]),
+                                           tooltip={'placement': 'bottom', 'always_visible': True},
+                                           updatemode='mouseup')]),
 
                             # Ask a user for how much caffeine they consume in the 24 hours prior to bedtime (in mg)
                             html.Div([
@@ -424,6 +657,7 @@ app.layout = html.Div([
                                     'How much caffeine do you consume in the 24 hours prior to bedtime (in mg)?',
                                     style={'textAlign': 'center'}), dcc.Slider(0, 200, 1, value=50,
                                                                                marks=None, id='sleep-caffeine',
+                                                                               updatemode='mouseup',
                                                                                tooltip={'placement': 'bottom',
                                                                                         'always_visible': True})])
                         ],
@@ -475,11 +709,16 @@ app.layout = html.Div([
                             # Add style parameters for the Div
                             style={'width': '50%', 'float': 'right', 'height': '35vw'})]),
 
-                    # display the predicted sleep efficiency, REM sleep percentage, and deep sleep percentage
+                    # holds the latest set of predictor inputs, so that they are sent to the server as one request
+                    dcc.Store(id='predictor-request'),
+
+                    # display the predicted sleep efficiency, REM sleep percentage, and deep sleep percentage, with a
+                    # spinner while they are being computed
                     dbc.Row([
-                        html.H2(id='sleep-eff', style={'textAlign': 'center'}),
-                        html.H2(id='sleep-rem', style={'textAlign': 'center'}),
-                        html.H2(id='sleep-deep', style={'textAlign': 'center'})])
+                        dcc.Loading([
+                            html.H2(id='sleep-eff', style={'textAlign': 'center'}),
+                            html.H2(id='sleep-rem', style={'textAlign': 'center'}),
+                            html.H2(id='sleep-deep', style={'textAlign': 'center'})])])
                 ])
             ], style={'background-color': 'darkslateblue', 'color': 'white', 'font-family': 'Georgia'})
         ], style={'background-color': 'black', 'color': 'white'}),
@@ -509,6 +748,7 @@ app.layout = html.Div([
                         {'label': '... two independent variables versus one dependent', 'value': '3d-help'},
                         {'label': '... the sleep scores calculator', 'value': 'ml-help'}], id='help-options',
                 )], style={'font-family': 'Courier New'}),
+            dcc.Store(id='help-content', data=HELP_CONTENT),
             html.Div([], id='helper-div', style={'background-color': 'lightblue', 'font-family': 'Courier New'}),
 
             html.Div([
@@ -533,11 +773,11 @@ app.layout = html.Div([
 
 @app.callback(
     Output('sleep-scatter', 'figure'),
-    Output('sleep-qual-title', 'children'),
     Input('scatter-trend-line', 'value'),
     Input('sleep-stat-ind', 'value'),
     Input('sleep-stat-dep', 'value')
 )
+@CACHE.cached('make_sleep_scatter')
 def make_sleep_scatter(show_trend_line, sleep_stat_ind, sleep_stat_dep):
     """ Creates a scatter plot showing the relationship between two sleep statistics
     Args:
@@ -546,8 +786,10 @@ def make_sleep_scatter(show_trend_line, sleep_stat_ind, sleep_stat_dep):
         sleep_stat_dep (string): the dependent variable of the scatter plot
     Returns:
         fig (px.scatter): the scatter plot itself
-        html.H2: the title of the scatter plot, which changes based on the user's input for the represented variables
     """
+    # plotly express is imported on first use to keep the dashboard's startup fast
+    import plotly.express as px
+
     # initialize the trend-line as None
     trend_line = None
 
@@ -559,72 +801,61 @@ def make_sleep_scatter(show_trend_line, sleep_stat_ind, sleep_stat_dep):
     # statistic on a scatter plot
     fig = px.scatter(EFFICIENCY, x=sleep_stat_ind, y=sleep_stat_dep, trendline=trend_line, template='plotly_dark',
                      labels={'x': sleep_stat_ind, 'index': sleep_stat_dep})
-    return fig, html.H2('How ' + sleep_stat_ind + ' Affects ' + sleep_stat_dep, style={'textAlign': 'center'})
+    return fig
 
 
 @app.callback(
-    Output('violin-gender', 'figure'),
-    Output('gender-plots-title', 'children'),
-    Input('gender-options', 'value'),
+    Output('gender-figures', 'data'),
     Input('sleep-stat-dep', 'value')
 )
-def show_sleep_gender_violin_plot(genders, sleep_stat):
-    """ Shows a violin plot that represents distributions of a sleep statistic per gender
+@CACHE.cached('show_sleep_gender_distributions')
+def show_sleep_gender_distributions(sleep_stat):
+    """ Shows a violin plot and a histogram that represent distributions of a sleep statistic per gender; the browser
+        filters them down to the genders the user has chosen (sleep.filter_genders in assets/clientside.js)
     Args:
-        genders (list of str): list of genders to be portrayed on the violin plot
-        sleep_stat (str): The statistic to be portrayed on the violin plot
+        sleep_stat (str): The statistic to be portrayed on the violin plot and histogram
     Returns:
-        fig (px.violin): the violin plot
-        html.H2: the title for the gender plot section, which changes based on the user's input for the represented
-                 variables
+        (dict): the violin plot ('violin') and the histogram ('histogram'), with one trace per gender
     """
     # saving column names into constants
     GENDER_COL = 'Gender'
 
-    # filter the data based on the chosen genders
-    sleep_gender = EFFICIENCY[EFFICIENCY.Gender.isin(genders)]
+    # the number of people of each gender in each bin of the sleep statistic
+    counts, totals, squares = CUBE.query([GENDER_COL, sleep_stat])
+    edges = CUBE.edges[sleep_stat]
+    centers = CUBE.centers(sleep_stat)
 
-    # plot the violin chart
-    fig = px.violin(sleep_gender, x=GENDER_COL, y=sleep_stat, color=GENDER_COL, template='plotly_dark',
-                    color_discrete_map={'Female': 'sienna', 'Male': 'blue'})
+    violin = go.Figure()
+    histogram = go.Figure()
+    for gender, gender_counts in zip(CUBE.categories[GENDER_COL], counts):
+        # the violin plot's shape is estimated from evenly spaced quantiles of each gender's distribution, smoothed as
+        # much as a violin plot of every person would be
+        discrete = sleep_stat in CUBE.discrete
+        points = stats_cube.quantile_points(gender_counts, edges, discrete=discrete)
+        violin.add_trace(go.Violin(x=[gender] * len(points), y=points, name=gender, legendgroup=gender,
+                                   marker_color=GENDER_COLORS[gender], points=False, scalegroup=GENDER_COL,
+                                   bandwidth=stats_cube.kde_bandwidth(gender_counts, edges, discrete)))
 
-    return fig, html.H2(sleep_stat + ' distribution across genders', style={'textAlign': 'center'})
+        # show a grouped histogram color coded by biological gender if both the "male" and "female" checkboxes are
+        # ticked
+        histogram.add_trace(go.Bar(x=centers, y=gender_counts, name=gender, marker_color=GENDER_COLORS[gender],
+                                   width=np.diff(edges)))
 
+    violin.update_layout(template='plotly_dark', xaxis_title=GENDER_COL, yaxis_title=sleep_stat,
+                         legend_title_text=GENDER_COL, violinmode='overlay')
+    histogram.update_layout(template='plotly_dark', xaxis_title=sleep_stat, yaxis_title='count',
+                            legend_title_text=GENDER_COL, barmode='relative', bargap=0)
 
-@app.callback(
-    Output('hist-gender', 'figure'),
-    Input('gender-options', 'value'),
-    Input('sleep-stat-dep', 'value')
-)
-def show_sleep_gender_histogram(genders, sleep_stat):
-    """ Shows a histogram that represents distributions of a sleep statistic per gender
-    Args:
-        genders (list of str): list of genders to be portrayed on the histogram
-        sleep_stat (str): The statistic to be portrayed on the histogram
-    Returns:
-        fig (px.histogram): the histogram itself
-    """
-    # saving column names into constants
-    GENDER_COL = 'Gender'
-
-    # filter the data based on the chosen genders
-    sleep_gender = EFFICIENCY[EFFICIENCY.Gender.isin(genders)]
-
-    # plot the histogram
-    # show a grouped histogram color coded by biological gender if both the "male" and "female" checkboxes are ticked
-    fig = px.histogram(sleep_gender, x=sleep_stat, color=GENDER_COL, template='plotly_dark',
-                       color_discrete_map={'Female': 'sienna', 'Male': 'blue'})
-
-    return fig
+    return {'violin': violin, 'histogram': histogram}
 
 
 @app.callback(
     Output('efficiency-contour', 'figure'),
-    Output('mult-feat-eff', 'children'),
     Input('density-stat1', 'value'),
     Input('density-stat2', 'value'),
     Input('efficiency-slider', 'value')
 )
+@CACHE.cached('show_efficiency_contour')
 def show_efficiency_contour(sleep_stat1, sleep_stat2, slider_values):
     """ Shows a density contour plot that plots the relationship between two variables and average sleep efficiency
     Args:
@@ -632,15 +863,11 @@ def show_efficiency_contour(sleep_stat1, sleep_stat2, slider_values):
         sleep_stat2 (str): Another statistic to be portrayed on the density contour plot
         slider_values (list of two floats): a range of average sleep efficiencies to be represented on the plot
     Returns:
-        fig (px.density_contour): the density contour plot
-        html.H2: the contour plot's title, which changes based on the user's input for the represented variables
+        fig (go.Figure): the density contour plot
     """
     # saving the sleep efficiency column into a constant
     SLEEP_EFFICIENCY_COL = 'Sleep efficiency'
 
-    # performing one hot encoding if gender or smoking status needs to be represented on the plot
-    df_sleep = utils.encode(sleep_stat1, sleep_stat2, EFFICIENCY)
-
     # change the second independent variable if it's the same with the first
     if sleep_stat1 == sleep_stat2:
         if sleep_stat1 != 'Awakenings':
@@ -648,53 +875,68 @@ def show_efficiency_contour(sleep_stat1, sleep_stat2, slider_values):
         else:
             sleep_stat2 = 'Caffeine consumption 24 hrs before sleeping (mg)'
 
-    # filter out appropriate values
-    cols = ['ID', sleep_stat1, sleep_stat2, SLEEP_EFFICIENCY_COL]
-    filt_efficiency = utils.filt_vals(df_sleep, slider_values, SLEEP_EFFICIENCY_COL, cols)
+    # the number of people and their total sleep efficiency in each cell of the two statistics, counting only the
+    # people within the sleep efficiency range (gender and smoking status are encoded as 0 and 1)
+    counts, totals, squares = CUBE.query([sleep_stat1, sleep_stat2], {SLEEP_EFFICIENCY_COL: slider_values})
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(counts > 0, totals / counts, np.nan)
 
-    # plot the sleep statistics on a density contour plot
-    fig = px.density_contour(filt_efficiency, x=sleep_stat1, y=sleep_stat2, z=SLEEP_EFFICIENCY_COL, histfunc='avg',
-                             template='plotly_dark')
-    fig.update_traces(contours_coloring='fill', contours_showlabels=True)
+    # plot the average sleep efficiency of each cell on a density contour plot
+    fig = go.Figure(go.Contour(x=CUBE.centers(sleep_stat1), y=CUBE.centers(sleep_stat2), z=average.T,
+                               contours_coloring='fill', contours_showlabels=True, connectgaps=False,
+                               colorbar_title_text='avg of ' + SLEEP_EFFICIENCY_COL))
+    fig.update_layout(template='plotly_dark')
 
     # update the x and y-axis labels
     fig.update_layout(xaxis_title=sleep_stat1, yaxis_title=sleep_stat2)
 
-    return fig, html.H2('How ' + sleep_stat1 + ' and ' + sleep_stat2 + ' Affect Sleep Efficiency',
-                        style={'textAlign': 'center'})
+    return fig
 
 
 @app.callback(
     Output('smoke-vs-sleep', 'figure'),
     Input('efficiency-slider', 'value')
 )
+@CACHE.cached('show_sleep_strip')
 def show_sleep_strip(smoker_slider):
     """ Shows a strip chart that presents the relationship between sleep efficiency and smoking status
     Args:
         smoker_slider (list of two floats): a range of sleep efficiencies to be represented on the plot
     Returns:
-        fig (px.strip): the strip chart itself
+        fig (go.Figure): the strip chart itself
     """
     # saving column names into constants
     SMOKING_COL = 'Smoking status'
     SLEEP_EFFICIENCY_COL = 'Sleep efficiency'
 
-    # filter the data based on the user-specified sleep efficiency range
-    cols = ['ID', SMOKING_COL, SLEEP_EFFICIENCY_COL]
-    sleep_smoking = utils.filt_vals(EFFICIENCY, smoker_slider, SLEEP_EFFICIENCY_COL, cols)
+    # the number of smokers and non-smokers at each sleep efficiency within the user-specified range
+    counts, totals, squares = CUBE.query([SMOKING_COL, SLEEP_EFFICIENCY_COL], {SLEEP_EFFICIENCY_COL: smoker_slider})
 
-    # plot the strip chart showing the relationship between smoking statuses and sleep efficiency
-    fig = px.strip(sleep_smoking, x=SLEEP_EFFICIENCY_COL, y=SMOKING_COL, color=SMOKING_COL,
-                   color_discrete_map={'Yes': 'forestgreen', 'No': 'red'}, template='plotly_dark')
+    # plot the strip chart showing the relationship between smoking statuses and sleep efficiency, with one point per
+    # sleep efficiency sized by the number of people in it
+    fig = go.Figure()
+    for status, status_counts, status_totals in zip(CUBE.categories[SMOKING_COL], counts, totals):
+        occupied = status_counts > 0
+        fig.add_trace(go.Scatter(x=status_totals[occupied] / status_counts[occupied],
+                                 y=[status] * int(occupied.sum()), name=status, mode='markers',
+                                 marker=dict(color=SMOKING_COLORS[status],
+                                             size=4 + 2 * np.sqrt(status_counts[occupied])),
+                                 customdata=status_counts[occupied],
+                                 hovertemplate=SLEEP_EFFICIENCY_COL + '=%{x}<br>people=%{customdata}'))
+    fig.update_layout(template='plotly_dark', xaxis_title=SLEEP_EFFICIENCY_COL, yaxis_title=SMOKING_COL,
+                      legend_title_text=SMOKING_COL)
 
     return fig
 
 
 @app.callback(
     Output('feature-importance', 'figure'),
-    Output('feature-importance-title', 'children'),
-    Input('feature', 'value')
+    Input('feature', 'value'),
+    background=BACKGROUND_MANAGER is not None,
+    running=[(Output('feature-importance-status', 'children'),
+              'Training the random forest regressor and measuring its feature importances...', '')]
 )
+@CACHE.cached('plot_eff_forest')
 def plot_eff_forest(focus_col):
     """ Plot the feature importance graph for a y-variable of interest (sleep efficiency, REM sleep percentage, or deep
         sleep percentage)
@@ -702,23 +944,15 @@ def plot_eff_forest(focus_col):
         focus_col (str): y-variable of interest (sleep efficiency, REM sleep percentage, or deep sleep percentage)
     Return:
         fig (px.bar): a bar chart containing the feature importance values for the random forest regressor
-        html.H2: the bar plot's title, which changes based on the user's input for the y variable of interest
     """
-    # Establish the theme of the visualization
-    sns.set()
-
-    # retrieve the columns containing the data used by the random forest regressor to make predictions
-    df_sleep, x_feat_list = utils.get_x_feat(EFFICIENCY)
-
-    # Builds the random forest regressor model that predicts the user-specified y-variable for a user
-    random_forest_reg = rf.forest_reg(focus_col, EFFICIENCY)
+    # retrieve the permutation importances of the random forest regressor that predicts the user-specified y-variable
+    x_feat_list, importances = get_importances(focus_col)
 
     # plots the importance of features in determining the user-specified y variable for a person by the random forest
     # regressor
-    fig = rf.plot_feat_import_rf_reg(x_feat_list, random_forest_reg.feature_importances_)
+    fig = rf.plot_feat_import_rf_reg(x_feat_list, importances)
 
-    return fig, html.H2('Which variables are most important in determining your ' + focus_col + '?',
-                        style={'textAlign': 'center'})
+    return fig
 
 
 @app.callback(
@@ -728,6 +962,7 @@ def plot_eff_forest(focus_col):
     Input('hygiene-alcohol', 'value'),
     Input('hygiene-exercise', 'value')
 )
+@CACHE.cached('plot_sleep_hygiene')
 def plot_sleep_hygiene(awakenings, caffeine, alcohol, exercise):
     """ Makes a radar graph of sleep hygiene
     Args:
@@ -796,11 +1031,11 @@ def plot_sleep_hygiene(awakenings, caffeine, alcohol, exercise):
 
 @app.callback(
     Output('three-dim-plot', 'figure'),
-    Output('three-dim-title', 'children'),
     Input('independent-3D-feat1', 'value'),
     Input('independent-3D-feat2', 'value'),
     Input('independent-3D-feat3', 'value')
 )
+@CACHE.cached('plot_three_dim_scatter')
 def plot_three_dim_scatter(sleep_stat_x, sleep_stat_y, sleep_stat_z):
     """ Plot a 3D scatter plot showing the relationship between 3 sleep variables
     Args:
@@ -809,9 +1044,10 @@ def plot_three_dim_scatter(sleep_stat_x, sleep_stat_y, sleep_stat_z):
         sleep_stat_z (str): another independent sleep variable of interest
     Returns:
         fig (px.scatter_3d): a 3D scatter plot showing the relationship between 3 independent sleep variables
-        html.H2: the title for the 3D scatter plot, which changes based on the user's input for the represented
-                 variables
     """
+    # plotly express is imported on first use to keep the dashboard's startup fast
+    import plotly.express as px
+
     # performing one hot encoding if gender and/or smoking status needs to be shown on the plot
     df_sleep = utils.encode(sleep_stat_x, sleep_stat_y, EFFICIENCY)
 
@@ -819,12 +1055,65 @@ def plot_three_dim_scatter(sleep_stat_x, sleep_stat_y, sleep_stat_z):
     fig = px.scatter_3d(df_sleep, x=sleep_stat_x, y=sleep_stat_y, z=sleep_stat_z, color='Gender',
                         template='plotly_dark', width=633, height=499)
 
-    return fig, html.H2('3D View of ' + sleep_stat_x + ' vs ' + sleep_stat_y + ' vs ' + sleep_stat_z,
-                        style={'textAlign': 'center'})
+    return fig
 
 
-@app.callback(
-    Output('sleep-eff', 'children'),
+# callbacks that only rearrange data already in the browser run there instead of on the server (see
+# assets/clientside.js)
+
+# show the help block for the chosen dropdown value
+app.clientside_callback(
+    ClientsideFunction(namespace='sleep', function_name='show_help'),
+    Output('helper-div', 'children'),
+    Input('help-options', 'value'),
+    State('help-content', 'data')
+)
+
+# filter the violin plot and histogram down to the chosen genders
+app.clientside_callback(
+    ClientsideFunction(namespace='sleep', function_name='filter_genders'),
+    Output('violin-gender', 'figure'),
+    Output('hist-gender', 'figure'),
+    Input('gender-options', 'value'),
+    Input('gender-figures', 'data')
+)
+
+# dynamic titles above the plots
+app.clientside_callback(
+    ClientsideFunction(namespace='sleep', function_name='scatter_title'),
+    Output('sleep-qual-title', 'children'),
+    Input('sleep-stat-ind', 'value'),
+    Input('sleep-stat-dep', 'value')
+)
+app.clientside_callback(
+    ClientsideFunction(namespace='sleep', function_name='gender_title'),
+    Output('gender-plots-title', 'children'),
+    Input('sleep-stat-dep', 'value')
+)
+app.clientside_callback(
+    ClientsideFunction(namespace='sleep', function_name='contour_title'),
+    Output('mult-feat-eff', 'children'),
+    Input('density-stat1', 'value'),
+    Input('density-stat2', 'value')
+)
+app.clientside_callback(
+    ClientsideFunction(namespace='sleep', function_name='importance_title'),
+    Output('feature-importance-title', 'children'),
+    Input('feature', 'value')
+)
+app.clientside_callback(
+    ClientsideFunction(namespace='sleep', function_name='three_dim_title'),
+    Output('three-dim-title', 'children'),
+    Input('independent-3D-feat1', 'value'),
+    Input('independent-3D-feat2', 'value'),
+    Input('independent-3D-feat3', 'value')
+)
+
+# bundle the predictor inputs into one numbered request in the browser, so that changing any of them sends a single
+# request to the server (see assets/clientside.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='sleep', function_name='request_prediction'),
+    Output('predictor-request', 'data'),
     Input('sleep-age', 'value'),
     Input('sleep-bedtime', 'value'),
     Input('sleep-wakeuptime', 'value'),
@@ -833,269 +1122,198 @@ def plot_three_dim_scatter(sleep_stat_x, sleep_stat_y, sleep_stat_z):
     Input('sleep-alcohol', 'value'),
     Input('sleep-exercise', 'value'),
     Input('sleep-gender', 'value'),
-    Input('sleep-smoke', 'value')
+    Input('sleep-smoke', 'value'),
+    State('predictor-request', 'data')
 )
-def calc_eff_reg(age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke):
-    """ Allow users to get their predicted sleep efficiency given information about them
-    Args:
-        age (int): the age of the user
-        bedtime (float): user's bedtime based on hours into the day (military time)
-        wakeuptime (float): user's wakeup time based on hours into the day (military time)
-        awakenings (int): number of awakenings a user has on a given night
-        caffeine (int): amount of caffeine a user consumes in the 24 hours prior to bedtime (in mg)
-        alcohol (int): amount of alcohol a user consumes in the 24 hours prior to bedtime (in oz)
-        exercise (int): how many times the user exercises in a week
-        gender (str): biological gender of the user
-        smoke (str): whether the user smokes
-    Returns:
-        a message containing the user's predicted sleep efficiency
-    """
-    # predict sleep efficiency based on user inputs from the dropdown and sliders
-    y_pred = utils.predict_sleep_quality('Sleep efficiency', EFFICIENCY, age, bedtime, wakeuptime, awakenings, caffeine,
-                                         alcohol, exercise, gender, smoke)
-
-    # display the user's predicted sleep efficiency
-    return 'Your predicted sleep efficiency (expressed in %) is \n{}'.format(round(float(y_pred), 2))
 
 
 @app.callback(
+    Output('sleep-eff', 'children'),
     Output('sleep-rem', 'children'),
-    Input('sleep-age', 'value'),
-    Input('sleep-bedtime', 'value'),
-    Input('sleep-wakeuptime', 'value'),
-    Input('sleep-awakenings', 'value'),
-    Input('sleep-caffeine', 'value'),
-    Input('sleep-alcohol', 'value'),
-    Input('sleep-exercise', 'value'),
-    Input('sleep-gender', 'value'),
-    Input('sleep-smoke', 'value')
+    Output('sleep-deep', 'children'),
+    Input('predictor-request', 'data')
 )
-def calc_rem_reg(age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke):
-    """ Allow users to get their predicted REM sleep percentage given information about them
+def calc_sleep_quality(request):
+    """ Allow users to get their predicted sleep efficiency, REM sleep percentage and deep sleep percentage given
+        information about them
     Args:
-        age (int): the age of the user
-        bedtime (float): user's bedtime based on hours into the day (military time)
-        wakeuptime (float): user's wakeup time based on hours into the day (military time)
-        awakenings (int): number of awakenings a user has on a given night
-        caffeine (int): amount of caffeine a user consumes in the 24 hours prior to bedtime (in mg)
-        alcohol (int): amount of alcohol a user consumes in the 24 hours prior to bedtime (in oz)
-        exercise (int): how many times the user exercises in a week
-        gender (str): biological gender of the user
-        smoke (str): whether the user smokes
+        request (dict): the browser's id ('client'), the request's sequence number ('seq') and the user's inputs
+                        ('values'), in order:
+            age (int): the age of the user
+            bedtime (float): user's bedtime based on hours into the day (military time)
+            wakeuptime (float): user's wakeup time based on hours into the day (military time)
+            awakenings (int): number of awakenings a user has on a given night
+            caffeine (int): amount of caffeine a user consumes in the 24 hours prior to bedtime (in mg)
+            alcohol (int): amount of alcohol a user consumes in the 24 hours prior to bedtime (in oz)
+            exercise (int): how many times the user exercises in a week
+            gender (str): biological gender of the user
+            smoke (str): whether the user smokes
     Returns:
-        a message with the user's predicted REM sleep percentage
+        messages containing the user's predicted sleep efficiency, REM sleep percentage and deep sleep percentage
     """
-    # predict REM sleep percentage based on user inputs from the dropdown and sliders
-    y_pred = utils.predict_sleep_quality('REM sleep percentage', EFFICIENCY, age, bedtime, wakeuptime, awakenings,
-                                         caffeine, alcohol, exercise, gender, smoke)
+    # skip requests that a newer request from the same browser has already replaced
+    if superseded(request):
+        raise PreventUpdate
 
-    # display the user's predicted REM sleep percentage
-    return 'Your predicted REM sleep percentage is \n{}'.format(round(float(y_pred), 2))
+    # predict sleep efficiency, REM sleep percentage and deep sleep percentage based on user inputs from the dropdowns
+    # and sliders, unless any worker has already predicted them for the same inputs
+    predictions = CACHE.get_or_compute('predictions', tuple(request['values']),
+                                       lambda *values: predict_sleep_stats(values, request))
 
+    # display the user's predicted sleep statistics
+    return ('Your predicted sleep efficiency (expressed in %) is \n{}'.format(predictions[0]),
+            'Your predicted REM sleep percentage is \n{}'.format(predictions[1]),
+            'Your predicted deep sleep percentage is \n{}'.format(predictions[2]))
 
-@app.callback(
-    Output('sleep-deep', 'children'),
-    Input('sleep-age', 'value'),
-    Input('sleep-bedtime', 'value'),
-    Input('sleep-wakeuptime', 'value'),
-    Input('sleep-awakenings', 'value'),
-    Input('sleep-caffeine', 'value'),
-    Input('sleep-alcohol', 'value'),
-    Input('sleep-exercise', 'value'),
-    Input('sleep-gender', 'value'),
-    Input('sleep-smoke', 'value')
-)
-def calc_deep_reg(age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke):
-    """ Allow users to get their predicted deep sleep percentage given information about them
+
+def predict_sleep_stats(values, request):
+    """ Predict a user's sleep efficiency, REM sleep percentage and deep sleep percentage
     Args:
-        age (int): the age of the user
-        bedtime (float): user's bedtime based on hours into the day (military time)
-        wakeuptime (float): user's wakeup time based on hours into the day (military time)
-        awakenings (int): number of awakenings a user has on a given night
-        caffeine (int): amount of caffeine a user consumes in the 24 hours prior to bedtime (in mg)
-        alcohol (int): amount of alcohol a user consumes in the 24 hours prior to bedtime (in oz)
-        exercise (int): how many times the user exercises in a week
-        gender (str): biological gender of the user
-        smoke (str): whether the user smokes
+        values (tuple): the user's inputs, as in calc_sleep_quality
+        request (dict): the sleep quality predictor request the inputs came from
     Returns:
-        a message with the user's predicted deep sleep percentage
+        predictions (list of floats): the predictions, rounded to two decimal places
     """
-    # predict deep sleep percentage based on user inputs from the dropdown and sliders
-    y_pred = utils.predict_sleep_quality('Deep sleep percentage', EFFICIENCY, age, bedtime, wakeuptime, awakenings,
-                                         caffeine, alcohol, exercise, gender, smoke)
+    # retrieve the random forest regressors; they may still be training, so check again afterwards
+    forests = {focus_col: get_forest(focus_col) for focus_col in PREDICTED_STATS}
+    if superseded(request):
+        raise PreventUpdate
 
-    # display the user's predicted deep sleep percentage
-    return 'Your predicted deep sleep percentage is \n{}'.format(round(float(y_pred), 2))
+    predictions = []
+    for focus_col in PREDICTED_STATS:
+        y_pred = utils.predict_sleep_quality(focus_col, EFFICIENCY, *values, random_forest_reg=forests[focus_col])
+        predictions.append(round(float(y_pred[0]), 2))
 
+    return predictions
 
-@app.callback(
-    Output('helper-div', 'children'),
-    Input('help-options', 'value')
-)
-def show_help(query):
-    """ Shows helpful hints in the 'Need Help?' tab based on the dropdown selection
+
+def get_forest(focus_col, holdout=False):
+    """ Retrieve the random forest regressor that predicts a y-variable, training it the first time it is needed
     Args:
-        query (string) - the value of the dropdown indicating what the user needs help with
+        focus_col (str): y-variable of interest (sleep efficiency, REM sleep percentage, or deep sleep percentage)
+        holdout (bool): retrieve the regressor trained without the held-out rows, which the feature importances are
+                        measured on, instead of the one trained on every row, which makes the predictions
     Returns:
-        div that displays a paragraph, header, and video with assistance for the user
+        random_forest_reg: fitted random forest regressor
     """
-    # helps the user to navigate through the scatter plot
-    if query == 'scatterplot-help':
-        return [html.H3('...how certain factors affect my sleep quality (scatterplot)'),
-                html.P('Choose the independent and dependent variables from two drop '
-                       'downs to see how different factors correlate with each other. '
-                       'For example, the default independent and dependent variables '
-                       'are age and sleep duration, so the scatter plot and trendline '
-                       'displays how age affects sleep duration. You can also toggle '
-                       'between showing and hiding the trend line.'),
-
-                # a video that helps users navigate through the scatter plot
-                html.Video(
-                    controls=True,
-                    id='scatter-diagrams',
-                    src='assets/first_diagrams.mp4',
-                    style={'height': '50%', 'width': '50%'}
-                )]
+    df = holdout_data()['train'] if holdout else EFFICIENCY
+    with FORESTS_LOCK:
+        if (focus_col, holdout) not in FORESTS:
+            FORESTS[(focus_col, holdout)] = rf.load_or_train(focus_col, df, config.MODEL_DIR, **FOREST_PARAMS)
+        return FORESTS[(focus_col, holdout)]
 
-    # helps the user to navigate through the violin plot and histogram
-    elif query == 'violin-help':
-        return [html.H3('...sleep statistics across genders (histogram & violin plot)'),
-                html.P('Based on what the user defines as the independent variable for the scatter plot, '
-                       'the histogram and violin plots at the top right can show if that variable varies between '
-                       'genders. For the dashboard’s default variable, sleep duration, the violin plot displays how '
-                       'sleep duration values are distributed between genders with density curves. The width of each '
-                       'curve indicates the frequency of certain sleep duration values, which can be determined by '
-                       'observing the relationship between the vertical position of a certain part of the curve and '
-                       'how the position aligns with the y-axis. The histogram would also show the distribution in '
-                       'sleep duration values between genders, in which taller bars indicate a sleep duration value '
-                       'that is more prominent for people of a certain gender. If users only want to see one gender, '
-                       '‘Male’ or ‘Female’ can be unchecked.'),
-
-                # a video that helps the user to navigate through the violin plot and histogram
-                html.Video(
-                    controls=True,
-                    id='violin-diagrams',
-                    src='assets/first_diagrams.mp4',
-                    style={'height': '50%', 'width': '50%'}
-                )]
 
-    # helps the user to navigate through the strip chart
-    elif query == 'smoking-help':
-        return [html.H3('... how smoking affects my sleep quality (strip chart)'),
-                html.P('In this chart, explore the impacts of smoking on sleep efficiency. '
-                       'The strip plot displays a green strip of all data from smokers and '
-                       'a red strip of data from non-smokers. Use the slider to adjust which '
-                       'sleep percentages are plotted on the strip chart for both smokers and '
-                       'non-smokers. You can view the amount of smokers and non-smokers '
-                       'within the specified sleep efficiency range, and you are also able to '
-                       'toggle which group you view by clicking on the legend. The points for the '
-                       'smokers are slightly skewed toward the left, '
-                       'indicating they tend to experience lower sleep efficiencies.'),
-
-                # a video that helps the user to navigate through the strip chart
-                html.Video(
-                    controls=True,
-                    id='smoking-diagrams',
-                    src='assets/second_diagrams.mp4',
-                    style={'height': '50%', 'width': '50%'}
-                )]
+def holdout_data():
+    """ Split the data into the rows the feature importance regressors are trained on and the held-out rows their
+        importances are measured on, once per version of the data
+    Returns:
+        (dict): the training rows ('train'), the encoded held-out rows ('holdout') and their features ('x_feat_list'),
+                and the fingerprint of each y-variable's regressor ('fingerprints')
+    """
+    token = memo.version(EFFICIENCY)
+    with HOLDOUT_LOCK:
+        if token not in HOLDOUT:
+            df_train, df_holdout = rf.split_holdout(EFFICIENCY)
+            df_holdout, x_feat_list = utils.get_x_feat(df_holdout)
+
+            # the importances are cached under the regressor's fingerprint, so they are recomputed only when the data,
+            # the training settings or the held-out rows change (the number of CPU cores doesn't change the trees)
+            data = DATA_VERSION if token == DATA_TOKEN else utils.data_hash(EFFICIENCY)
+            fingerprints = {focus_col: utils.model_fingerprint(focus_col, data, config.SEED,
+                                                               holdout=rf.HOLDOUT_FRACTION, **MODEL_PARAMS)
+                            for focus_col in PREDICTED_STATS}
+
+            HOLDOUT.clear()
+            HOLDOUT[token] = {'train': df_train, 'holdout': df_holdout, 'x_feat_list': x_feat_list,
+                              'fingerprints': fingerprints}
+        return HOLDOUT[token]
+
+
+def get_importances(focus_col):
+    """ Retrieve the permutation importances of the random forest regressor that predicts a y-variable, measured on
+        the held-out rows the regressor was not trained on
+    Args:
+        focus_col (str): y-variable of interest (sleep efficiency, REM sleep percentage, or deep sleep percentage)
+    Returns:
+        x_feat_list (list of str): the regressor's features
+        importances (np.array): the mean drop in the regressor's r^2 value when each feature is shuffled
+    """
+    data = holdout_data()
+    df_holdout, x_feat_list, fingerprint = data['holdout'], data['x_feat_list'], data['fingerprints'][focus_col]
 
-    # helps the user to navigate through the density contour plot
-    elif query == 'contour-help':
-        return [html.H3('... how various features affect sleep efficiency (contour plot)'),
-                html.P('Choose two sleep variables. In tandem with the sleep efficiency slider, '
-                       'this plot will display the correlations of the two selected variables '
-                       'against each other, with the colors displaying the sleep efficiency. '
-                       'Yellow is ideal, whereas blue and purple are not. Hover over areas to display '
-                       'what the factor values are (eg. looking at deep sleep and sleep duration, '
-                       'hover over the yellow areas to display the sleep efficiency percentage, '
-                       'value of deep sleep, and value of sleep duration).'),
-
-                # a video that helps the user to navigate through the density contour plot
-                html.Video(
-                    controls=True,
-                    id='contour-diagrams',
-                    src='assets/second_diagrams.mp4',
-                    style={'height': '50%', 'width': '50%'}
-                )]
+    # the shared cache lets one worker reuse the importances another has already measured without even loading the
+    # regressor
+    def measure(focus_col, fingerprint):
+        return rf.permutation_importance(get_forest(focus_col, holdout=True), df_holdout.loc[:, x_feat_list].values,
+                                         df_holdout.loc[:, focus_col].values, workers=config.IMPORTANCE_WORKERS,
+                                         version=fingerprint)
 
-    # helps the user to navigate through the feature importance bar plot
-    elif query == 'bar-help':
-        return [html.H3('... which variables are most important in determining sleep efficiency, '
-                        'REM sleep percentage, or deep sleep percentage'),
-                html.P('Select which outcome-- sleep efficiency, REM sleep percentage, or '
-                       'deep sleep percentage-- you would like to see the feature importance values '
-                       'for. The importance values are determined by how much they aid the random '
-                       'forest regressor in predicting the outcome selected.'),
-
-                # a video that helps the user to navigate through the feature importance bar plot
-                html.Video(
-                    controls=True,
-                    id='bar-diagrams',
-                    src='assets/third_diagrams.mp4',
-                    style={'height': '50%', 'width': '50%'}
-                )]
+    importances = CACHE.get_or_compute('importances', (focus_col, fingerprint), measure)
 
-    # helps the user to navigate through the radar chart
-    elif query == 'hygiene-help':
-        return [html.H3('... comparing sleep hygiene (radar plot)'),
-                html.P('Adjust the sliders to answer the questions and view the display '
-                       'that allows you to compare the average test subject’s sleep hygiene to yours '
-                       'based on your awakenings, caffeine consumption, alcohol consumption, and exercise frequency. '
-                       'You can see where you are above, below, or at average '
-                       'based on where the colors overlap. If the red diamond, which represents you, '
-                       'closely aligns with the blue diamond, which represents the average test subject for the study '
-                       'that provided the data for this dashboard, then the chart indicates that your habits '
-                       'generally align with the average participant in the study.'),
-
-                # a video that helps the user to navigate through the radar chart
-                html.Video(
-                    controls=True,
-                    id='radar-diagrams',
-                    src='assets/third_diagrams.mp4',
-                    style={'height': '50%', 'width': '50%'}
-                )]
+    return x_feat_list, importances
 
-    # helps the user to navigate through the 3D scatter plot
-    elif query == '3d-help':
-        return [html.H3('... two independent variables versus one dependent (3d plot)'),
-                html.P('Choose two independent sleep variables and a dependent sleep variable. '
-                       'The points are color-coded by biological gender, with the '
-                       'blue points representing biological females and the red points representing biological males. '
-                       'Click the gender you do not want to see if you want to filter the data. '
-                       'Then, look at the plot to compare the two independent variables to '
-                       'the dependent.'),
-
-                # a video that helps the user to navigate through the 3D scatter plot
-                html.Video(
-                    controls=True,
-                    id='3d-diagrams',
-                    src='assets/third_diagrams.mp4',
-                    style={'height': '50%', 'width': '50%'}
-                )]
 
-    # helps the user to navigate through the sleep predictor tab
-    elif query == 'ml-help':
-        return [html.H3('... the sleep scores calculator (tab 2)'),
-                html.P('Input your age, bedtime, wakeup time, caffeine consumption habits, '
-                       'biological gender, awakenings in a given night, alcohol consumption habits, '
-                       'smoking habits, and exercise habits. Then, a random forest regressor '
-                       'will use those inputs to predict your sleep efficiency, REM sleep percentage, '
-                       'and deep sleep percentage. Click on the link in the upper left corner for an '
-                       'article explaining the percentages.'),
-
-                # a video that helps the user to navigate through the sleep predictor tab
-                html.Video(
-                    controls=True,
-                    id='ml-diagrams',
-                    src='assets/tab2.mp4',
-                    style={'height': '50%', 'width': '50%'}
-                )]
+def superseded(request):
+    """ Record a sleep quality predictor request and check whether a newer one from the same browser has arrived
+    Args:
+        request (dict): the browser's id ('client') and the request's sequence number ('seq')
+    Returns:
+        (bool): True if the request is stale and its result would be discarded by the browser anyway
+    """
+    # the sequence numbers are kept in the shared cache, so a request is recognized as stale whichever worker handles
+    # it; without a shared tier each process only knows the requests it saw
+    newest = CACHE.record_newest('predictor-requests', request['client'], request['seq'], PREDICTOR_REQUEST_TTL)
+    return newest is not None and request['seq'] < newest
+
+
+def warm_up(host='127.0.0.1', port=8050, timeout=60):
+    """ Train the random forest regressors once the server is accepting connections, so the first visitor does not
+        wait for model training and startup is not delayed by it either
+    Args:
+        host (str): address the dashboard is served on
+        port (int): port the dashboard is served on
+        timeout (float): seconds to wait for the server before warming up anyway
+    """
+    # wait until the server socket accepts connections
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    # train the models used by the sleep quality predictor first, since it predicts in the request thread, then those
+    # of the feature importance chart, and compute the feature importances
+    for focus_col in PREDICTED_STATS:
+        get_forest(focus_col)
+    for focus_col in PREDICTED_STATS:
+        get_importances(focus_col)
+
+
+def start_warm_up(host='127.0.0.1', port=8050):
+    """ Start warming up the models in a background thread (e.g. from a WSGI server's post-fork hook)
+    Args:
+        host (str): address the dashboard is served on
+        port (int): port the dashboard is served on
+    """
+    threading.Thread(target=warm_up, args=(host, port), daemon=True).start()
+
+
+# time every callback and hot-path helper when metrics are turned on in the configuration
+if config.METRICS_ENABLED:
+    instrumentation.install(app)
+
+# allow callback requests to be profiled on demand when a profile directory is configured
+if config.PROFILE_DIR:
+    profiling.install(app, config.PROFILE_DIR, config.PROFILE_TOKEN)
 
 
 def main():
-    # run app
-    app.run_server(debug=True)
+    # train the models in the background once the server is up, then run app
+    start_warm_up()
+    app.run(debug=True)
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -19,15 +19,20 @@ REM sleep percentage, and 0.35 for predicting deep sleep percentage.
 
 It appears that just using the top 3 important features to make predictions actually makes the random forest
 regressors worse (lower cross-validated r^2). Therefore, we used all the variables in the random forest regressors when
-we made the sleep predictor in sleep.py and random_forest_assets.py"""
+we made the sleep predictor in sleep.py and random_forest_assets.py
+
+The r^2 values are cross-validated with 10 folds by default. Run with --mode oob to estimate them from a single fit
+instead, using each tree's out-of-bag rows (the rows left out of its bootstrap sample) as its test set, which is about
+ten times faster."""
 
 # Import statements
+import argparse
 import numpy as np
 from sklearn.model_selection import KFold
-from copy import copy
 from sklearn.metrics import r2_score
 from sklearn.ensemble import RandomForestRegressor
 from collections import defaultdict
+import config
 import utils
 
 
@@ -65,39 +70,60 @@ def map_feature_import_vals(feat_list, feat_import, sort=True, limit=None):
     return feature_rank
 
 
-def random_forest(x_feat_list, df, y_feat):
+def random_forest(x_feat_list, df, y_feat, seed=config.SEED, mode='kfold', n_jobs=None):
     """ Build a random forest regressor by training and testing it and compute its cross-validated r^2 score
     Args:
         x_feat_list (list): list of x-variables of interest (basis of training data)
         df (Pandas dataframe): a data frame containing data used to help the random forest regressor make predictions
         y_feat (str): y-variable of interest (the testing value)
+        seed (int): seed for the cross-validation folds and the regressor, so that the score is reproducible
+        mode (str): 'kfold' to cross-validate with 10 folds, or 'oob' to score a single fit on each tree's out-of-bag
+                    rows
+        n_jobs (int): number of CPU cores each fit uses (-1 for all of them); defaults to all of them in 'oob' mode and
+                      one in 'kfold' mode
     Return:
-        r_squared (float): cross-validated r^2 score of the model
+        r_squared (float): cross-validated (or out-of-bag) r^2 score of the model
         importance_metrics (list): has tuples that map certain features to their feature importance (mean MSE reduce)
                                    values
     """
     # define the testing value
     y_feat = y_feat
 
-    # extract data from dataframe
-    x = df.loc[:, x_feat_list].values
-    y = df.loc[:, y_feat].values
+    # extract data from dataframe; the features are one float32 matrix (what the regressor trains on) shared by the
+    # models of every target
+    x = utils.feature_matrix(df, x_feat_list)
+    y = df.loc[:, y_feat].to_numpy(dtype=float)
+
+    if mode == 'oob':
+        # a single fit, parallelized over the trees; every row is predicted by the trees that did not train on it
+        random_forest_reg = RandomForestRegressor(random_state=seed, oob_score=True,
+                                                  n_jobs=-1 if n_jobs is None else n_jobs)
+        random_forest_reg.fit(x, y)
+        r_squared = random_forest_reg.oob_score_
+
+        return r_squared, map_feature_import_vals(x_feat_list, random_forest_reg.feature_importances_)
 
     # initialize a random forest regressor
-    random_forest_reg = RandomForestRegressor()
+    random_forest_reg = RandomForestRegressor(random_state=seed, n_jobs=n_jobs)
     y_true = y
 
     # Cross-validation:
     # construction of (non-stratified) kfold object
-    kfold = KFold(n_splits=10, shuffle=True)
+    kfold = KFold(n_splits=10, shuffle=True, random_state=seed)
 
-    # allocate an empty array to store predictions in
-    y_pred = copy(y_true)
+    # allocate an empty array to store predictions in (as floats, so that predictions of whole-number statistics
+    # stored in integer columns are not truncated)
+    y_pred = np.empty(len(y_true))
+
+    # every fold's training and testing rows are copied into the same two buffers instead of new arrays; a buffer's
+    # leading rows are still a contiguous array
+    x_train_buffer = np.empty_like(x)
+    x_test_buffer = np.empty_like(x)
 
     for train_idx, test_idx in kfold.split(x, y_true):
         # build arrays which correspond to x, y train /test
-        x_test = x[test_idx, :]
-        x_train = x[train_idx, :]
+        x_test = np.take(x, test_idx, axis=0, out=x_test_buffer[:len(test_idx)])
+        x_train = np.take(x, train_idx, axis=0, out=x_train_buffer[:len(train_idx)])
         y_true_train = y_true[train_idx]
 
         # fit happens "inplace", we modify the internal state of random_forest_reg to remember all the training samples;
@@ -117,6 +143,11 @@ def random_forest(x_feat_list, df, y_feat):
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Score random forest regressors predicting sleep quality')
+    parser.add_argument('--mode', choices=['kfold', 'oob'], default='kfold',
+                        help='estimate r^2 with 10-fold cross-validation or from out-of-bag predictions')
+    args = parser.parse_args()
+
     # read in the sleep efficiency data frame, which contains information about the sleep quality of multiple subjects
     EFFICIENCY = utils.read_file('data/Sleep_Efficiency.csv')
 
@@ -129,38 +160,41 @@ def main():
 
     # retrieve the r^2 values and the feature importance values associated with the random forest regressors and their
     # predictions about sleep efficiency, REM sleep percentage, and deep sleep percentage
-    r2_sleep_eff, importance_eff = random_forest(x_feat_list, df_sleep, 'Sleep efficiency')
-    r2_rem_sleep, importance_rem = random_forest(x_feat_list, df_sleep, 'REM sleep percentage')
-    r2_deep_sleep, importance_deep = random_forest(x_feat_list, df_sleep, 'Deep sleep percentage')
-
-    # print the cross-validated r^2 values and feature importance metrics
-    print('The cross-validated r2 for predicting sleep efficiency is', r2_sleep_eff, 'and the feature importance '
-                                                                                     'values of the x-variables in '
-                                                                                     'descending order is',
+    r2_sleep_eff, importance_eff = random_forest(x_feat_list, df_sleep, 'Sleep efficiency', mode=args.mode)
+    r2_rem_sleep, importance_rem = random_forest(x_feat_list, df_sleep, 'REM sleep percentage', mode=args.mode)
+    r2_deep_sleep, importance_deep = random_forest(x_feat_list, df_sleep, 'Deep sleep percentage', mode=args.mode)
+
+    # print the r^2 values and feature importance metrics
+    r2_label = 'out-of-bag r2' if args.mode == 'oob' else 'cross-validated r2'
+    print('The', r2_label, 'for predicting sleep efficiency is', r2_sleep_eff, 'and the feature importance '
+                                                                               'values of the x-variables in '
+                                                                               'descending order is',
           importance_eff)
-    print('The cross-validated r2 for predicting REM sleep percentage is', r2_rem_sleep, 'and the feature importance '
-                                                                                         'values of the x-variables in '
-                                                                                         'descending order is',
+    print('The', r2_label, 'for predicting REM sleep percentage is', r2_rem_sleep, 'and the feature importance '
+                                                                                   'values of the x-variables in '
+                                                                                   'descending order is',
           importance_rem)
-    print('The cross-validated r2 for predicting deep sleep percentage is', r2_deep_sleep, 'and the feature importance '
-                                                                                           'values of the x-variables '
-                                                                                           'in descending order is',
+    print('The', r2_label, 'for predicting deep sleep percentage is', r2_deep_sleep, 'and the feature importance '
+                                                                                     'values of the x-variables '
+                                                                                     'in descending order is',
           importance_deep)
 
     # random forest regressor using the top 3 features from each initial model to predict sleep efficiency, REM sleep
     # percentage, and deep sleep percentage
     i_r2_sleep_eff, i_importance_eff = random_forest(['Awakenings', 'Age', 'Alcohol consumption 24 hrs before'
-                                                      ' sleeping (oz)'], df_sleep, 'Sleep efficiency')
+                                                      ' sleeping (oz)'], df_sleep, 'Sleep efficiency',
+                                                     mode=args.mode)
     i_r2_rem_sleep, i_importance_rem = random_forest(['Age', 'Wakeup time', 'Bedtime'], df_sleep,
-                                                     'REM sleep percentage')
+                                                     'REM sleep percentage', mode=args.mode)
     i_r2_deep_sleep, i_importance_deep = random_forest(['Alcohol consumption 24 hrs before sleeping (oz)', 'Age',
-                                                        'Awakenings'], df_sleep, 'Deep sleep percentage')
+                                                        'Awakenings'], df_sleep, 'Deep sleep percentage',
+                                                       mode=args.mode)
 
-    # print the cross-validated r^2 values for the models just using the critical features
-    print('The cross-validated r2 for predicting sleep efficiency with just the critical features is', i_r2_sleep_eff)
-    print('The cross-validated r2 for predicting REM sleep percentage with just the critical features is',
+    # print the r^2 values for the models just using the critical features
+    print('The', r2_label, 'for predicting sleep efficiency with just the critical features is', i_r2_sleep_eff)
+    print('The', r2_label, 'for predicting REM sleep percentage with just the critical features is',
           i_r2_rem_sleep)
-    print('The cross-validated r2 for predicting deep sleep percentage with just the critical features is',
+    print('The', r2_label, 'for predicting deep sleep percentage with just the critical features is',
           i_r2_deep_sleep)
 
 
@@ -17,15 +17,113 @@ It appears that just using the top 3 features indicated by a random forest regre
 REM sleep percentage, and deep sleep percentage actually makes the regression models worse (lower R^2 values).
 Additionally, all the created multiple linear regression models yield lower R^2 values than a corresponding random
 forest regressor that predicts the same value. Therefore, our sleep predictors in random_forest_assets.py and sleep.py
-only use a random forest regressor. """
+only use a random forest regressor.
+
+The models are fitted in closed form by GramRegression, which keeps the means and the centered cross products
+(the Gram matrix) of every candidate feature and target. Once those are computed, the least squares fit and R^2 value of
+any feature subset and target follow from a small linear system without touching the data again, and new rows can be
+folded in as they arrive without refitting from scratch. """
 
 # import statements
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import r2_score
+import numpy as np
 import utils
 
 
-def mult_reg(df, x_feat_list, y_feat):
+class GramRegression:
+    """ Multiple linear regression models for any subset of a set of features, solved from sufficient statistics """
+
+    def __init__(self, x_feat_list, y_feat_list):
+        """ Start with no rows
+        Args:
+            x_feat_list (list of str): the candidate features the models can use
+            y_feat_list (list of str): the target variables the models can predict
+        """
+        self.x_feat_list = list(x_feat_list)
+        self.y_feat_list = list(y_feat_list)
+        self.columns = self.x_feat_list + [col for col in self.y_feat_list if col not in self.x_feat_list]
+        self.index = {col: i for i, col in enumerate(self.columns)}
+
+        # number of rows, column means and centered cross products (sum of (a - mean_a) * (b - mean_b) over the rows)
+        self.count = 0
+        self.mean = np.zeros(len(self.columns))
+        self.comoment = np.zeros((len(self.columns), len(self.columns)))
+
+    def update(self, df):
+        """ Add rows to the statistics, merging their means and cross products with the ones seen so far
+        Args:
+            df (Pandas data frame): the new rows, with every feature and target column
+        """
+        data = utils.feature_matrix(df, self.columns, dtype='float64')
+        rows = len(data)
+        if rows == 0:
+            return
+
+        # centering each batch on its own mean (and merging the batches with the parallel formula) keeps the cross
+        # products accurate, unlike summing raw products of large values
+        batch_mean = data.mean(axis=0)
+        centered = data - batch_mean
+        delta = batch_mean - self.mean
+        total = self.count + rows
+
+        self.comoment += centered.T @ centered + np.outer(delta, delta) * (self.count * rows / total)
+        self.mean += delta * (rows / total)
+        self.count = total
+
+    def _positions(self, x_feat_list, y_feat):
+        """ Look up the positions of a feature subset and a target in the statistics """
+        x_feat_list = self.x_feat_list if x_feat_list is None else list(x_feat_list)
+        return [self.index[feat] for feat in x_feat_list], self.index[y_feat]
+
+    def solve(self, y_feat, x_feat_list=None):
+        """ Compute the least squares coefficients of a model
+        Args:
+            y_feat (str): the target variable
+            x_feat_list (list of str): the features the model uses; defaults to all candidate features
+        Returns:
+            coefs (np.array): a coefficient for each feature
+            intercept (float): the model's intercept
+        """
+        x_idx, y_idx = self._positions(x_feat_list, y_feat)
+
+        # the normal equations of the centered data; lstsq also copes with constant or duplicate features
+        coefs = np.linalg.lstsq(self.comoment[np.ix_(x_idx, x_idx)], self.comoment[x_idx, y_idx], rcond=None)[0]
+        intercept = self.mean[y_idx] - self.mean[x_idx] @ coefs
+
+        return coefs, intercept
+
+    def r2(self, y_feat, x_feat_list=None):
+        """ Compute the r^2 value of a model on the rows it was fitted to
+        Args:
+            y_feat (str): the target variable
+            x_feat_list (list of str): the features the model uses; defaults to all candidate features
+        Returns:
+            r_squared (float): the r^2 value of the model's predictions
+        """
+        x_idx, y_idx = self._positions(x_feat_list, y_feat)
+        coefs, intercept = self.solve(y_feat, x_feat_list)
+
+        # residual sum of squares, expanded in terms of the cross products
+        total = self.comoment[y_idx, y_idx]
+        residual = total - 2 * coefs @ self.comoment[x_idx, y_idx] + coefs @ self.comoment[np.ix_(x_idx, x_idx)] @ coefs
+
+        return 1 - residual / total
+
+    def predict(self, df, y_feat, x_feat_list=None):
+        """ Predict a target variable for new rows
+        Args:
+            df (Pandas data frame): the rows to predict for, with the model's feature columns
+            y_feat (str): the target variable
+            x_feat_list (list of str): the features the model uses; defaults to all candidate features
+        Returns:
+            y_pred (np.array): the predictions
+        """
+        x_feat_list = self.x_feat_list if x_feat_list is None else list(x_feat_list)
+        coefs, intercept = self.solve(y_feat, x_feat_list)
+
+        return utils.feature_matrix(df, x_feat_list, dtype='float64') @ coefs + intercept
+
+
+def mult_reg(df, x_feat_list, y_feat, regression=None):
     """
     Computes the r^2 value of a multiple regression model
 
@@ -33,27 +131,19 @@ def mult_reg(df, x_feat_list, y_feat):
         df (Pandas data frame): a dataframe containing data of interest
         x_feat_list (list of strings): a list of columns containing data that helps the model make predictions
         y_feat (string): the target variable of interest
+        regression (GramRegression): statistics already computed from df that cover x_feat_list and y_feat; they are
+                                     computed from df if not passed
 
     Returns:
         r_squared (float): the r^2 value associated with how well the model makes its predictions
     """
-    # initialize regression object
-    reg = LinearRegression()
-
-    # get target variable
-    # (note: since we are indexing the x features with a list, the array for the independent features is guaranteed to
-    # be two-dimensional and not require reshaping)
-    x = df.loc[:, x_feat_list].values
-    y = df.loc[:, y_feat].values
-
-    # fit the multiple regression model
-    reg.fit(x, y)
-
-    # the machine learning model makes predictions based on the values inputted by the user
-    y_pred = reg.predict(x)
+    # compute the sufficient statistics of the features and the target
+    if regression is None:
+        regression = GramRegression(x_feat_list, [y_feat])
+        regression.update(df)
 
     # compute r^2, which will get returned
-    r_squared = r2_score(y_true=y, y_pred=y_pred)
+    r_squared = regression.r2(y_feat, x_feat_list)
 
     return r_squared
 
@@ -69,11 +159,15 @@ def main():
     # deep sleep percentage
     df_sleep, x_feat_list = utils.get_x_feat(EFFICIENCY)
 
+    # compute the sufficient statistics of every feature and target once; each model below is solved from them
+    regression = GramRegression(x_feat_list, ['Sleep efficiency', 'REM sleep percentage', 'Deep sleep percentage'])
+    regression.update(df_sleep)
+
     # calculate the r^2 values associated with the ability of multiple regression models to predict a user's sleep
     # efficiency, REM sleep percentage, and deep sleep percentage
-    r2_eff = mult_reg(df_sleep, x_feat_list, 'Sleep efficiency')
-    r2_rem = mult_reg(df_sleep, x_feat_list, 'REM sleep percentage')
-    r2_deep = mult_reg(df_sleep, x_feat_list, 'Deep sleep percentage')
+    r2_eff = mult_reg(df_sleep, x_feat_list, 'Sleep efficiency', regression)
+    r2_rem = mult_reg(df_sleep, x_feat_list, 'REM sleep percentage', regression)
+    r2_deep = mult_reg(df_sleep, x_feat_list, 'Deep sleep percentage', regression)
 
     # print the r^2 values
     print('The r2 for predicting sleep efficiency is', r2_eff)
@@ -83,10 +177,10 @@ def main():
     # using only the top 3 features (based on a random forest regressor) for the multiple regression model to predict a
     # user's sleep efficiency, REM sleep percentage, and deep sleep percentage
     i_r2_eff = mult_reg(df_sleep, ['Awakenings', 'Age', 'Alcohol consumption 24 hrs before sleeping (oz)'],
-                                   'Sleep efficiency')
-    i_r2_rem = mult_reg(df_sleep, ['Age', 'Wakeup time', 'Bedtime'], 'REM sleep percentage')
+                                   'Sleep efficiency', regression)
+    i_r2_rem = mult_reg(df_sleep, ['Age', 'Wakeup time', 'Bedtime'], 'REM sleep percentage', regression)
     i_r2_deep = mult_reg(df_sleep, ['Alcohol consumption 24 hrs before sleeping (oz)', 'Age', 'Awakenings'],
-                                    'Deep sleep percentage')
+                                    'Deep sleep percentage', regression)
 
     # print the r^2 values for the models just using the critical features
     print('The r2 for predicting sleep efficiency with just the critical features is', i_r2_eff)
@@ -0,0 +1,253 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (stats_cube.py)
+April 19, 2023
+
+stats_cube.py: A precomputed summary-statistics cube of the sleep data, which the charts on the Sleep Statistics tab
+               query instead of scanning every row of the data on each callback
+
+Every column is a dimension of the cube: gender and smoking status by their categories, and each numeric column by bins
+(one bin per whole number for columns of whole numbers with a small range, such as awakenings, and for sleep efficiency,
+which the charts filter by whole percentages; MAX_BINS equal-width bins otherwise). The rows are reduced to their bin
+codes once. A cuboid over a few dimensions (e.g. gender x REM sleep percentage) holds the number of rows in each cell
+together with the sum and sum of squares of the measure (sleep efficiency) in it; it is built from the bin codes the
+first time a chart needs it and kept from then on, so a chart's cost depends on its number of cells rather than on the
+number of rows.
+
+update() adds new rows to the cube and to every cuboid already built, without recomputing them from every row. The
+cells' arrays are replaced rather than changed, so queries running at the same time never see them half updated. The
+bins are fixed when the cube is created: new values outside a column's range are counted in its first or last bin.
+"""
+# import statements
+import threading
+import numpy as np
+import pandas as pd
+import utils
+
+# the measure summed in every cell
+MEASURE = 'Sleep efficiency'
+
+# most bins of a numeric column whose values aren't whole numbers within a small range
+MAX_BINS = 30
+
+
+def is_whole(values):
+    """ Check whether a numeric column only holds whole numbers (allowing for float32 rounding, e.g. 0.57 * 100) """
+    values = values.to_numpy(dtype=float)
+    return bool(np.all(np.abs(values - np.round(values)) < 1e-3))
+
+
+def bin_edges(values, max_bins=MAX_BINS, whole=False):
+    """ Choose the bin edges of a numeric column
+    Args:
+        values (Pandas series): the column's values
+        max_bins (int): most bins
+        whole (bool): give every whole number its own bin, however many there are
+    Returns:
+        edges (np.array): the bin edges, one more than the number of bins
+    """
+    least, most = float(np.round(values.min(), 3)), float(np.round(values.max(), 3))
+
+    # whole numbers within a small range get a bin each, centered on the number, so they are counted exactly
+    if whole or (is_whole(values) and most - least < max_bins):
+        return np.arange(least - 0.5, most + 1.5)
+
+    if most == least:
+        most = least + 1
+    return np.linspace(least, most, max_bins + 1)
+
+
+def quantile_points(counts, edges, n_points=101, discrete=False):
+    """ Approximate a binned distribution's quantiles, spreading each bin's rows evenly across it
+    Args:
+        counts (np.array): number of rows in each bin
+        edges (np.array): the bin edges
+        n_points (int): number of evenly spaced quantiles
+        discrete (bool): every row in a bin has the value at the bin's center (e.g. one bin per whole number)
+    Returns:
+        (np.array): the quantiles, or an empty array if there are no rows
+    """
+    total = counts.sum()
+    if total == 0:
+        return np.empty(0)
+
+    cumulative = np.concatenate([[0], np.cumsum(counts)])
+    targets = np.linspace(0, total, n_points)
+    bins = np.clip(np.searchsorted(cumulative, targets, side='left') - 1, 0, len(counts) - 1)
+    if discrete:
+        return (edges[bins] + edges[bins + 1]) / 2
+    within = (targets - cumulative[bins]) / np.maximum(counts[bins], 1)
+
+    return edges[bins] + np.clip(within, 0, 1) * (edges[bins + 1] - edges[bins])
+
+
+def kde_bandwidth(counts, edges, discrete=False):
+    """ Estimate the kernel density bandwidth Plotly chooses for a violin of every row of a binned distribution
+        (Silverman's rule of thumb), so a violin drawn from a few quantile_points is as smooth as one of all the rows
+    Args:
+        counts (np.array): number of rows in each bin
+        edges (np.array): the bin edges
+        discrete (bool): every row in a bin has the value at the bin's center
+    Returns:
+        (float): the bandwidth, or None to leave it to Plotly (fewer than two rows, or no spread)
+    """
+    total = counts.sum()
+    if total < 2:
+        return None
+
+    centers = (edges[:-1] + edges[1:]) / 2
+    mean = np.average(centers, weights=counts)
+    std = np.sqrt(np.average((centers - mean) ** 2, weights=counts) * total / (total - 1))
+    first, third = quantile_points(counts, edges, 5, discrete)[[1, 3]]
+    spread = min(std, (third - first) / 1.349) if third > first else std
+    if spread <= 0:
+        return None
+
+    return 1.059 * spread * total ** -0.2
+
+
+class StatsCube:
+    """ Counts, sums and sums of squares of the measure over the binned columns of the sleep data """
+
+    def __init__(self, df, max_bins=MAX_BINS):
+        """ Choose each column's bins and reduce the rows to their bin codes
+        Args:
+            df (Pandas data frame): the parsed sleep data
+            max_bins (int): most bins of a numeric column
+        """
+        self.categories = {col: values for col, values in utils.CATEGORIES.items() if col in df.columns}
+        self.edges = {col: bin_edges(df[col], max_bins, whole=col == MEASURE and is_whole(df[col]))
+                      for col in df.columns
+                      if col not in self.categories and col != 'ID' and pd.api.types.is_numeric_dtype(df[col])}
+
+        # the columns with a bin per whole number
+        self.discrete = {col for col, edges in self.edges.items() if np.all(np.diff(edges) == 1) and is_whole(df[col])}
+        self.rows = 0
+        self._codes = {col: [] for col in list(self.categories) + list(self.edges)}
+        self._measure = []
+        self._cuboids = {}
+        self._lock = threading.Lock()
+        self.update(df)
+
+    def shape(self, col):
+        """ Number of cells of a dimension """
+        return len(self.categories[col]) if col in self.categories else len(self.edges[col]) - 1
+
+    def centers(self, col):
+        """ The value each cell of a dimension stands for (0, 1, ... for a categorical column's categories) """
+        if col in self.categories:
+            return np.arange(len(self.categories[col]))
+
+        edges = self.edges[col]
+        return (edges[:-1] + edges[1:]) / 2
+
+    def _encode(self, df):
+        """ Compute the bin codes of some rows
+        Args:
+            df (Pandas data frame): the rows
+        Returns:
+            codes (dict): each dimension's codes, with -1 for missing values
+        """
+        codes = {}
+        for col, categories in self.categories.items():
+            codes[col] = pd.Categorical(df[col], categories=categories).codes.astype(np.int16)
+        for col, edges in self.edges.items():
+            values = df[col].to_numpy(dtype=float)
+            code = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2).astype(np.int16)
+            code[np.isnan(values)] = -1
+            codes[col] = code
+
+        return codes
+
+    def _cell_sums(self, dims, codes, measure):
+        """ Count the rows of each cell of a cuboid and sum their measure
+        Args:
+            dims (tuple of str): the cuboid's dimensions
+            codes (dict): each dimension's bin codes
+            measure (np.array): the rows' measure
+        Returns:
+            (list of np.arrays): the counts, sums and sums of squares, shaped like the cuboid
+        """
+        shape = tuple(self.shape(col) for col in dims)
+        keep = np.logical_and.reduce([codes[col] >= 0 for col in dims]) & ~np.isnan(measure)
+        cells = np.ravel_multi_index(tuple(codes[col][keep] for col in dims), shape)
+        kept = measure[keep]
+
+        return [np.bincount(cells, weights=weights, minlength=int(np.prod(shape))).reshape(shape)
+                for weights in (None, kept, kept * kept)]
+
+    def update(self, df):
+        """ Add rows to the cube and to every cuboid already built
+        Args:
+            df (Pandas data frame): the new rows, with the same columns as the data the cube was created from
+        """
+        codes = self._encode(df)
+        measure = df[MEASURE].to_numpy(dtype=float)
+
+        with self._lock:
+            for col, code in codes.items():
+                self._codes[col].append(code)
+            self._measure.append(measure)
+
+            # the sums are replaced rather than added to in place, so a query reading the old ones outside the lock
+            # sees them whole
+            for dims, sums in self._cuboids.items():
+                added = self._cell_sums(dims, codes, measure)
+                self._cuboids[dims] = [total + more for total, more in zip(sums, added)]
+            self.rows += len(df)
+
+    def cuboid(self, dims):
+        """ Get the counts, sums and sums of squares of the measure over some dimensions, building them the first time
+        Args:
+            dims (tuple of str): the dimensions
+        Returns:
+            (list of np.arrays): the counts, sums and sums of squares, with one axis per dimension; they are never
+                                 changed once returned (update replaces them), so they can be read without the lock
+        """
+        dims = tuple(dims)
+        with self._lock:
+            if dims not in self._cuboids:
+                # the chunks of codes added by update are joined once, so later cuboids are built from single arrays
+                for col in self._codes:
+                    self._codes[col] = [np.concatenate(self._codes[col])]
+                self._measure = [np.concatenate(self._measure)]
+
+                codes = {col: chunks[0] for col, chunks in self._codes.items()}
+                self._cuboids[dims] = self._cell_sums(dims, codes, self._measure[0])
+
+            return self._cuboids[dims]
+
+    def query(self, dims, ranges=None):
+        """ Summarize the rows over some dimensions, keeping only the rows within ranges of other columns
+        Args:
+            dims (list of str): the dimensions to keep
+            ranges (dict): maps columns to (least, most) value ranges; a cell is kept when the value it stands for is
+                           within the range
+        Returns:
+            (list of np.arrays): the counts, sums and sums of squares of the measure, with one axis per dimension
+        """
+        ranges = ranges or {}
+        dims = list(dims)
+        extra = [col for col in ranges if col not in dims]
+        sums = self.cuboid(dims + extra)
+
+        # keep the cells within each range, then add up the dimensions that only filter
+        index = []
+        for col in dims + extra:
+            if col in ranges:
+                least, most = ranges[col]
+                centers = self.centers(col)
+                index.append((centers >= least) & (centers <= most))
+            else:
+                index.append(slice(None))
+        axes = tuple(range(len(dims), len(dims) + len(extra)))
+
+        results = []
+        for values in sums:
+            for axis, keep in enumerate(index):
+                if not isinstance(keep, slice):
+                    values = np.compress(keep, values, axis=axis)
+            results.append(values.sum(axis=axes) if axes else values)
+
+        return results
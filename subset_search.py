@@ -0,0 +1,285 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (subset_search.py)
+April 19, 2023
+
+subset_search.py: Searching the feature subsets of the sleep models for the ones that predict best for their speed
+
+sleep_forest.py and sleep_mult_reg.py only compare all the features against one hand-picked top-3 subset per target.
+This file scores every subset of the utils.get_x_feat features (or, for the slower random forest regressors, a beam of
+the best subsets of each size) by its cross-validated r^2 value and by the cost of a prediction: the arithmetic
+operations per row for linear models (a subset of k features costs 2k + 1), whose predictions are too fast to time
+apart from the timer's noise, and the measured latency for random forest regressors. The subsets of every target are
+scored in one pool of worker processes that share the same cross-validation folds; the linear models of each fold are
+solved from that fold's sufficient statistics, computed once for all the targets (see sleep_mult_reg.GramRegression), so
+no model is fitted from the data more than once per fold. The search reports the accuracy/cost Pareto front of each
+target and the smallest model that reaches a target r^2 value.
+
+Usage:
+    python subset_search.py                                      # all subsets of linear models
+    python subset_search.py --model forest --strategy beam       # a beam search over random forest regressors
+    python subset_search.py --target-r2 0.5 --workers 4
+"""
+# import statements
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.model_selection import KFold
+from sklearn.metrics import r2_score
+import config
+import utils
+from sleep_mult_reg import GramRegression
+
+# the sleep statistics the models predict
+TARGETS = ['Sleep efficiency', 'REM sleep percentage', 'Deep sleep percentage']
+
+# number of cross-validation folds
+N_SPLITS = 10
+
+# number of rows predicted at once when timing a model's prediction latency
+LATENCY_ROWS = 1000
+
+# the data, folds and fold statistics shared by the subset evaluations, set once per worker process
+_STATE = {}
+
+
+def make_folds(rows, n_splits=N_SPLITS, seed=config.SEED):
+    """ Split row positions into cross-validation folds, so every subset is scored on the same folds
+    Args:
+        rows (int): number of rows
+        n_splits (int): number of folds
+        seed (int): seed for shuffling the rows
+    Returns:
+        folds (list of tuples): (training row positions, testing row positions) for each fold
+    """
+    kfold = KFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    return list(kfold.split(np.arange(rows)))
+
+
+def fold_statistics(df, x_feat_list, targets, folds):
+    """ Compute the sufficient statistics of each fold's training rows
+    Args:
+        df (Pandas data frame): the sleep data, with the features and targets
+        x_feat_list (list of str): the candidate features
+        targets (list of str): the target variables
+        folds (list of tuples): the cross-validation folds from make_folds
+    Returns:
+        (list of GramRegression): the statistics of each fold's training rows
+    """
+    statistics = []
+    for train_idx, test_idx in folds:
+        regression = GramRegression(x_feat_list, targets)
+        regression.update(df.iloc[train_idx])
+        statistics.append(regression)
+
+    return statistics
+
+
+def _init_worker(x, y, x_feat_list, folds, statistics, model, seed):
+    """ Keep the data shared by the subset evaluations in a worker process """
+    _STATE.update(x=x, y=y, x_feat_list=x_feat_list, folds=folds, statistics=statistics, model=model, seed=seed)
+
+
+def linear_cost(subset):
+    """ Count the arithmetic operations a linear model makes per predicted row: a multiplication and an addition for
+        each feature, and the intercept's addition
+    Args:
+        subset (tuple of str): the features the model uses
+    Returns:
+        (int): the operations per row
+    """
+    return 2 * len(subset) + 1
+
+
+def _latency(predict, x):
+    """ Time a model's predictions
+    Args:
+        predict (function): makes predictions for the rows of x
+        x (np.array): the rows to predict for
+    Returns:
+        (float): the fastest of several runs, in seconds per row
+    """
+    times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        predict(x)
+        times.append(time.perf_counter() - start)
+
+    return min(times) / len(x)
+
+
+def evaluate_subset(subset, target):
+    """ Score a feature subset by its cross-validated r^2 value and its prediction cost (runs in a worker process)
+    Args:
+        subset (tuple of str): the features the model uses
+        target (str): the target variable
+    Returns:
+        (dict): the subset's features, target, cross-validated r^2 value and cost (operations per predicted row for
+                linear models, see linear_cost; seconds per predicted row for random forest regressors)
+    """
+    x, y = _STATE['x'], _STATE['y'][target]
+    columns = [_STATE['x_feat_list'].index(feat) for feat in subset]
+    x_subset = x[:, columns]
+    y_pred = np.empty(len(y))
+
+    if _STATE['model'] == 'linear':
+        # each fold's model is solved from the statistics of its training rows
+        for (train_idx, test_idx), regression in zip(_STATE['folds'], _STATE['statistics']):
+            coefs, intercept = regression.solve(target, subset)
+            y_pred[test_idx] = x_subset[test_idx] @ coefs + intercept
+
+        cost = linear_cost(subset)
+    else:
+        from sklearn.ensemble import RandomForestRegressor
+
+        random_forest_reg = RandomForestRegressor(random_state=_STATE['seed'])
+        for train_idx, test_idx in _STATE['folds']:
+            random_forest_reg.fit(x_subset[train_idx], y[train_idx])
+            y_pred[test_idx] = random_forest_reg.predict(x_subset[test_idx])
+
+        cost = _latency(random_forest_reg.predict, x_subset[:LATENCY_ROWS])
+
+    return {'features': tuple(subset), 'target': target, 'r2': r2_score(y_true=y, y_pred=y_pred), 'cost': cost}
+
+
+def all_subsets(x_feat_list, max_size=None):
+    """ List every non-empty feature subset
+    Args:
+        x_feat_list (list of str): the candidate features
+        max_size (int): largest subset size; defaults to all the features
+    Returns:
+        (list of tuples): the subsets
+    """
+    sizes = range(1, (max_size or len(x_feat_list)) + 1)
+    return [subset for size in sizes for subset in itertools.combinations(x_feat_list, size)]
+
+
+def search(df, x_feat_list, targets, model='linear', strategy='all', beam_width=5, workers=None, seed=config.SEED):
+    """ Score the feature subsets of a model for several targets, with one set of folds, fold statistics and worker
+        processes shared by all of them
+    Args:
+        df (Pandas data frame): the sleep data, with the features and targets
+        x_feat_list (list of str): the candidate features
+        targets (list of str): the target variables
+        model (str): 'linear' for multiple linear regression or 'forest' for random forest regressors
+        strategy (str): 'all' to score every subset, or 'beam' to grow only the beam_width best subsets of each size by
+                        one feature at a time
+        beam_width (int): number of subsets of each size kept by the beam search
+        workers (int): number of worker processes; defaults to the number of CPUs
+        seed (int): seed for the cross-validation folds and the random forest regressors
+    Returns:
+        results (dict): maps each target to the features, cross-validated r^2 value and cost of every scored subset
+    """
+    folds = make_folds(len(df), seed=seed)
+    statistics = fold_statistics(df, x_feat_list, targets, folds) if model == 'linear' else None
+    x = df.loc[:, x_feat_list].to_numpy(dtype=float)
+    y = {target: df.loc[:, target].to_numpy(dtype=float) for target in targets}
+    workers = workers or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(x, y, x_feat_list, folds, statistics, model, seed)) as executor:
+        def score(tasks):
+            chunksize = max(1, len(tasks) // (4 * workers))
+            return list(executor.map(evaluate_subset, *zip(*tasks), chunksize=chunksize))
+
+        results = {target: [] for target in targets}
+        if strategy == 'all':
+            # every target's subsets go to the workers together
+            for result in score([(subset, target) for target in targets for subset in all_subsets(x_feat_list)]):
+                results[result['target']].append(result)
+            return results
+
+        # beam search: grow the best subsets of each size by every feature they don't have yet, for every target at once
+        beams = {target: [()] for target in targets}
+        for _ in range(len(x_feat_list)):
+            tasks = [(subset, target) for target in targets
+                     for subset in sorted({tuple(sorted(subset + (feat,), key=x_feat_list.index))
+                                           for subset in beams[target] for feat in x_feat_list if feat not in subset})]
+            scored = {target: [] for target in targets}
+            for result in score(tasks):
+                scored[result['target']].append(result)
+            for target in targets:
+                results[target].extend(scored[target])
+                beams[target] = [result['features'] for result in
+                                 sorted(scored[target], key=lambda result: -result['r2'])[:beam_width]]
+
+        return results
+
+
+def pareto_front(results):
+    """ Find the subsets that no other subset beats in both accuracy and cost
+    Args:
+        results (list of dicts): scored subsets of one target from search
+    Returns:
+        front (list of dicts): the Pareto-optimal subsets, from cheapest to most accurate
+    """
+    front = []
+    for result in sorted(results, key=lambda result: (result['cost'], -result['r2'])):
+        if not front or result['r2'] > front[-1]['r2']:
+            front.append(result)
+
+    return front
+
+
+def smallest_model(results, target_r2):
+    """ Find the model with the fewest features (then the lowest cost) that reaches an r^2 value
+    Args:
+        results (list of dicts): scored subsets of one target from search
+        target_r2 (float): the r^2 value the model must reach
+    Returns:
+        (dict): the chosen subset, or None if no subset reaches target_r2
+    """
+    good_enough = [result for result in results if result['r2'] >= target_r2]
+    if not good_enough:
+        return None
+
+    return min(good_enough, key=lambda result: (len(result['features']), result['cost']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the feature subsets of the sleep models')
+    parser.add_argument('--model', choices=['linear', 'forest'], default='linear', help='type of model')
+    parser.add_argument('--strategy', choices=['all', 'beam'], default='all', help='which subsets to score')
+    parser.add_argument('--beam-width', type=int, default=5, help='subsets of each size kept by the beam search')
+    parser.add_argument('--target-r2', type=float, default=None,
+                        help='report the smallest model reaching this r^2 (default: 95%% of the best r^2)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=config.SEED,
+                        help='seed for the folds and the random forest regressors (default: SLEEP_SEED or 0)')
+    args = parser.parse_args()
+
+    # read in and parse the sleep data, and encode its categorical variables
+    df_sleep, x_feat_list = utils.get_x_feat(utils.parse_times(utils.read_file('data/Sleep_Efficiency.csv')))
+
+    start = time.perf_counter()
+    results_by_target = search(df_sleep, x_feat_list, TARGETS, args.model, args.strategy, args.beam_width,
+                               args.workers, args.seed)
+    print('scored {} subsets in {:.1f}s'.format(sum(len(results) for results in results_by_target.values()),
+                                                time.perf_counter() - start))
+
+    for target, results in results_by_target.items():
+        print('{}: {} subsets'.format(target, len(results)))
+
+        # print the accuracy/cost trade-offs
+        for result in pareto_front(results):
+            cost = ('{:>3d} ops/row'.format(result['cost']) if args.model == 'linear'
+                    else '{:>9.3f} us/row'.format(result['cost'] * 1e6))
+            print('    r2 {:>7.4f}   {}   {}'.format(result['r2'], cost, ', '.join(result['features'])))
+
+        best = max(result['r2'] for result in results)
+        target_r2 = best * 0.95 if args.target_r2 is None else args.target_r2
+        chosen = smallest_model(results, target_r2)
+        if chosen is None:
+            print('    no subset reaches r2 {:.4f}'.format(target_r2))
+        else:
+            print('    smallest model reaching r2 {:.4f}: {} (r2 {:.4f})'.format(target_r2,
+                                                                               ', '.join(chosen['features']),
+                                                                               chosen['r2']))
+
+
+if __name__ == '__main__':
+    main()
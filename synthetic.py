@@ -0,0 +1,356 @@
+"""
+Colbe Chang, Jocelyn Ju, Jethro R. Lee, Michelle Wang, and Ceara Zhang
+DS3500
+Final Project: Sleep Efficiency Dashboard (synthetic.py)
+April 19, 2023
+
+synthetic.py: A generator of synthetic sleep data of any size, for load and scaling tests of the loaders, callbacks and
+              models (e.g. benchmark.py, cli.py and ingest.py)
+
+The generator learns the real sleep data (data/Sleep_Efficiency.csv) as a Gaussian copula: each column keeps its own
+distribution (new values are drawn from the column's observed values, with their observed frequencies), and the columns
+are tied together by a correlation matrix of normal scores, calibrated so the generated columns have the real columns'
+correlations; e.g. sleep efficiency still falls with awakenings and alcohol and rises with deep sleep, as the random
+forests rely on. The columns the others determine are derived
+rather than drawn: the light sleep percentage is what the REM and deep sleep percentages leave of 100, and the wakeup
+time is the bedtime plus the sleep duration, written in the same 'YYYY-MM-DD HH:MM:SS' format as the real file (on the
+bedtime's date, as in the real file, when its wakeup times are). The optional answers are left blank as often as in
+the real file.
+
+Rows are generated in chunks, each from its own seed spawned from the main seed, so a data set depends only on the seed,
+the number of rows and the chunk size, not on how many worker processes generate it. The chunks are generated in
+parallel and written in order to a CSV or Parquet (which needs pyarrow) file.
+
+Usage:
+    python synthetic.py 10000000 --output sleep_10m.csv --seed 1 --workers 4
+    python synthetic.py 1000000 --output sleep_1m.parquet --chunk-rows 200000
+"""
+# import statements
+import argparse
+import collections
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import special
+import config
+
+# rows generated from each seed (and written at a time)
+CHUNK_ROWS = 100000
+
+# the column derived from the REM and deep sleep percentages
+LIGHT = 'Light sleep percentage'
+
+# format of the time of day in the bedtime and wakeup time columns
+CLOCK_FORMAT = '{:02d}:{:02d}:00'
+
+# rows generated, and rounds, while calibrating the correlations
+CALIBRATION_ROWS = 20000
+CALIBRATION_ROUNDS = 8
+
+# the fitted model used by a worker process, set once per process by _init_worker
+_MODEL = []
+
+
+def _init_worker(model):
+    """ Keep the fitted model in a worker process """
+    _MODEL[:] = [model]
+
+
+class SleepDataModel:
+    """ A Gaussian copula of the sleep data's columns, which generates new rows in the real file's format """
+
+    def __init__(self):
+        """ Start unfitted (see fit) """
+        self.columns = []
+        self.dtypes = {}
+        self.drawn = []
+        self.values = {}
+        self.categories = {}
+        self.missing = {}
+        self.cholesky = None
+        self.days = (0, 0)
+        self.same_day_wakeup = True
+        self.min_light = 0
+
+    def fit(self, df):
+        """ Learn each column's distribution and the correlations between the columns
+        Args:
+            df (Pandas data frame): the sleep data, as read from the CSV file (e.g. with pd.read_csv)
+        Returns:
+            self (SleepDataModel): the fitted model
+        """
+        self.columns = list(df.columns)
+        self.dtypes = {col: df[col].dtype for col in df.columns}
+        self.missing = {col: float(df[col].isna().mean()) for col in df.columns if df[col].isna().any()}
+
+        # the bedtime is drawn as hours after noon, so the bedtimes either side of midnight stay next to each other
+        bedtime = pd.to_datetime(df['Bedtime'])
+        wakeup = pd.to_datetime(df['Wakeup time'])
+        drawn = df.drop(columns=['ID', LIGHT, 'Bedtime', 'Wakeup time'])
+        drawn.insert(0, 'Bedtime', (bedtime.dt.hour + bedtime.dt.minute / 60 - 12) % 24)
+
+        # the categorical columns are drawn as their category codes
+        for col in drawn.columns:
+            if not pd.api.types.is_numeric_dtype(drawn[col]):
+                categorical = pd.Categorical(drawn[col])
+                self.categories[col] = np.asarray(categorical.categories, dtype=object)
+                drawn[col] = pd.Series(categorical.codes, index=drawn.index).replace(-1, np.nan)
+        self.drawn = list(drawn.columns)
+        self.values = {col: np.sort(drawn[col].dropna().to_numpy(dtype=float)) for col in self.drawn}
+
+        # drawing through the columns' few, repeated values weakens their correlations, so the normal scores'
+        # correlations start at those of the complete rows and are raised until the generated values have them
+        target = np.nan_to_num(np.corrcoef(drawn.dropna().to_numpy(dtype=float), rowvar=False))
+        normal = np.random.default_rng(0).standard_normal((CALIBRATION_ROWS, len(self.drawn)))
+        latent = target
+        for _ in range(CALIBRATION_ROUNDS):
+            self.cholesky = np.linalg.cholesky(_nearest_correlation(latent))
+            generated = np.nan_to_num(np.corrcoef(self._draw(normal), rowvar=False))
+            latent = np.clip(latent + target - generated, -0.999, 0.999)
+            np.fill_diagonal(latent, 1)
+        self.cholesky = np.linalg.cholesky(_nearest_correlation(latent))
+
+        # the dates, the format of the wakeup times and the smallest light sleep percentage
+        days = bedtime.dt.normalize()
+        self.days = (int(days.min().value // 86400e9), int(days.max().value // 86400e9))
+        self.same_day_wakeup = bool((wakeup.dt.normalize() == days).mean() > 0.5)
+        self.min_light = float(df[LIGHT].min()) if LIGHT in df.columns else 0
+
+        return self
+
+    def _draw(self, normal):
+        """ Turn independent standard normal values into each drawn column's values
+        Args:
+            normal (np.array): a row of standard normal values for each generated row, one per drawn column
+        Returns:
+            (np.array): the drawn columns' values, one column per drawn column
+        """
+        # correlated uniform values, turned into each column's values through its observed values
+        uniform = special.ndtr(normal @ self.cholesky.T)
+        drawn = np.empty_like(uniform)
+        for i, col in enumerate(self.drawn):
+            values = self.values[col]
+            drawn[:, i] = values[np.minimum((uniform[:, i] * len(values)).astype(np.int64), len(values) - 1)]
+
+        return drawn
+
+    def sample(self, rows, rng, first_id=1):
+        """ Generate rows of sleep data
+        Args:
+            rows (int): number of rows
+            rng (np.random.Generator): the random number generator
+            first_id (int): ID of the first row; the rows get consecutive IDs
+        Returns:
+            df (Pandas data frame): the rows, with the real file's columns, types and value formats
+        """
+        drawn = dict(zip(self.drawn, self._draw(rng.standard_normal((rows, len(self.drawn)))).T))
+
+        # the sleep stage percentages add up to 100
+        rem = drawn['REM sleep percentage']
+        drawn['Deep sleep percentage'] = np.minimum(drawn['Deep sleep percentage'], 100 - rem - self.min_light)
+        drawn[LIGHT] = 100 - rem - drawn['Deep sleep percentage']
+
+        # the wakeup time is the bedtime plus the sleep duration
+        day = rng.integers(self.days[0], self.days[1] + 1, rows)
+        bed_minutes = np.round((drawn['Bedtime'] + 12) * 60).astype(np.int64)
+        wake_minutes = bed_minutes + np.round(drawn['Sleep duration'] * 60).astype(np.int64)
+        bed_day = day + bed_minutes // 1440
+        wake_day = bed_day if self.same_day_wakeup else day + wake_minutes // 1440
+
+        df = pd.DataFrame(index=pd.RangeIndex(rows))
+        for col in self.columns:
+            if col == 'ID':
+                values = np.arange(first_id, first_id + rows)
+            elif col == 'Bedtime':
+                values = _timestamps(bed_day, bed_minutes % 1440)
+            elif col == 'Wakeup time':
+                values = _timestamps(wake_day, wake_minutes % 1440)
+            elif col in self.categories:
+                values = self.categories[col][drawn[col].astype(np.int64)]
+            else:
+                values = drawn[col]
+            df[col] = values
+
+        # leave the optional answers blank as often as in the real file
+        for col, rate in self.missing.items():
+            df.loc[rng.random(rows) < rate, col] = np.nan
+
+        return df.astype({col: dtype for col, dtype in self.dtypes.items() if col not in self.missing})
+
+
+def _nearest_correlation(correlation):
+    """ Make a correlation matrix positive definite, so it has a Cholesky factor, by raising its eigenvalues """
+    eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+    fixed = eigenvectors @ np.diag(np.maximum(eigenvalues, 1e-6)) @ eigenvectors.T
+    scale = np.sqrt(np.diag(fixed))
+
+    return fixed / np.outer(scale, scale)
+
+
+def _timestamps(days, minutes):
+    """ Format days since 1970-01-01 and minutes into the day as 'YYYY-MM-DD HH:MM:SS' text
+    Args:
+        days (np.array): the days
+        minutes (np.array): the minutes into each day
+    Returns:
+        (np.array): the timestamps, as strings
+    """
+    # there are few distinct timestamps, so each is formatted once
+    codes, inverse = np.unique(days * 1440 + minutes, return_inverse=True)
+    dates = pd.to_datetime(codes // 1440, unit='D').strftime('%Y-%m-%d')
+    labels = np.array([date + ' ' + CLOCK_FORMAT.format(int(code) % 1440 // 60, int(code) % 60)
+                       for date, code in zip(dates, codes)], dtype=object)
+
+    return labels[inverse]
+
+
+@functools.lru_cache(maxsize=None)
+def load_model(source=config.DATA_FILE):
+    """ Fit the generator to a sleep data file (once per file)
+    Args:
+        source (str): name of the CSV file
+    Returns:
+        (SleepDataModel): the fitted model
+    """
+    return SleepDataModel().fit(pd.read_csv(source))
+
+
+def chunk_plan(rows, seed, chunk_rows=CHUNK_ROWS):
+    """ Split a data set into chunks, each with its own seed
+    Args:
+        rows (int): number of rows in the data set
+        seed (int): the main seed
+        chunk_rows (int): rows in each chunk (the last may have fewer)
+    Returns:
+        (list of tuples): each chunk's seed, number of rows and first ID
+    """
+    starts = range(0, rows, chunk_rows)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+
+    return [(chunk_seed, min(chunk_rows, rows - start), start + 1) for chunk_seed, start in zip(seeds, starts)]
+
+
+def make_chunk(chunk_seed, rows, first_id, file_format=None, model=None):
+    """ Generate one chunk of a data set (runs in a worker process)
+    Args:
+        chunk_seed (np.random.SeedSequence): the chunk's seed
+        rows (int): number of rows
+        first_id (int): ID of the chunk's first row
+        file_format (str): 'csv' to return the rows as CSV text without a header, or None for a data frame
+        model (SleepDataModel): the fitted model, or None for the worker process's model
+    Returns:
+        the chunk, as a data frame or CSV text
+    """
+    model = model or _MODEL[0]
+    df = model.sample(rows, np.random.default_rng(chunk_seed), first_id)
+
+    return df.to_csv(index=False, header=False) if file_format == 'csv' else df
+
+
+def _in_order(executor, tasks, window):
+    """ Run tasks in a process pool, yielding their results in order with at most window of them unwritten """
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(executor.submit(make_chunk, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def sleep_log(rows, seed=0, chunk_rows=CHUNK_ROWS, source=config.DATA_FILE):
+    """ Generate a synthetic sleep log in memory (the same rows as generate writes with the same seed and chunk size)
+    Args:
+        rows (int): number of rows
+        seed (int): the main seed
+        chunk_rows (int): rows generated from each seed
+        source (str): name of the real sleep data file the generator is fitted to
+    Returns:
+        df (Pandas data frame): the synthetic sleep log, as it would be read from the CSV file
+    """
+    model = load_model(source)
+    chunks = [make_chunk(*task, model=model) for task in chunk_plan(rows, seed, chunk_rows)]
+
+    return pd.concat(chunks, ignore_index=True) if chunks else model.sample(0, np.random.default_rng(seed))
+
+
+def generate(filename, rows, seed=0, chunk_rows=CHUNK_ROWS, workers=None, source=config.DATA_FILE):
+    """ Write a synthetic sleep data set to a CSV or Parquet file, generating its chunks in parallel
+    Args:
+        filename (str): name of the file; files ending in .parquet are written as Parquet, all others as CSV
+        rows (int): number of rows
+        seed (int): the main seed
+        chunk_rows (int): rows generated from each seed and written at a time
+        workers (int): worker processes that generate chunks (default: CPU count); 1 generates them in this process
+        source (str): name of the real sleep data file the generator is fitted to
+    Returns:
+        (dict): the number of rows and chunks written and the time taken
+    """
+    start = time.perf_counter()
+    model = load_model(source)
+    file_format = 'parquet' if filename.endswith('.parquet') else 'csv'
+    tasks = [task + (file_format,) for task in chunk_plan(rows, seed, chunk_rows)]
+    workers = workers or os.cpu_count() or 1
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,))
+        chunks = _in_order(executor, tasks, 2 * workers)
+    else:
+        chunks = (make_chunk(*task, model=model) for task in tasks)
+
+    try:
+        if file_format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            writer = None
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(filename, table.schema)
+                writer.write_table(table)
+            if writer is not None:
+                writer.close()
+        else:
+            with open(filename, 'w', newline='') as file:
+                file.write(','.join(model.columns) + '\n')
+                for chunk in chunks:
+                    file.write(chunk)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    seconds = time.perf_counter() - start
+    return {'rows': rows, 'chunks': len(tasks), 'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds) if seconds else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic sleep data set for load and scaling tests')
+    parser.add_argument('rows', type=int, help='rows in the data set')
+    parser.add_argument('--output', required=True, help='.csv or .parquet file to write')
+    parser.add_argument('--seed', type=int, default=config.SEED, help='seed the data set is generated from')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='rows generated from each seed and written at a time')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes that generate chunks (default: CPU count)')
+    parser.add_argument('--source', default=config.DATA_FILE, help='real sleep data CSV file to learn from')
+    args = parser.parse_args()
+
+    # pyarrow is only needed for Parquet files
+    if args.output.endswith('.parquet'):
+        try:
+            import pyarrow
+        except ImportError:
+            parser.error('writing Parquet files needs pyarrow (pip install pyarrow)')
+
+    print(generate(args.output, args.rows, args.seed, args.chunk_rows, args.workers, args.source), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,21 +7,111 @@ April 19, 2023
 utils.py: Helper functions for sleep.py
 """
 # import statements
+import hashlib
+import importlib.metadata
+import json
 import pandas as pd
 import numpy as np
+import memo
 import random_forest_assets as rf
 
+# the smallest integer types that are tried, in order, for columns holding only whole numbers
+INTEGER_TYPES = ['int8', 'int16', 'int32']
 
-def read_file(filename):
+# compact types of the cleaned columns of records that arrive in batches (see ingest.py): they are fixed instead of
+# chosen from each batch's values, so every batch gets the same types (the categorical columns always get CATEGORIES)
+BATCH_DTYPES = {'ID': 'int64', 'Age': 'float32', 'Sleep duration': 'float32', 'Sleep efficiency': 'float32',
+                'REM sleep percentage': 'float32', 'Deep sleep percentage': 'float32',
+                'Light sleep percentage': 'float32', 'Awakenings': 'float32',
+                'Caffeine consumption 24 hrs before sleeping (mg)': 'float32',
+                'Alcohol consumption 24 hrs before sleeping (oz)': 'float32',
+                'Exercise frequency (in days per week)': 'float32'}
+
+# the possible values of the categorical columns; fixing them keeps the one-hot encoding the same for any subset of the
+# rows, even one in which a value never appears
+CATEGORIES = {'Gender': ['Female', 'Male'], 'Smoking status': ['No', 'Yes']}
+
+# columns that are never features of the random forest regressors (the identifier and the sleep quality statistics)
+NON_FEATURES = ['ID', 'Sleep efficiency', 'REM sleep percentage', 'Deep sleep percentage', 'Light sleep percentage']
+
+# the dashboard's labels for the categories of its inputs, where they differ from the data's
+USER_LABELS = {'Gender': {'Biological Male': 'Male', 'Biological Female': 'Female'}}
+
+# the numeric features of the sleep data, in the order of its columns
+USER_FEATURES = ['Age', 'Bedtime', 'Wakeup time', 'Sleep duration', 'Awakenings',
+                 'Caffeine consumption 24 hrs before sleeping (mg)', 'Alcohol consumption 24 hrs before sleeping (oz)',
+                 'Exercise frequency (in days per week)']
+
+
+def compact_dtypes(df, dtypes=None):
+    """ Store a data frame's columns in the smallest data types that hold their values exactly: text columns with few
+    distinct values become categoricals, whole numbers the smallest integer type that fits, and other numbers float32
+    Args:
+        df (Pandas data frame): the data frame to compact
+        dtypes (dict): fixed types of the columns (e.g. BATCH_DTYPES) to use instead of choosing them from the values;
+                       columns it doesn't name keep their types
+    Returns:
+        df (Pandas data frame): the data frame with compact column types
+    """
+    if dtypes is None:
+        dtypes = compact_types(df)
+
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
+
+def compact_types(df):
+    """ Choose the compact data types of a data frame's columns (see compact_dtypes)
+    Args:
+        df (Pandas data frame): the data frame
+    Returns:
+        dtypes (dict): the type of each column that changes type
+    """
+    dtypes = {}
+    for col in df.columns:
+        values = df[col]
+        if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            # categoricals only save memory when values repeat (e.g. gender and smoking status)
+            if not pd.api.types.is_bool_dtype(values) and values.nunique() <= len(values) // 2:
+                dtypes[col] = 'category'
+            continue
+
+        # the checks run on the numpy values, which costs much less per column than the pandas operations
+        array = values.to_numpy(dtype=float)
+        if len(array) and np.all(array % 1 == 0):
+            # whole numbers (stored as floats when the CSV column had blanks)
+            least, most = array.min(), array.max()
+            dtypes[col] = next((dtype for dtype in INTEGER_TYPES
+                                if np.iinfo(dtype).min <= least and most <= np.iinfo(dtype).max), 'int64')
+        else:
+            dtypes[col] = 'float32'
+
+    return dtypes
+
+
+def read_file(filename, compact=True):
     """ Read in a file, convert it to dataframe, and do some cleaning
     Args:
         filename (str): name of file of interest
+        compact (bool): whether to store the columns in compact data types (see compact_dtypes)
     Returns:
         file_copy (Pandas data frame): cleaned dataframe containing the file's data
     """
     # read the CSV files into dataframes
     file = pd.read_csv(filename)
 
+    return clean(file, compact)
+
+
+def clean(file, compact=True, dtypes=None):
+    """ Clean sleep records as they are read from the CSV file (or received in batches, see ingest.py)
+    Args:
+        file (Pandas data frame): the records, with the CSV file's columns; the sleep quality columns may be left out
+        compact (bool): whether to store the columns in compact data types (see compact_dtypes)
+        dtypes (dict): fixed compact types of the cleaned columns, e.g. BATCH_DTYPES for records cleaned a batch at a
+                       time; by default they are chosen from the records' values
+    Returns:
+        file_copy (Pandas data frame): the cleaned records
+    """
     # make a copy of the file
     file_copy = file.copy()
 
@@ -29,13 +119,23 @@ def read_file(filename):
     file_copy = file_copy.dropna()
 
     # multiply sleep efficiencies by 100 to represent them as percentages
-    file_copy.loc[:, 'Sleep efficiency'] = file_copy['Sleep efficiency'] * 100
+    if 'Sleep efficiency' in file_copy.columns:
+        file_copy.loc[:, 'Sleep efficiency'] = file_copy['Sleep efficiency'] * 100
 
     # renaming columns to clarify metrics
     file_copy = file_copy.rename(columns={'Exercise frequency': 'Exercise frequency (in days per week)'})
     file_copy = file_copy.rename(columns={'Caffeine consumption': 'Caffeine consumption 24 hrs before sleeping (mg)'})
     file_copy = file_copy.rename(columns={'Alcohol consumption': 'Alcohol consumption 24 hrs before sleeping (oz)'})
 
+    # the bedtime and wakeup time columns are left as text for parse_times, and the categorical columns get all of their
+    # categories; the columns are converted in a single astype
+    if compact:
+        times = ['Bedtime', 'Wakeup time']
+        if dtypes is None:
+            dtypes = compact_types(file_copy.drop(columns=times + list(CATEGORIES), errors='ignore'))
+        dtypes = dict(dtypes, **{col: pd.CategoricalDtype(values) for col, values in CATEGORIES.items()})
+        file_copy = compact_dtypes(file_copy, {col: dtype for col, dtype in dtypes.items() if col not in times})
+
     return file_copy
 
 
@@ -44,8 +144,12 @@ def parse_times(df_sleep):
     Args:
         df_sleep (Pandas data frame): a data frame containing sleep statistics for test subjects
     Returns:
-        df_sleep (Pandas data frame): a newer version of the data frame with the parsed times
+        df_sleep (Pandas data frame): a newer version of the data frame with the parsed times; the data frame passed in
+                                      is left unchanged, so it can still be used as an argument of memoized functions
     """
+    # a shallow copy costs nothing until a column is replaced, and only the replaced columns are copied
+    df_sleep = df_sleep.copy(deep=False)
+
     # parse the bedtime columns to only include hours into the day (military time)
     df_sleep['Bedtime'] = df_sleep['Bedtime'].astype(str)
     df_sleep['Bedtime'] = df_sleep['Bedtime'].str.split().str[1]
@@ -56,9 +160,48 @@ def parse_times(df_sleep):
     df_sleep['Wakeup time'] = df_sleep['Wakeup time'].str.split().str[1]
     df_sleep['Wakeup time'] = df_sleep['Wakeup time'].str[:2].astype(float) + \
                               df_sleep['Wakeup time'].str[3:5].astype(float) / 60
+
+    # keep the parsed times as compact as the rest of a compacted data frame
+    if (df_sleep.dtypes == 'float32').any():
+        df_sleep[['Bedtime', 'Wakeup time']] = df_sleep[['Bedtime', 'Wakeup time']].astype('float32')
+
     return df_sleep
 
 
+def data_hash(df):
+    """ Compute a hash of a data frame's contents that changes whenever its values, index, columns or types do
+    Args:
+        df (Pandas data frame): the data frame to hash
+    Returns:
+        (str): the hash, as a hexadecimal string
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(col) for col in df.columns], [str(dtype) for dtype in df.dtypes]]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+
+    return digest.hexdigest()
+
+
+def model_fingerprint(focus_col, df, seed, **params):
+    """ Identify a model by everything that determines it, so that caches of the model and of results computed from it
+    can tell whether they are still valid
+    Args:
+        focus_col (str): the y-variable the model predicts
+        df (Pandas data frame or str): the data the model is trained (and evaluated) on, or its data_hash
+        seed (int): the seed the model is trained with
+        params: any other settings the model depends on (e.g. number of trees)
+    Returns:
+        (str): the fingerprint, as a hexadecimal string
+    """
+    # models trained by different scikit-learn versions can differ, even with the same seed; the version is read from
+    # the package's metadata, since importing scikit-learn itself takes about a second
+    description = {'target': focus_col, 'data': df if isinstance(df, str) else data_hash(df), 'seed': seed,
+                   'params': params, 'sklearn': importlib.metadata.version('scikit-learn')}
+
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+@memo.memoize
 def filt_vals(df, vals, col, lcols):
     """ Filter a dataframe by user-selected values
     Args:
@@ -80,6 +223,158 @@ def filt_vals(df, vals, col, lcols):
     return df_updated
 
 
+class FeatureEncoder:
+    """ Turns sleep records into the random forest regressors' feature matrix: the numeric columns as they are, then an
+    indicator column for every category of each categorical column except its first (as pd.get_dummies with
+    drop_first=True). The feature order is fixed when the encoder is fitted, and the fitted encoder is saved with each
+    regressor (see rf.forest_reg), so records are always encoded in the order the regressor was trained on """
+
+    def __init__(self, numeric=None, categories=None):
+        """ Create an encoder
+        Args:
+            numeric (list of str): the numeric features, in order; fit chooses them from the data if not given
+            categories (dict): maps each categorical column to its categories; defaults to CATEGORIES
+        """
+        self.numeric = list(numeric) if numeric is not None else None
+        self.categories = {col: list(values) for col, values in (categories or CATEGORIES).items()}
+
+        # each category's position, for encoding single records without pandas
+        self.codes = {col: {value: code for code, value in enumerate(values)}
+                      for col, values in self.categories.items()}
+
+    @property
+    def features(self):
+        """ The names of the features, in the order of the feature matrix's columns """
+        return self.numeric + ['{}_{}'.format(col, value) for col, values in self.categories.items()
+                               for value in values[1:]]
+
+    def fit(self, df):
+        """ Take the numeric features from a data frame's columns, in their order
+        Args:
+            df (Pandas data frame): the sleep data (records that are only scored have no sleep quality columns)
+        Returns:
+            self (FeatureEncoder): the fitted encoder
+        """
+        self.numeric = [col for col in df.columns if col not in NON_FEATURES and col not in self.categories]
+        return self
+
+    def _category_codes(self, values, col):
+        """ Look up the category codes of a column's values (-1 for values that aren't categories) """
+        if isinstance(values.dtype, pd.CategoricalDtype) and list(values.cat.categories) == self.categories[col]:
+            return values.cat.codes.to_numpy()
+        return pd.Categorical(values, categories=self.categories[col]).codes
+
+    def transform(self, df, dtype=float):
+        """ Encode the rows of a data frame
+        Args:
+            df (Pandas data frame): the sleep data; it needs every numeric feature and categorical column
+            dtype: type of the feature matrix (e.g. np.float32, which the random forest regressors train on)
+        Returns:
+            x (np.array): the feature matrix (C-ordered), with one row per record and one column per feature
+        """
+        x = np.empty((len(df), len(self.features)), dtype=dtype)
+        for i, col in enumerate(self.numeric):
+            x[:, i] = df[col].to_numpy()
+
+        i = len(self.numeric)
+        for col, values in self.categories.items():
+            codes = self._category_codes(df[col], col)
+            for code in range(1, len(values)):
+                x[:, i] = codes == code
+                i += 1
+
+        return x
+
+    def transform_records(self, records):
+        """ Encode records given as dicts, without building a data frame (e.g. a single user's inputs)
+        Args:
+            records (list of dicts): the records, keyed by the sleep data's column names
+        Returns:
+            x (np.array): the feature matrix, with one row per record and one column per feature
+        """
+        x = np.zeros((len(records), len(self.features)))
+        for row, record in enumerate(records):
+            x[row, :len(self.numeric)] = [record[col] for col in self.numeric]
+
+            i = len(self.numeric)
+            for col, values in self.categories.items():
+                code = self.codes[col].get(record[col], 0)
+                if code:
+                    x[row, i + code - 1] = 1
+                i += len(values) - 1
+
+        return x
+
+    def frame(self, df):
+        """ Replace a data frame's categorical columns with their indicator columns
+        Args:
+            df (Pandas data frame): the sleep data
+        Returns:
+            (Pandas data frame): the data frame, with the indicator columns (as booleans) after its other columns
+        """
+        indicators = {}
+        for col, values in self.categories.items():
+            codes = self._category_codes(df[col], col)
+            for code, value in enumerate(values[1:], start=1):
+                indicators['{}_{}'.format(col, value)] = codes == code
+
+        return df.drop(columns=list(self.categories)).assign(**indicators)
+
+
+@memo.memoize
+def encode_features(df, dtype='float32'):
+    """ Fit an encoder to a data frame and encode its rows, once per version of the data (see memo.py), so the models
+    of every target share one feature matrix
+    Args:
+        df (Pandas data frame): the sleep data
+        dtype (str): type of the feature matrix
+    Returns:
+        encoder (FeatureEncoder): the fitted encoder
+        x (np.array): the feature matrix; it is shared, so it is read-only
+    """
+    encoder = FeatureEncoder().fit(df)
+    x = encoder.transform(df, dtype)
+    x.flags.writeable = False
+
+    return encoder, x
+
+
+@memo.memoize
+def feature_matrix(df, x_feat_list, dtype='float32', order='C'):
+    """ Copy columns of a data frame into one contiguous matrix, once per version of the data (see memo.py), instead of
+    a mixed-type copy per model
+    Args:
+        df (Pandas data frame): the data, e.g. from get_x_feat
+        x_feat_list (list of str): the columns, in order
+        dtype (str): type of the matrix; float32 for random forest regressors (which train on float32), float64 for
+                     linear models
+        order (str): 'C' for row-major (what the random forest regressors use) or 'F' for column-major
+    Returns:
+        x (np.array): the matrix; it is shared, so it is read-only
+    """
+    x = np.empty((len(df), len(x_feat_list)), dtype=dtype, order=order)
+    for i, col in enumerate(x_feat_list):
+        x[:, i] = df[col].to_numpy()
+    x.flags.writeable = False
+
+    return x
+
+
+# encodes users' inputs for regressors saved before encoders were saved with them
+USER_ENCODER = FeatureEncoder(USER_FEATURES)
+
+
+def feature_encoder(random_forest_reg):
+    """ Get the encoder a regressor was trained with
+    Args:
+        random_forest_reg: a fitted regressor from rf.forest_reg
+    Returns:
+        (FeatureEncoder): the regressor's encoder, or USER_ENCODER for regressors saved without one
+    """
+    return getattr(random_forest_reg, 'feature_encoder_', None) or USER_ENCODER
+
+
+@memo.memoize
 def get_x_feat(df_sleep):
     """ Get desired x-features as a list - remove all other irrelevant; encode categorical variables and return new df
     Args:
@@ -88,19 +383,11 @@ def get_x_feat(df_sleep):
         df_sleep (pd.Dataframe): dataframe with categorical data encoded
         x_feat_list (list of str): list of desired x-variables
     """
-    # Establish the features not used by the random forest regressor
-    unwanted_feats = ['ID', 'Sleep efficiency', 'REM sleep percentage', 'Deep sleep percentage',
-                      'Light sleep percentage']
-
-    # we can represent binary categorical variables in single indicator tags via one-hot encoding
-    df_sleep = pd.get_dummies(data=df_sleep, columns=['Gender', 'Smoking status'], drop_first=True)
+    # the x features for the regressor are the quantitative columns and an indicator of each binary categorical
+    # variable (records that are only scored have no sleep quality columns)
+    encoder = FeatureEncoder().fit(df_sleep)
 
-    # the x features for the regressor should be quantitative
-    x_feat_list = list(df_sleep.columns)
-    for feat in unwanted_feats:
-        x_feat_list.remove(feat)
-
-    return df_sleep, x_feat_list
+    return encoder.frame(df_sleep), encoder.features
 
 
 def convert(gender, smoke):
@@ -112,23 +399,64 @@ def convert(gender, smoke):
         gender_value (int): encoded variable representing the biological gender of the user
         smoke_value (int): encoded variable representing whether the user smokes
     """
-    # encode the passed-in variable indicating a user's biological gender
-    if gender == 'Biological Male':
-        gender_value = 1
-    else:
-        gender_value = 0
+    record = user_record(0, 0, 0, 0, 0, 0, 0, gender, smoke)
+    gender_value, smoke_value = USER_ENCODER.transform_records([record])[0, -2:]
+
+    return int(gender_value), int(smoke_value)
 
-    # encode the passed-in variable indicating a user's smoking status
-    if smoke == 'Yes':
-        smoke_value = 1
+
+def user_record(age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke):
+    """ Turn information about a user into a record keyed by the sleep data's column names
+    Args:
+        age (int): the age of the user
+        bedtime (float): user's bedtime based on hours into the day (military time)
+        wakeuptime (float): user's wakeup time based on hours into the day (military time)
+        awakenings (int): number of awakenings a user has on a given night
+        caffeine (int): amount of caffeine a user consumes in the 24 hours prior to their bedtime (in mg)
+        alcohol (int): amount of alcohol a user consumes in the 24 hours prior to their bedtime (in oz)
+        exercise (int): how many times the user exercises in a week
+        gender (str): biological gender of the user
+        smoke (str): whether the user smokes
+    Returns:
+        (dict): the user's record
+    """
+    # calculate the sleep duration of a user based on their inputted bedtime and wakeup time
+    if wakeuptime < bedtime:
+        duration = wakeuptime + 24 - bedtime
     else:
-        smoke_value = 0
+        duration = wakeuptime - bedtime
+
+    return {'Age': age, 'Bedtime': bedtime, 'Wakeup time': wakeuptime, 'Sleep duration': duration,
+            'Awakenings': awakenings, 'Caffeine consumption 24 hrs before sleeping (mg)': caffeine,
+            'Alcohol consumption 24 hrs before sleeping (oz)': alcohol,
+            'Exercise frequency (in days per week)': exercise,
+            'Gender': USER_LABELS['Gender'].get(gender, gender), 'Smoking status': smoke}
+
+
+def user_features(age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke,
+                  encoder=USER_ENCODER):
+    """ Arrange information about a user in the order of the random forest regressors' features (see get_x_feat)
+    Args:
+        age (int): the age of the user
+        bedtime (float): user's bedtime based on hours into the day (military time)
+        wakeuptime (float): user's wakeup time based on hours into the day (military time)
+        awakenings (int): number of awakenings a user has on a given night
+        caffeine (int): amount of caffeine a user consumes in the 24 hours prior to their bedtime (in mg)
+        alcohol (int): amount of alcohol a user consumes in the 24 hours prior to their bedtime (in oz)
+        exercise (int): how many times the user exercises in a week
+        gender (str): biological gender of the user
+        smoke (str): whether the user smokes
+        encoder (FeatureEncoder): the encoder of the regressor the features are for (see feature_encoder)
+    Returns:
+        (list): the user's feature values
+    """
+    record = user_record(age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke)
 
-    return gender_value, smoke_value
+    return encoder.transform_records([record])[0].tolist()
 
 
 def predict_sleep_quality(sleep_quality_stat, df_sleep, age, bedtime, wakeuptime, awakenings, caffeine, alcohol,
-                          exercise, gender, smoke):
+                          exercise, gender, smoke, random_forest_reg=None, forest_params=None):
     """ Allow users to get their predicted sleep quality given information about them
     Args:
         sleep_quality_stat (str): the sleep statistic to be predicted for the user
@@ -142,25 +470,20 @@ def predict_sleep_quality(sleep_quality_stat, df_sleep, age, bedtime, wakeuptime
         exercise (int): how many times the user exercises in a week
         gender (str): biological gender of the user
         smoke (str): whether the user smokes
+        random_forest_reg: an already fitted regressor for sleep_quality_stat; one is trained on df_sleep if not passed
+        forest_params (dict): training settings passed to rf.forest_reg (e.g. n_jobs, n_estimators, max_samples) when a
+                              regressor is trained
     Returns:
         y_pred (float): predicted sleep efficiency/REM sleep percentage/deep sleep percentage
     """
     # Builds the random forest regressor model that predicts a user's sleep efficiency, REM sleep percentage, or deep
     # sleep percentage
-    random_forest_reg = rf.forest_reg(sleep_quality_stat, df_sleep)
-
-    # Encode the passed-in values for gender and smoking status to match the encoding of the random forest regressor
-    gender_value, smoke_value = convert(gender, smoke)
-
-    # calculate the sleep duration of a user based on their inputted bedtime and wakeup time
-    if wakeuptime < bedtime:
-        duration = wakeuptime + 24 - bedtime
-    else:
-        duration = wakeuptime - bedtime
+    if random_forest_reg is None:
+        random_forest_reg = rf.forest_reg(sleep_quality_stat, df_sleep, **(forest_params or {}))
 
-    # store information about the user into a numpy array
-    data = np.array([[age, bedtime, wakeuptime, duration, awakenings, caffeine, alcohol, exercise,
-                      gender_value, smoke_value]])
+    # encode information about the user in the order of the regressor's features
+    record = user_record(age, bedtime, wakeuptime, awakenings, caffeine, alcohol, exercise, gender, smoke)
+    data = feature_encoder(random_forest_reg).transform_records([record])
 
     # predict sleep efficiency, REM sleep percentage, or deep sleep percentage based on user inputs from the dropdowns
     # and sliders
@@ -169,6 +492,7 @@ def predict_sleep_quality(sleep_quality_stat, df_sleep, age, bedtime, wakeuptime
     return y_pred
 
 
+@memo.memoize
 def encode(var1, var2, df_sleep):
     """ Encodes quantitative binary variables as qualitative variables via one-hot encoding
 